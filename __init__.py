@@ -19,6 +19,10 @@
 
 
 def classFactory(iface):
+    # qgis_process loads the plugin without an interface, only for its Processing provider
+    if iface is None:
+        from .processingProvider import ProcessingPlugin
+        return ProcessingPlugin()
     from .onthefly_shortest_path import OnTheFlyShortestPath
     return OnTheFlyShortestPath(iface)
     
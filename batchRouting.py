@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    batchRouting.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import array
+import heapq
+import math
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+
+'''
+Routing of large batches on several processes. The graph is written once, in compressed sparse row (CSR) form, 
+to a temporary file which every worker maps read-only, so that the graph is not copied to the workers. 
+The searches are sent to the pool in chunks and the results come back chunk by chunk, as soon as they are ready.
+The module does not depend on QGIS, because the workers are plain python processes. As in pathAlgorithms,
+the index of an arc is the index of the edge in the QgsGraph.
+'''
+
+class CsrGraph:
+    ''' The arcs of a graph grouped by their from vertex, in arrays that can be mapped from a file without copying them '''
+
+    # The file starts with the number of vertices and the number of arcs, followed by the arrays
+    # offsets (numVertices + 1), toVertices (numArcs), arcIds (numArcs) and costs (numArcs), all of 8 bytes per item
+    headerItems = 2
+    itemSize = 8
+
+    def __init__(self, numVertices:int, offsets, toVertices, arcIds, costs, buffer = None):
+        self.numVertices = numVertices
+        # The arcs leaving vertex v are the items offsets[v] to offsets[v + 1] - 1 of the other arrays
+        self.offsets = offsets
+        self.toVertices = toVertices
+        self.arcIds = arcIds
+        self.costs = costs
+        # The mmap of the arrays, if the graph has been mapped from a file
+        self.buffer = buffer
+        return
+
+
+    @classmethod
+    def fromArcs(cls, numVertices:int, arcs:list):
+        ''' Creates the graph from a list of (from vertex, to vertex, cost), where the index of the list is the arc id '''
+        counts = [0] * (numVertices + 1)
+        for (fromVertex, toVertex, cost) in arcs:
+            counts[fromVertex + 1] += 1
+        for v in range(numVertices):
+            counts[v + 1] += counts[v]
+        offsets = array.array('q', counts)
+
+        position = counts[:numVertices]
+        toVertices = array.array('q', bytes(cls.itemSize * len(arcs)))
+        arcIds = array.array('q', bytes(cls.itemSize * len(arcs)))
+        costs = array.array('d', bytes(cls.itemSize * len(arcs)))
+        for i, (fromVertex, toVertex, cost) in enumerate(arcs):
+            k = position[fromVertex]
+            position[fromVertex] += 1
+            toVertices[k] = toVertex
+            arcIds[k] = i
+            costs[k] = cost
+        return cls(numVertices, offsets, toVertices, arcIds, costs)
+
+
+    def save(self, fileName:str) -> None:
+        with open(fileName, "wb") as f:
+            array.array('q', [self.numVertices, len(self.toVertices)]).tofile(f)
+            self.offsets.tofile(f)
+            self.toVertices.tofile(f)
+            self.arcIds.tofile(f)
+            self.costs.tofile(f)
+        return
+
+
+    @classmethod
+    def mapFile(cls, fileName:str):
+        ''' Maps the arrays of a file written by save(). The arrays are views of the mapped file '''
+        with open(fileName, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        view = memoryview(buffer)
+        (numVertices, numArcs) = view[0 : cls.headerItems * cls.itemSize].cast('q')
+        sizes = [numVertices + 1, numArcs, numArcs, numArcs]
+        arrays = []
+        start = cls.headerItems * cls.itemSize
+        for size, typecode in zip(sizes, ['q', 'q', 'q', 'd']):
+            end = start + size * cls.itemSize
+            arrays.append(view[start:end].cast(typecode))
+            start = end
+        return cls(numVertices, *arrays, buffer = buffer)
+
+
+    def route(self, source:int, targets:list, withPaths:bool = False) -> list:
+        '''
+        Returns a list of (target, cost, path) of the shortest paths from the source to the targets, where the cost is math.inf 
+        if there is no path and the path is the list of the arc ids, or None if not requested. The search of dijkstra stops 
+        when all the targets have been reached
+        '''
+        offsets = self.offsets
+        toVertices = self.toVertices
+        costs = self.costs
+        # Only the reached vertices are stored, so that a search costs nothing for the rest of the graph
+        distance = {source: 0.0}
+        predecessor = {source: -1}
+        settled = set()
+        remaining = set(targets)
+        heap = [(0.0, source)]
+        while len(heap) > 0 and len(remaining) > 0:
+            (cost, vertex) = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            settled.add(vertex)
+            remaining.discard(vertex)
+            for k in range(offsets[vertex], offsets[vertex + 1]):
+                toVertex = toVertices[k]
+                newCost = cost + costs[k]
+                if newCost < distance.get(toVertex, math.inf):
+                    distance[toVertex] = newCost
+                    predecessor[toVertex] = k
+                    heapq.heappush(heap, (newCost, toVertex))
+
+        results = []
+        for target in targets:
+            if target not in settled:
+                results.append((target, math.inf, None))
+                continue
+            path = None
+            if withPaths:
+                path = []
+                vertex = target
+                while vertex != source:
+                    k = predecessor[vertex]
+                    path.append(self.arcIds[k])
+                    # The from vertex of the item k is the vertex whose range of items contains k
+                    vertex = self.fromVertex(k)
+                path.reverse()
+            results.append((target, distance[target], path))
+        return results
+
+
+    def fromVertex(self, k:int) -> int:
+        ''' Returns the from vertex of the arc at item k, by a binary search of the offsets '''
+        low = 0
+        high = self.numVertices - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.offsets[middle] <= k:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+
+
+# The graph mapped by the worker process
+workerGraph = None
+
+def initWorker(fileName:str) -> None:
+    global workerGraph
+    workerGraph = CsrGraph.mapFile(fileName)
+    return
+
+
+def routeChunk(chunk:list) -> list:
+    ''' Runs in a worker. Returns, for each (task id, source, targets, withPaths) of the chunk, (task id, results of CsrGraph.route()) '''
+    return [(taskId, workerGraph.route(source, targets, withPaths)) for (taskId, source, targets, withPaths) in chunk]
+
+
+
+class BatchRouter:
+    ''' Publishes a graph to a pool of processes and routes batches of searches on it '''
+
+    def __init__(self, numVertices:int, arcs:list, processes:int = 0, chunkSize:int = 64):
+        ''' The arcs are (from vertex, to vertex, cost). By default, a process is started per CPU '''
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.chunkSize = chunkSize
+        (handle, self.fileName) = tempfile.mkstemp(prefix = "otfsp_graph_", suffix = ".csr")
+        os.close(handle)
+        CsrGraph.fromArcs(numVertices, arcs).save(self.fileName)
+        self.pool = None
+        return
+
+
+    @staticmethod
+    def pythonExecutable() -> str:
+        ''' 
+        Returns the python interpreter of the workers. Inside QGIS, sys.executable is the QGIS application,
+        which must not be started as a worker 
+        '''
+        if os.path.basename(sys.executable).lower().startswith("python"):
+            return sys.executable
+        for name in ["python3.exe", "python.exe", os.path.join("bin", "python3"), os.path.join("bin", "python")]:
+            path = os.path.join(sys.exec_prefix, name)
+            if os.path.isfile(path):
+                return path
+        return sys.executable
+
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        context.set_executable(self.pythonExecutable())
+        self.pool = context.Pool(self.processes, initializer = initWorker, initargs = (self.fileName,))
+        return
+
+
+    def run(self, tasks:list, withPaths:bool = False, isCanceled = None):
+        '''
+        Generator of the results of the tasks, given as (source, targets), in chunks of (task index, results of CsrGraph.route()). 
+        The chunks come in the order they are finished. If the function isCanceled returns True, the pool is stopped
+        '''
+        if self.pool is None:
+            self.start()
+        chunks = []
+        for start in range(0, len(tasks), self.chunkSize):
+            chunks.append([(start + i, source, targets, withPaths) for i, (source, targets) in enumerate(tasks[start : start + self.chunkSize])])
+        for chunkResults in self.pool.imap_unordered(routeChunk, chunks):
+            if isCanceled is not None and isCanceled():
+                self.pool.terminate()
+                self.pool = None
+                return
+            yield chunkResults
+        return
+
+
+    def close(self) -> None:
+        ''' Stops the workers and deletes the file of the graph '''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        try:
+            os.remove(self.fileName)
+        except:
+            pass
+        return
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    benchmark.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from qgis.core import ( Qgis,
+                        QgsApplication,
+                        QgsCoordinateReferenceSystem,
+                        QgsFeatureRequest,
+                        QgsPointXY,
+                        QgsProject,
+                        QgsRectangle,
+                        QgsVectorLayer
+                      )
+
+from .networkGraph import NetworkGraph
+from .networkStrategies import FeatureSources
+from .pluginSettings import PluginSettings
+from .processingAlgorithms import RoutingAlgorithm
+from .routingEngine import RoutingEngine
+from .stageTimer import StageTimer
+from .syntheticNetwork import SyntheticNetwork
+
+'''
+A benchmark of the routing pipeline without the QGIS interface: the merge of the layers, the bridges, the build of the graph
+and the route between two waypoints, timed by stage with the peak memory of the process. It runs on the layers of the example 
+folder and on synthetic grids, trees and FTTH-like stars, in the modes of the analysis layer of the plugin: 
+    single    the line layer is the analysis layer
+    merge     the line layers are merged into a memory layer
+    bridging  as merge, with the bridges of a point layer
+    extent    as merge, limited to twice the extent of the waypoints
+Each case runs several times and the median time of each stage is reported, so that regressions show up between versions.
+Optionally, the searches of the Processing algorithms are timed in the QGIS process and on the pool of processes, 
+to measure the size of the batch above which the pool is faster (RoutingAlgorithm.poolMinimumWork).
+The synthetic networks are merged from overlapping layers and bridged across near-miss gaps, and the length of their route 
+is checked against the reference length of SyntheticNetwork, so that a faster engine is also checked to give the same routes.
+Run with the Python of QGIS, from the folder that contains the folder of the plugin, e.g.
+    python -m OnTheFlyShortestPath.benchmark --sizes 1000,10000,100000 --repeat 3 --json benchmark.json
+'''
+
+class Benchmark:
+
+    modes = ["single", "merge", "bridging", "extent"]
+    topologies = ["grid", "tree", "star"]
+    exampleFolder = os.path.join(os.path.dirname(__file__), "example")
+    # Same as the "2x markers extent" limit of the plugin
+    extentScale = 2
+    # Every bridgePointStep-th line of the second layer of the examples has a bridge point at its start
+    bridgePointStep = 100
+    # The fraction of the lines of a synthetic network that are also in the second layer, and that start at a gap
+    overlap = 0.1
+    gapFraction = 0.01
+    # The relative difference from the reference length that is accepted, for the different order of the sums of the edges
+    referenceTolerance = 1e-9
+
+    def __init__(self, config:dict, repeat:int = 3, trackMemory:bool = True):
+        self.config = config
+        self.repeat = repeat
+        self.trackMemory = trackMemory
+        # One item per case, as returned by run()
+        self.results = []
+        # One item per case of runBatchRouting()
+        self.batchResults = []
+        return
+
+
+    def extent(self, points:list) -> QgsRectangle:
+        ''' Same as setExtentScale() of the plugin: the extent of the points, grown by extentScale times its size '''
+        rect = QgsRectangle(points[0], points[0])
+        for p in points[1:]:
+            rect.combineExtentWith(p)
+        rect.grow(max(rect.width(), rect.height()) / 2 * self.extentScale)
+        return rect
+
+
+    def run(self, name:str, layers:list, points:list, mode:str, bridgeLayer:QgsVectorLayer = None, bridgeTolerance:float = 0, 
+            referenceCost:float = None) -> dict:
+        ''' 
+        Runs the pipeline repeat times on the line layers, which are in the same CRS, and returns the summary of the case, 
+        with the median time of each stage in seconds and the peak memory of the process in bytes. If the reference length 
+        of the route is given, in meters, the summary tells if the route matches it 
+        '''
+        crs = layers[0].crs()
+        timers = []
+        # The total time of each run, up to the end of the calculation
+        totals = []
+        results = None
+        for r in range(self.repeat):
+            timer = StageTimer(self.trackMemory)
+            engine = RoutingEngine(self.config, True, timer)
+            if mode == "single":
+                pathLayer = layers[0]
+                featureSources = None
+            else:
+                requests = [QgsFeatureRequest().setNoAttributes() for layer in layers]
+                if mode == "extent":
+                    rect = self.extent(points)
+                    for request in requests:
+                        request.setFilterRect(rect)
+                sourceIds = {}
+                # Same layer bridging, since the gaps may be between the lines of a layer
+                pathLayer = engine.mergeLayers(crs, layers, requests, QgsProject.instance().transformContext(), False, sourceIds)
+                if pathLayer is None:
+                    return None
+                featureSources = FeatureSources(layers, sourceIds)
+                if mode == "bridging":
+                    engine.createBridges(pathLayer, [None, bridgeLayer], bridgeTolerance, bridgeTolerance, False)
+
+            networkGraph = engine.buildGraph(pathLayer, crs, 0, featureSources)
+            results = engine.calculate(networkGraph, points)
+            totals.append(timer.elapsed())
+            timer.setCount("features", pathLayer.featureCount())
+            timer.setCount("vertices", networkGraph.graph.vertexCount())
+            timer.setCount("edges", networkGraph.graph.edgeCount())
+            timers.append(timer)
+
+        stages = {}
+        for timer in timers:
+            for stageName, (seconds, runs, peak) in timer.stages.items():
+                stages.setdefault(stageName, []).append(seconds)
+        peaks = [peak for timer in timers for (seconds, runs, peak) in timer.stages.values() if peak is not None]
+        d = {
+            "name": name,
+            "mode": mode,
+            "stages": {stageName: statistics.median(times) for stageName, times in stages.items()},
+            "totalSeconds": statistics.median(totals),
+            "peakMemory": max(peaks) if len(peaks) > 0 else None,
+            "counts": timers[-1].counts,
+            # The length of the route on the graph in meters, to compare the results between versions
+            "costOnGraph": results["costOnGraphMeters"] if results is not None else None,
+            "referenceCost": referenceCost,
+            "matchesReference": None,
+        }
+        if referenceCost is not None:
+            d["matchesReference"] = d["costOnGraph"] is not None and abs(d["costOnGraph"] - referenceCost) <= self.referenceTolerance * max(1.0, referenceCost)
+        self.results.append(d)
+        return d
+
+
+    def runLayers(self, name:str, layers:list, points:list, modes:list, bridgeLayer:QgsVectorLayer, bridgeTolerance:float) -> None:
+        ''' Runs the modes that apply to the layers. The single mode uses the first layer, the rest of the modes need two layers '''
+        for mode in modes:
+            if mode == "single":
+                self.report(self.run(name, layers[:1], points, mode))
+            elif len(layers) > 1:
+                self.report(self.run(name, layers, points, mode, bridgeLayer, bridgeTolerance))
+        return
+
+
+    def runExamples(self, modes:list) -> None:
+        ''' Runs the layers of the example folder. The line network is the single layer, the roads are merged and bridged '''
+        lineNetwork = QgsVectorLayer(os.path.join(self.exampleFolder, "line_network.shp"), "line_network", "ogr")
+        roads = [QgsVectorLayer(os.path.join(self.exampleFolder, fileName + ".shp"), fileName, "ogr") for fileName in ["primary_roads", "secondary_roads"]]
+        if not lineNetwork.isValid() or not all(layer.isValid() for layer in roads):
+            print("The layers of the example folder cannot be read")
+            return
+        if "single" in modes:
+            self.report(self.run("line_network", [lineNetwork], self.layerEnds([lineNetwork]), "single"))
+
+        bridgePoints = []
+        for i, feature in enumerate(roads[1].getFeatures(QgsFeatureRequest().setNoAttributes())):
+            if i % self.bridgePointStep == 0 and not feature.geometry().isEmpty():
+                vertex = next(feature.geometry().vertices())
+                bridgePoints.append((vertex.x(), vertex.y()))
+        bridgeLayer = SyntheticNetwork(roads[0].crs()).pointLayer("bridgePoints", bridgePoints)
+        # The example layers are in degrees. About 50 meters
+        self.runLayers("roads", roads, self.layerEnds(roads), [mode for mode in modes if mode != "single"], bridgeLayer, 0.0005)
+        return
+
+
+    def runSynthetic(self, network:SyntheticNetwork, topologies:list, sizes:list, modes:list) -> None:
+        ''' 
+        Runs the synthetic networks. The modes of two layers merge overlapping layers, and the bridging mode also opens gaps in the lines
+        and bridges them. The route of every mode but the extent, which may cut the network, is checked against the reference length
+        '''
+        for topology in topologies:
+            for size in sizes:
+                lines = getattr(network, topology)(size)
+                (source, target) = (lines[0][0], lines[-1][1])
+                points = [QgsPointXY(*source), QgsPointXY(*target)]
+                referenceCost = network.referenceLengths(lines, source, [target])[0]
+                name = "{}_{}".format(topology, len(lines))
+                if "single" in modes:
+                    self.report(self.run(name, [network.lineLayer(topology, lines)], points, "single", referenceCost = referenceCost))
+
+                if "merge" in modes or "extent" in modes:
+                    layers = [network.lineLayer(topology + "_" + str(i), layerLines) for i, layerLines in enumerate(network.overlappingLayers(lines, self.overlap))]
+                    if "merge" in modes:
+                        self.report(self.run(name, layers, points, "merge", referenceCost = referenceCost))
+                    if "extent" in modes:
+                        self.report(self.run(name, layers, points, "extent"))
+
+                if "bridging" in modes:
+                    # The gap is a fraction of the length of a segment, in units of the CRS
+                    gap = math.hypot(lines[0][1][0] - lines[0][0][0], lines[0][1][1] - lines[0][0][1]) / 100
+                    (gapLines, bridgePoints, bridgeLines) = network.withGaps(lines, self.gapFraction, gap)
+                    layers = [network.lineLayer(topology + "_" + str(i), layerLines) for i, layerLines in enumerate(network.overlappingLayers(gapLines, self.overlap))]
+                    bridgeLayer = network.pointLayer("bridgePoints", bridgePoints)
+                    referenceCost = network.referenceLengths(gapLines + bridgeLines, source, [target])[0]
+                    self.report(self.run(name, layers, points, "bridging", bridgeLayer, 2 * gap, referenceCost))
+        return
+
+
+    def runBatchRouting(self, network:SyntheticNetwork, sizes:list, numSearches:int, processes:int) -> None:
+        ''' 
+        Times a batch of searches between random vertices of synthetic grids, with dijkstra of QGIS in this process and on a pool
+        of processes, including the start of the pool, as the Processing algorithms run them 
+        '''
+        for size in sizes:
+            lines = network.grid(size)
+            layer = network.lineLayer("grid", lines)
+            graph = NetworkGraph(layer, layer.crs()).graph
+            rng = random.Random(size)
+            tasks = [(rng.randrange(graph.vertexCount()), [rng.randrange(graph.vertexCount())]) for i in range(numSearches)]
+            searches = [("serialSeconds", lambda: RoutingAlgorithm.serialShortestPaths(graph, tasks, False)),
+                        ("poolSeconds", lambda: RoutingAlgorithm.poolShortestPaths(graph, tasks, False, processes))]
+            d = {
+                "name": "grid_{}".format(len(lines)),
+                "edges": graph.edgeCount(),
+                "searches": numSearches,
+                "processes": processes,
+                # Compare with RoutingAlgorithm.poolMinimumWork
+                "work": numSearches * graph.edgeCount(),
+            }
+            for key, search in searches:
+                times = []
+                for r in range(self.repeat):
+                    start = time.perf_counter()
+                    for chunk in search():
+                        pass
+                    times.append(time.perf_counter() - start)
+                d[key] = statistics.median(times)
+            self.batchResults.append(d)
+            print("{} (batch of {} searches, {} processes): work {}, serial {:.1f} ms, pool {:.1f} ms".format(d["name"], numSearches, processes, d["work"], 
+                                                                                                               d["serialSeconds"] * 1000, d["poolSeconds"] * 1000))
+            sys.stdout.flush()
+        return
+
+
+    def layerEnds(self, layers:list) -> list:
+        ''' Returns the first vertex of the first feature of the first layer and the last vertex of the last feature of the last layer '''
+        first = next(layers[0].getFeatures(QgsFeatureRequest().setNoAttributes())).geometry()
+        last = None
+        for feature in layers[-1].getFeatures(QgsFeatureRequest().setNoAttributes()):
+            last = feature.geometry()
+        return [QgsPointXY(next(first.vertices())), QgsPointXY(list(last.vertices())[-1])]
+
+
+    def report(self, d:dict) -> None:
+        if d is None:
+            return
+        print("{} ({}): {} features, {} vertices, {} edges".format(d["name"], d["mode"], d["counts"].get("features"), d["counts"].get("vertices"), d["counts"].get("edges")))
+        for stageName, seconds in d["stages"].items():
+            print("    {:<20} {:>10.1f} ms".format(stageName, seconds * 1000))
+        print("    {:<20} {:>10.1f} ms".format("Total", d["totalSeconds"] * 1000))
+        if d["peakMemory"] is not None:
+            print("    {:<20} {:>10.1f} MB".format("Peak memory", d["peakMemory"] / 1048576))
+        if d["matchesReference"] is not None:
+            print("    {:<20} {:>10}".format("Reference length", "ok" if d["matchesReference"] else "MISMATCH {} m, expected {} m".format(d["costOnGraph"], d["referenceCost"])))
+        sys.stdout.flush()
+        return
+
+
+    def toJson(self) -> str:
+        return json.dumps({
+            "qgisVersion": Qgis.version(),
+            "pythonVersion": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": self.repeat,
+            "results": self.results,
+            "batchRouting": self.batchResults,
+        }, indent = 2)
+
+
+
+def main(argv:list = None) -> int:
+    parser = argparse.ArgumentParser(description = "Benchmark of the routing of the On-the-Fly Shortest Path plugin")
+    parser.add_argument("--sizes", default = "1000,10000,100000", help = "Comma separated numbers of segments of the synthetic networks, e.g. 1000,10000,100000,1000000,5000000")
+    parser.add_argument("--topologies", default = ",".join(Benchmark.topologies), help = "Comma separated synthetic topologies")
+    parser.add_argument("--modes", default = ",".join(Benchmark.modes), help = "Comma separated modes of the analysis layer")
+    parser.add_argument("--repeat", type = int, default = 3, help = "Runs of each case. The median time is reported")
+    parser.add_argument("--crs", default = "EPSG:3857", help = "CRS of the synthetic networks")
+    parser.add_argument("--layout-crs", default = "", help = "CRS in which the synthetic networks are laid out, before they are transformed to --crs")
+    parser.add_argument("--spacing", type = float, default = 100, help = "Length of the segments of the synthetic networks, in units of the layout CRS")
+    parser.add_argument("--no-examples", action = "store_true", help = "Skip the layers of the example folder")
+    parser.add_argument("--batch-searches", type = int, default = 0, help = "Searches of the batch routing comparison on the synthetic grids. 0 to skip it")
+    parser.add_argument("--processes", type = int, default = 4, help = "Processes of the pool of the batch routing comparison")
+    parser.add_argument("--json", default = "", help = "File to write the results as JSON")
+    args = parser.parse_args(argv)
+
+    app = None
+    if QgsApplication.instance() is None:
+        app = QgsApplication([], False)
+        app.initQgis()
+
+    # The factory defaults of the plugin: the distance of the route, without fiber loss attributes
+    config = PluginSettings.factoryDefaultSettings.copy()
+
+    modes = [mode for mode in args.modes.split(",") if mode in Benchmark.modes]
+    benchmark = Benchmark(config, max(1, args.repeat))
+    if not args.no_examples:
+        benchmark.runExamples(modes)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip() != ""]
+    topologies = [topology for topology in args.topologies.split(",") if topology in Benchmark.topologies]
+    layoutCrs = QgsCoordinateReferenceSystem(args.layout_crs) if args.layout_crs != "" else None
+    network = SyntheticNetwork(QgsCoordinateReferenceSystem(args.crs), args.spacing, sourceCrs = layoutCrs)
+    benchmark.runSynthetic(network, topologies, sizes, modes)
+    if args.batch_searches > 0:
+        benchmark.runBatchRouting(network, sizes, args.batch_searches, max(2, args.processes))
+
+    if args.json != "":
+        with open(args.json, "w") as f:
+            f.write(benchmark.toJson())
+
+    if app is not None:
+        app.exitQgis()
+    # A route that does not match its reference length fails the run
+    return 0 if all(d["matchesReference"] is not False for d in benchmark.results) else 1
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
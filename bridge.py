@@ -21,7 +21,7 @@ __date__ = 'March 2024'
 __copyright__ = '(C) 2024, Ilias Iliopoulos'
 
 
-from qgis.core import QgsPointXY, QgsProject, QgsVectorLayer, QgsCoordinateTransform, QgsFeature, QgsFeatureRequest, QgsGeometry, QgsSpatialIndex , QgsCoordinateReferenceSystem, QgsUnitTypes
+from qgis.core import Qgis, QgsPointXY,QgsProject, QgsVectorLayer, QgsCoordinateTransform, QgsFeature, QgsFeatureRequest, QgsGeometry, QgsSpatialIndex , QgsCoordinateReferenceSystem, QgsUnitTypes
 # import math for debugging to show distances instead of squared distances. Comment at production
 #import math
 
@@ -109,7 +109,9 @@ class BridgeLayer:
                 try:
                     tr = QgsCoordinateTransform(sourceCrs, targetCrs, QgsProject.instance().transformContext())
                 except:
-                    self.iface.messageBar().pushMessage("Error", "Coordinate transformation of bridge point layer failed. Skipping layer.", level=Qgis.Critical, duration=10)
+                    # Without the interface, e.g. in the routing engine, the layer is skipped silently
+                    if self.iface is not None:
+                        self.iface.messageBar().pushMessage("Error", "Coordinate transformation of bridge point layer failed. Skipping layer.", level=Qgis.Critical, duration=10)
                     continue
     
             for feature in pointLayer.getFeatures(QgsFeatureRequest().setNoAttributes()):
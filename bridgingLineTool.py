@@ -105,10 +105,9 @@ class BridgingLineTool(MapToolSnapToLayers):
             return  -1  
 
         
-    def canvasMoveEvent(self, event):       
+    def snappedMoveEvent(self, pos):       
 
-        super().canvasMoveEvent(event)
-        mousePoint = self.toMapCoordinates(event.pos())
+        mousePoint = self.toMapCoordinates(pos)
         
         #snapping functionality for the dynamic movement of the mouse
         p = self.conditionalOffsetToSnappedPoint(mousePoint) 
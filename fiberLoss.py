@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    fiberLoss.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+'''
+The fiber loss budget of a route. The lengths of the route are given in meters and the loss parameters 
+in db, db per splice and db/Km, with the keys of the configuration of the plugin, so that the budget 
+can be calculated with or without the plugin interface.
+'''
+
+class FiberLoss:
+
+    def __init__(self, config:dict, addFixedLoss:bool = True):
+        ''' The config must have the keys connectorLoss, numberOfConnectorsAtEntry, numberOfConnectorsAtExit, spliceLoss, spliceFrequency, cableLoss and fixedLoss '''
+        self.config = config
+        self.addFixedLoss = addFixedLoss
+        return
+
+
+    def spliceLoss(self, length:float) -> float:
+        ''' Returns the splice loss of a length of fiber cable (in meters), estimated from the splice frequency '''      
+        if self.config["spliceFrequency"] == 0:
+            return 0
+        return length / 1000.0 / self.config["spliceFrequency"] * self.config["spliceLoss"]
+
+
+    def calculate(self, d:dict, spliceFlagsInLoss:bool = False) -> None:
+        ''' 
+        Adds the fiber loss to a results dictionary with the lengths entryCostMeters, costOnGraphMeters and exitCostMeters.
+        The optional cableLossOnGraph is the loss of the traversed features, which replaces the loss per Km on the graph, and
+        the optional spliceCount replaces the splice estimate. When spliceFlagsInLoss is set, the splices flagged on the features 
+        are already in cableLossOnGraph, so the splices are not estimated either
+        '''
+        conf = self.config
+        conectorLossAtEntry = conf["connectorLoss"] * conf["numberOfConnectorsAtEntry"]
+        conectorLossAtExit = conf["connectorLoss"] * conf["numberOfConnectorsAtExit"]
+             
+        d["fiberLossEntry"] = conectorLossAtEntry \
+                              + self.spliceLoss(d["entryCostMeters"]) \
+                              + d["entryCostMeters"] / 1000.0 * conf["cableLoss"] 
+        
+        d["fiberLossExit"] = conectorLossAtExit \
+                             + self.spliceLoss(d["exitCostMeters"]) \
+                             + d["exitCostMeters"] / 1000.0 * conf["cableLoss"] 
+                                                        
+        if d.get("cableLossOnGraph") is None:
+            d["fiberLossOnGraph"] = d["costOnGraphMeters"] / 1000.0 * conf["cableLoss"]
+        else:
+            # The attenuation of each traversed feature and the splices flagged on the features, summed on the edges of the route
+            d["fiberLossOnGraph"] = d["cableLossOnGraph"]
+            
+        if d.get("spliceCount") is not None:
+            # The splices counted at the changes of feature along the path
+            d["fiberLossOnGraph"] += d["spliceCount"] * conf["spliceLoss"]
+        elif d.get("cableLossOnGraph") is None or not spliceFlagsInLoss:
+            d["fiberLossOnGraph"] += self.spliceLoss(d["costOnGraphMeters"]) 
+        
+        if self.addFixedLoss:
+            d["fiberLossOnGraph"] += conf["fixedLoss"]
+               
+        d["fiberTotalLoss"] = d["fiberLossEntry"] + d["fiberLossOnGraph"] + d["fiberLossExit"]
+        d["fiberLossUnits"] = "db"        
+        return
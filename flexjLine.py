@@ -26,15 +26,17 @@ __copyright__ = '(C) 2024, Ilias Iliopoulos'
 from qgis.gui import QgsVertexMarker, QgsRubberBand
 
 try:
-    from qgis.core import QgsPointXY, QgsDistanceArea, QgsGeometryUtils, QgsProject, QgsPoint, QgsUnitTypes, QgsAnnotationPointTextItem
+    from qgis.core import Qgis, QgsPointXY, QgsDistanceArea, QgsGeometryUtils, QgsProject, QgsPoint, QgsUnitTypes, QgsAnnotationPointTextItem
 except:
-    from qgis.core import QgsPointXY, QgsDistanceArea, QgsGeometryUtils, QgsProject, QgsPoint, QgsUnitTypes
+    from qgis.core import Qgis, QgsPointXY, QgsDistanceArea, QgsGeometryUtils, QgsProject, QgsPoint, QgsUnitTypes
     
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtCore import Qt
 import math
 import os
 
+from .geometry import OtFSP_Geometry
+
 
 class FlexjLine:
      
@@ -50,6 +52,7 @@ class FlexjLine:
     defaultDistanceUnits = "m"
     defaultKeepBaseUnit = False # set to False to allow conversion of large distances to more suitable units, e.g., meters to kilometers 
     defaultAngleCorrection = 0
+    defaultShowNetworkDistance = 0
     
     defaultMaxNumMarkers = 100
 
@@ -80,6 +83,8 @@ class FlexjLine:
             self.iface.messageBar().pushMessage("Error", "Annotations are supported only since QGIS version 3.16. Lengths in rubberbands are disabled.", level=Qgis.Warning, duration=5)            
         self.lastAnnotationId = None       
         self.totalLength = 0        
+        # A function f(p1, p2) returning the network distance in meters between two points, or a negative value if there is no path
+        self.networkDistanceFunction = None
         return        
 
         
@@ -93,6 +98,7 @@ class FlexjLine:
         
         if self.annotation_layer is not None:
             self.annotation_layer.reset()        
+        self.lastAnnotationId = None
         self.totalLength = 0
         return        
 
@@ -120,10 +126,9 @@ class FlexjLine:
                 self.rubberBand.addPoint(point)
                 
                 if self.annotation_layer is not None:               
-                    if self.lastAnnotationId is not None :
-                        self.annotation_layer.removeItem(self.lastAnnotationId)  
                     if self.markerIndex > 0 and self.showDistance == 1:
-                        # Sets the temporary flag to annotations created by the canvasMoveEvent and not by the mouse click
+                        # Sets the temporary flag to annotations created by the canvasMoveEvent and not by the mouse click.
+                        # The live label is updated in place
                         self.addDistanceLabel(self.markers[self.markerIndex -1].center(), point, permanent = False)  
                 
         return
@@ -182,6 +187,7 @@ class FlexjLine:
         self.markerIndex = 0           
         if self.lastAnnotationId is not None:
             self.annotation_layer.removeItem(self.lastAnnotationId)  
+            self.lastAnnotationId = None
         return            
 
 
@@ -215,22 +221,20 @@ class FlexjLine:
         pt1 = QgsPoint(p1)
         pt2 = QgsPoint(p2)
         
-        # calculate length of line
-        d = QgsDistanceArea()
-        d.setSourceCrs(QgsProject.instance().crs(), QgsProject.instance().transformContext())
-        d.setEllipsoid(QgsProject.instance().crs().ellipsoidAcronym())
+        # calculate length of line. The measurement context of the Project CRS is cached
+        d = OtFSP_Geometry.distanceArea(QgsProject.instance().crs())
         
         # Use length and units of the Project CRS/ellipsoid
         length_in_ellipsoid_units = d.measureLine([p1, p2])
         lengthUnits = d.lengthUnits()
                
         length_in_meters = d.convertLengthMeasurement(length_in_ellipsoid_units, QgsUnitTypes.DistanceMeters)      
-        length_in_resultUnits = length_in_meters * QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceMeters, self.distanceUnitsQgs)
+        length_in_resultUnits = length_in_meters * self.metersToResultUnitsFactor
                 
         self.candidateSegmentLength = length_in_ellipsoid_units
         candidatetotalLength = self.totalLength + length_in_ellipsoid_units
         candidatetotalLength_in_meters = d.convertLengthMeasurement(candidatetotalLength, QgsUnitTypes.DistanceMeters)
-        candidatetotalLength_in_resultUnits = candidatetotalLength_in_meters * QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceMeters, self.distanceUnitsQgs)        
+        candidatetotalLength_in_resultUnits = candidatetotalLength_in_meters * self.metersToResultUnitsFactor        
                   
         x, y = self.annotationCoordinates(pt1, pt2)
             
@@ -241,17 +245,56 @@ class FlexjLine:
         if candidatetotalLength != 0 and self.showTotalDistance == 1:
             segmentLengthText = segmentLengthText + " (" + totalLengthText + ")" 
 
-        if self.annotation_layer is not None:          
-            label = QgsAnnotationPointTextItem(segmentLengthText, QgsPointXY(x, y))        
-            if self.atAngle == 1:
-                label.setAngle(self.labelAngle(pt1, pt2))   
-            else:
-                label.setAngle(0)
-           
+        if self.showNetworkDistance == 1 and self.networkDistanceFunction is not None:
+            segmentLengthText = segmentLengthText + " / " + self.networkDistanceText(p1, p2)
+
+        if self.annotation_layer is not None:
+            angle = self.labelAngle(pt1, pt2) if self.atAngle == 1 else 0
+            self.updateLiveLabel(segmentLengthText, QgsPointXY(x, y), angle)
             if permanent == True:
+                # The live label stays on the map as the permanent label of the segment. 
+                # The next mouse move creates a new live label
                 self.lastAnnotationId = None
-            else:    
-                self.lastAnnotationId = self.annotation_layer.addItem(label)
+        return
+
+
+    def networkDistanceText(self, p1:QgsPointXY, p2:QgsPointXY) -> str:
+        ''' Returns the network distance readout of a segment '''
+        try:
+            length_in_meters = self.networkDistanceFunction(p1, p2)
+        except:
+            length_in_meters = -1
+        if length_in_meters is None or length_in_meters < 0:
+            return "net: ?"
+        length_in_resultUnits = length_in_meters * self.metersToResultUnitsFactor
+        return "net: " + QgsUnitTypes.formatDistance(length_in_resultUnits, self.annotationDecimalDigits, self.distanceUnitsQgs, self.keepBaseUnit)
+
+
+    def setNetworkDistanceFunction(self, networkDistanceFunction) -> None:
+        self.networkDistanceFunction = networkDistanceFunction
+        return
+
+
+    def updateLiveLabel(self, text:str, point:QgsPointXY, angle:float) -> None:
+        ''' 
+        Updates the text, position and angle of the live label. Since QGIS 3.22 the item of the layer 
+        is changed in place and the layer is repainted. Earlier versions give no access to the items 
+        of the layer, so the label is removed and added again
+        '''
+        if self.lastAnnotationId is not None and Qgis.QGIS_VERSION_INT >= 32200:
+            label = self.annotation_layer.item(self.lastAnnotationId)
+            if label is not None:
+                label.setText(text)
+                label.setPoint(point)
+                label.setAngle(angle)
+                self.annotation_layer.triggerRepaint()
+                return
+            
+        if self.lastAnnotationId is not None:
+            self.annotation_layer.removeItem(self.lastAnnotationId)
+        label = QgsAnnotationPointTextItem(text, point)
+        label.setAngle(angle)
+        self.lastAnnotationId = self.annotation_layer.addItem(label)
         return
         
         
@@ -291,7 +334,7 @@ class FlexjLine:
     def setFlexjLineVisuals(self, color:QColor = defaultToolColor, markerSize:int = defaultMarkerIconSize, lineWidth:int = defaultLineWidth, 
                                       lineStyle:int = defaultLineStyle, showDistance:int = defaultShowDistance, atAngle:int = defaultAtAngle, showTotalDistance:int = defaultShowTotalDistance, decimalDigits:int = defaultAnnotationDecimalDigits, 
                                       distanceUnits:str = defaultDistanceUnits, keepBaseUnit:int = defaultKeepBaseUnit,
-                                      angleCorrection:int = defaultAngleCorrection) -> None:
+                                      angleCorrection:int = defaultAngleCorrection, showNetworkDistance:int = defaultShowNetworkDistance) -> None:
         self.toolColor = color
         self.rubberBand.setColor(self.toolColor)
 
@@ -312,5 +355,8 @@ class FlexjLine:
         self.showTotalDistance = showTotalDistance
         self.annotationDecimalDigits = decimalDigits
         self.distanceUnitsQgs = QgsUnitTypes.decodeDistanceUnit(distanceUnits)[0] if QgsUnitTypes.decodeDistanceUnit(distanceUnits)[1] else QgsUnitTypes.DistanceMeters
+        # Calculated once, instead of on every mouse move
+        self.metersToResultUnitsFactor = QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceMeters, self.distanceUnitsQgs)
         self.keepBaseUnit = bool(keepBaseUnit)
-        self.angleCorrection = bool(angleCorrection)
\ No newline at end of file
+        self.angleCorrection = bool(angleCorrection)
+        self.showNetworkDistance = showNetworkDistance
\ No newline at end of file
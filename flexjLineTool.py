@@ -48,6 +48,7 @@ class MapToolFlexjLine(MapToolSnapToLayers):
     defaultDistanceUnits = "m"
     defaultKeepBaseUnit = False # set to False to allow conversion of large distances to more suitable units, e.g., meters to kilometers 
     defaultAngleCorrection = 0
+    defaultShowNetworkDistance = 0
 
      
     def __init__(self, canvas, iface, maxNumMarkers:int = defaultMaxNumMarkers):
@@ -77,10 +78,9 @@ class MapToolFlexjLine(MapToolSnapToLayers):
         return        
 
     
-    def canvasMoveEvent(self, event):       
+    def snappedMoveEvent(self, pos):       
 
-        super().canvasMoveEvent(event)
-        mousePoint = self.toMapCoordinates(event.pos())
+        mousePoint = self.toMapCoordinates(pos)
               
         # Implement the snapping functionality for the dynamic movement of the mouse
         p = self.conditionalOffsetToSnappedPoint(mousePoint)                
@@ -101,12 +101,21 @@ class MapToolFlexjLine(MapToolSnapToLayers):
     def getMarkerPoints(self):
         return  self.rb.getMarkerPoints()  
 
+
+    def getMarkerPointList(self):
+        return self.rb.getMarkerPointList()
+
+
+    def setNetworkDistanceFunction(self, networkDistanceFunction) -> None:
+        self.rb.setNetworkDistanceFunction(networkDistanceFunction)
+        return
+
   
     def setFlexjLineToolVisuals(self, color:QColor = defaultToolColor, markerSize:int = defaultMarkerIconSize, lineWidth:int = defaultLineWidth, 
                                       lineStyle:int = defaultLineStyle, showDistance:int = defaultShowDistance, atAngle:int = defaultAtAngle, 
                                       showTotalDistance:int = defaultShowTotalDistance, decimalDigits:int = defaultAnnotationDecimalDigits, 
                                       distanceUnits:str = defaultDistanceUnits, keepBaseUnit:int = defaultKeepBaseUnit,
-                                      angleCorrection = defaultAngleCorrection) -> None:
+                                      angleCorrection = defaultAngleCorrection, showNetworkDistance:int = defaultShowNetworkDistance) -> None:
 
         self.toolColor = color
         self.markerIconSize = markerSize        
@@ -119,10 +128,12 @@ class MapToolFlexjLine(MapToolSnapToLayers):
         self.distanceUnits = distanceUnits
         self.keepBaseUnit = bool(keepBaseUnit)
         self.angleCorrection = bool(angleCorrection)        
+        self.showNetworkDistance = showNetworkDistance
                
         self.rb.setFlexjLineVisuals(color = self.toolColor, markerSize = self.markerIconSize, lineWidth = self.lineWidth, 
                                       lineStyle = self.lineStyle, showDistance = self.showDistance, atAngle = self.atAngle, showTotalDistance = self.showTotalDistance, decimalDigits = self.annotationDecimalDigits, 
-                                      distanceUnits = self.distanceUnits, keepBaseUnit = self.keepBaseUnit, angleCorrection = self.angleCorrection)
+                                      distanceUnits = self.distanceUnits, keepBaseUnit = self.keepBaseUnit, angleCorrection = self.angleCorrection,
+                                      showNetworkDistance = self.showNetworkDistance)
         return                              
         
 
@@ -30,11 +30,34 @@ class OtFSP_Geometry:
     #Conversion factor from meters to units in the following order  ["m", "Km", "y", "ft", "NM", "mi"]
     conversionFactor = [1, 0.001, 1.0936132983377078, 3.280839895013123, 0.0005399568034557236, 0.0006213711922373339]                       
 
+    # Measurement contexts shared by all instances, keyed by (CRS, ellipsoidal). Setting up a QgsDistanceArea costs
+    # far more than a measurement, especially for a geographic CRS, and measurements run on every mouse move.
+    # The cache must be cleared when the project CRS or the transform context changes, see clearMeasurementContexts()
+    measurementContexts = {}
+
+    @classmethod
+    def distanceArea(cls, crs:QgsCoordinateReferenceSystem, ellipsoidal:bool = True) -> QgsDistanceArea:
+        ''' Returns a QgsDistanceArea set to the CRS and, if ellipsoidal, to the ellipsoid of the CRS. The object is shared and must not be modified '''
+        key = (crs.authid() if crs.authid() != "" else crs.toWkt(), ellipsoidal)
+        d = cls.measurementContexts.get(key)
+        if d is None:
+            d = QgsDistanceArea()
+            d.setSourceCrs(crs, QgsProject.instance().transformContext())
+            if ellipsoidal:
+                d.setEllipsoid(crs.ellipsoidAcronym())
+            cls.measurementContexts[key] = d
+        return d
+
+
+    @classmethod
+    def clearMeasurementContexts(cls) -> None:
+        cls.measurementContexts.clear()
+        return
+
+
     def distanceP2P(self, crs:QgsCoordinateReferenceSystem, p1:QgsPointXY, p2:QgsPointXY) -> float:
         ''' Returns the distance between two points. Distance is returned in meters, since ellipsoidal calculation is set by setting the ellipsoid '''
-        d = QgsDistanceArea()
-        d.setSourceCrs(crs, QgsProject.instance().transformContext())
-        d.setEllipsoid(crs.ellipsoidAcronym())
+        d = self.distanceArea(crs)
         distance = d.measureLine([p1, p2]) 
         return distance
 
@@ -51,8 +74,7 @@ class OtFSP_Geometry:
     def lengthInMeters(self, length:float, sourceCrs:QgsCoordinateReferenceSystem) -> float:
         ''' Converts a distance from a crs unit to meters'''
         try:
-            d = QgsDistanceArea()
-            d.setSourceCrs(sourceCrs, QgsProject.instance().transformContext())
+            d = self.distanceArea(sourceCrs, ellipsoidal = False)
             # I do not use d.setEllipsoid(sourceCrs.ellipsoidAcronym()) because setting the ellipsoid defines an ellipsoidal rather than 
             # a cartesian distance measurement and sets the length unit to meters.           
             # After QGIS 3.30 
@@ -68,9 +90,7 @@ class OtFSP_Geometry:
         ''' Returns a list of valuable data regarding the measurements of the CRS '''
         '''Be protective in case a transformation is not possible '''
         try:
-            d = QgsDistanceArea()
-            d.setSourceCrs(crs, QgsProject.instance().transformContext())
-            d.setEllipsoid(crs.ellipsoidAcronym())              
+            d = self.distanceArea(crs)
             return [d.ellipsoid(), d.sourceCrs().authid(), d.sourceCrs().description(), QgsUnitTypes.toString(d.lengthUnits())]    
         except:
             return ["?", "?", "?", "?"]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    measurementCache.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import copy
+from collections import OrderedDict
+
+'''
+A memo of the last measurements, so that measuring again the same waypoints on the same graph returns 
+the previous results at once. The entries are valid only for one version of the graph: when the graph is 
+rebuilt, the cache is cleared. The least recently used entry is evicted when the cache is full.
+'''
+
+class MeasurementCache:
+
+    def __init__(self, maxSize:int = 64):
+        self.maxSize = maxSize
+        # key -> value, from the least to the most recently used
+        self.entries = OrderedDict()
+        # The version of the graph of the entries
+        self.graphVersion = None
+        self.hits = 0
+        self.misses = 0
+        return
+
+
+    def setGraphVersion(self, version:int) -> None:
+        ''' Clears the cache if the graph has changed since the entries were stored '''
+        if version != self.graphVersion:
+            self.clear()
+            self.graphVersion = version
+        return
+
+
+    def get(self, key):
+        ''' Returns a copy of the value of the key, or None if the key is not cached '''
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        # The caller may modify the value, e.g. the loss when the fixed loss is toggled
+        return copy.deepcopy(value)
+
+
+    def put(self, key, value) -> None:
+        self.entries[key] = copy.deepcopy(value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last = False)
+        return
+
+
+    def clear(self) -> None:
+        self.entries.clear()
+        return
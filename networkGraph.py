@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    networkGraph.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import math
+
+from qgis.core import ( QgsCoordinateReferenceSystem,
+                        QgsCoordinateTransform,
+                        QgsCoordinateTransformContext,
+                        QgsPointXY,
+                        QgsRectangle,
+                        QgsSpatialIndex,
+                        QgsVectorLayer
+                      )
+from qgis.analysis import ( QgsGraphAnalyzer,
+                            QgsGraphBuilder,
+                            QgsNetworkDistanceStrategy,
+                            QgsNetworkStrategy,
+                            QgsVectorLayerDirector
+                          )
+
+from .networkStrategies import FeatureIdStrategy
+from .pathAlgorithms import GraphPaths
+
+'''
+The graph of the analysis layer, built once and reused by all the legs of a route, as long as the
+layers and the configuration do not change. A spatial index of the graph vertices allows markers
+to be snapped directly on the network junctions, in which case the tie of the markers to the network is skipped.
+'''
+
+class NetworkGraph:
+
+    # Incremented for every graph built, so that results computed on a graph can be associated with it
+    lastVersion = 0
+
+    # Distance, in units of the graph CRS, within which a point is considered to be on a graph vertex.
+    # Covers the round trip of the coordinates between the project CRS and the graph CRS.
+    junctionTolerance = 0.000001
+
+    # Number of shortest path trees kept by networkDistance(). Each tree holds two lists of the size of the graph
+    maxCachedTrees = 16
+
+    def __init__(self, pathLayer:QgsVectorLayer, crs:QgsCoordinateReferenceSystem, topologyTolerance:float = 0, key = None,
+                 featureSources = None, lossStrategy:QgsNetworkStrategy = None, routeByLoss:bool = False, trackFeatures:bool = False):
+        self.pathLayer = pathLayer
+        self.crs = crs
+        self.topologyTolerance = topologyTolerance
+        # Anything that identifies the input of the graph. The caller compares keys to decide if the graph can be reused
+        self.key = key
+        # The FeatureSources of the features of the path layer
+        self.featureSources = featureSources
+
+        self.director = QgsVectorLayerDirector(pathLayer, -1, '', '', '', QgsVectorLayerDirector.DirectionBoth)
+        # Criterion 0 is always the length of the edges
+        self.director.addStrategy(QgsNetworkDistanceStrategy())
+        numCriteria = 1
+        # The criterion of the optical loss of the edges, or -1 if there is no loss strategy
+        self.lossCriterion = -1
+        if lossStrategy is not None:
+            self.director.addStrategy(lossStrategy)
+            self.lossCriterion = numCriteria
+            numCriteria += 1
+        # The criterion that holds the feature id of the path layer from which each edge has been created, or -1
+        self.featureCriterion = -1
+        if trackFeatures:
+            self.director.addStrategy(FeatureIdStrategy())
+            self.featureCriterion = numCriteria
+            numCriteria += 1
+        # The criterion minimized by the routes
+        self.criterion = self.lossCriterion if routeByLoss and self.lossCriterion >= 0 else 0
+
+        builder = self.newBuilder()
+        # No additional points. Markers are either junctions of this graph or tied on a copy of the graph, see tiedVertices()
+        self.director.makeGraph(builder, [])
+        self.graph = builder.graph()
+
+        self.vertexIndex = QgsSpatialIndex()
+        for i in range(self.graph.vertexCount()):
+            p = self.graph.vertex(i).point()
+            self.vertexIndex.addFeature(i, QgsRectangle(p, p))
+
+        NetworkGraph.lastVersion += 1
+        self.version = NetworkGraph.lastVersion
+
+        # Transformations between the CRS of the map canvas and the CRS of the graph, used by junction snapping
+        self.toGraphCrs = None
+        self.fromGraphCrs = None
+
+        # Start vertex -> (tree, costs) of dijkstra on the cached graph
+        self.shortestPathTrees = {}
+        # The arcs of the cached graph for the searches of pathAlgorithms, created on first use
+        self.cachedGraphPaths = None
+        return
+
+
+    def newBuilder(self) -> QgsGraphBuilder:
+        return QgsGraphBuilder(self.crs, True, self.topologyTolerance, self.crs.ellipsoidAcronym())
+
+
+    def vertexAt(self, point:QgsPointXY, tolerance:float = -1) -> int:
+        ''' Returns the index of the graph vertex at the point (within tolerance), or -1 '''
+        if tolerance < 0:
+            tolerance = self.junctionTolerance
+        ids = self.vertexIndex.nearestNeighbor(point, 1, tolerance)
+        if len(ids) == 0:
+            return -1
+        return min(ids, key = lambda i: self.graph.vertex(i).point().sqrDist(point))
+
+
+    def tiePoints(self, points:list):
+        '''
+        Returns a tuple (graph, vertex indexes, tied points). If all points are vertices of the graph,
+        the cached graph is returned. Otherwise, the points are tied to the network on a new graph,
+        where the tied points are the nearest points of the network
+        '''
+        indexes = [self.vertexAt(p) for p in points]
+        if all(idx >= 0 for idx in indexes):
+            return (self.graph, indexes, [self.graph.vertex(idx).point() for idx in indexes])
+
+        builder = self.newBuilder()
+        tiedPoints = self.director.makeGraph(builder, points)
+        graph = builder.graph()
+        return (graph, [graph.findVertex(p) for p in tiedPoints], tiedPoints)
+
+
+    def tiedVertices(self, fromPoint:QgsPointXY, toPoint:QgsPointXY):
+        '''
+        Returns a tuple (graph, idxStart, idxEnd, tStart, tStop), where tStart and tStop are 
+        the coordinates of the points on the network that are closest to the start and stop points
+        '''
+        (graph, indexes, tiedPoints) = self.tiePoints([fromPoint, toPoint])
+        return (graph, indexes[0], indexes[1], tiedPoints[0], tiedPoints[1])
+
+
+    def costMatrix(self, points:list) -> list:
+        '''
+        Returns a matrix where the item [i][j] is the cost on the graph from point i to point j, or math.inf if there is no path.
+        The points are tied to the network together and one search is run from each point, on the criterion of the routes
+        '''
+        (graph, indexes, tiedPoints) = self.tiePoints(points)
+        matrix = []
+        for idxFrom in indexes:
+            (tree, costs) = QgsGraphAnalyzer.dijkstra(graph, idxFrom, self.criterion)
+            row = []
+            for idxTo in indexes:
+                if idxTo == idxFrom:
+                    row.append(0)
+                elif tree[idxTo] == -1:
+                    row.append(math.inf)
+                else:
+                    row.append(costs[idxTo])
+            matrix.append(row)
+        return matrix
+
+
+    def graphPaths(self, graph) -> GraphPaths:
+        ''' Returns a copy of the arcs of the graph, with the costs of the criterion of the routes, for the searches that QgsGraphAnalyzer does not offer '''
+        if graph is self.graph and self.cachedGraphPaths is not None:
+            return self.cachedGraphPaths
+        arcs = []
+        for i in range(graph.edgeCount()):
+            edge = graph.edge(i)
+            arcs.append((edge.fromVertex(), edge.toVertex(), edge.cost(self.criterion)))
+        graphPaths = GraphPaths(graph.vertexCount(), arcs)
+        if graph is self.graph:
+            self.cachedGraphPaths = graphPaths
+        return graphPaths
+
+
+    def edgeCosts(self, graph, criterion:int) -> list:
+        ''' Returns the costs of the edges of the graph for a criterion, in the order of the edges '''
+        return [graph.edge(i).cost(criterion) for i in range(graph.edgeCount())]
+
+
+    def setDisplayCrs(self, displayCrs:QgsCoordinateReferenceSystem, transformContext:QgsCoordinateTransformContext) -> None:
+        ''' Sets the CRS of the points given to and returned by nearest() '''
+        if displayCrs == self.crs:
+            self.toGraphCrs = None
+            self.fromGraphCrs = None
+        else:
+            self.toGraphCrs = QgsCoordinateTransform(displayCrs, self.crs, transformContext)
+            self.fromGraphCrs = QgsCoordinateTransform(self.crs, displayCrs, transformContext)
+        return
+
+
+    def nearest(self, point:QgsPointXY, tolerance:float, snappingMethod:int = 0):
+        '''
+        Same interface as SnappingIndex.nearest(), so that the snapping tools can snap to the junctions of the network.
+        The point and the tolerance are in the display CRS. Graph vertices do not belong to a layer, so the list of layers is empty
+        '''
+        try:
+            (point, tolerance) = self.toGraph(point, tolerance)
+        except:
+            return (None, [])
+
+        idx = self.vertexAt(point, tolerance)
+        if idx < 0:
+            return (None, [])
+        junction = self.graph.vertex(idx).point()
+        if self.fromGraphCrs is not None:
+            junction = self.fromGraphCrs.transform(junction)
+        return (junction, [])
+
+
+    def toGraph(self, point:QgsPointXY, tolerance:float) -> tuple:
+        ''' Returns a tuple (point, tolerance) transformed from the display CRS to the CRS of the graph '''
+        if self.toGraphCrs is not None:
+            corner = self.toGraphCrs.transform(QgsPointXY(point.x() + tolerance, point.y()))
+            point = self.toGraphCrs.transform(point)
+            tolerance = point.distance(corner)
+        return (point, tolerance)
+
+
+    def shortestPathTree(self, idxStart:int):
+        ''' Returns the (tree, costs) of dijkstra from the vertex, on the cached graph. The most recent trees are cached '''
+        result = self.shortestPathTrees.get(idxStart)
+        if result is None:
+            result = QgsGraphAnalyzer.dijkstra(self.graph, idxStart, 0)
+            if len(self.shortestPathTrees) >= self.maxCachedTrees:
+                # Forget the oldest tree
+                del self.shortestPathTrees[next(iter(self.shortestPathTrees))]
+            self.shortestPathTrees[idxStart] = result
+        return result
+
+
+    def networkDistance(self, fromPoint:QgsPointXY, toPoint:QgsPointXY, tolerance:float) -> float:
+        '''
+        Returns the cost of the shortest path, in the units of the graph, between the graph vertices at the points, which 
+        are in the display CRS, or -1 if there is no path or a point is farther than the tolerance from every vertex. 
+        The points are not tied to the network, so that while the end point is dragged, only a spatial index query 
+        is needed on the cached tree of the start point
+        '''
+        try:
+            (fromPoint, graphTolerance) = self.toGraph(fromPoint, tolerance)
+            (toPoint, graphTolerance) = self.toGraph(toPoint, tolerance)
+        except:
+            return -1
+
+        idxStart = self.vertexAt(fromPoint, graphTolerance)
+        idxEnd = self.vertexAt(toPoint, graphTolerance)
+        if idxStart < 0 or idxEnd < 0:
+            return -1
+        if idxStart == idxEnd:
+            return 0
+
+        (tree, costs) = self.shortestPathTree(idxStart)
+        if tree[idxEnd] == -1:
+            return -1
+        return costs[idxEnd]
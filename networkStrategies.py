@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    networkStrategies.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+from qgis.core import ( QgsFeature,
+                        QgsFeatureRequest,
+                        QgsVectorLayer
+                      )
+from qgis.analysis import QgsNetworkStrategy
+
+from .geometry import OtFSP_Geometry
+
+'''
+Network strategies that give the edges of the graph a cost other than their length.
+The strategies are called by the director once per edge while the graph is built, so they
+do not read attributes from the features. The attribute values are read once per layer
+into a lookup by feature id of the analysis layer.
+'''
+
+class FeatureSources:
+    ''' Maps the features of the analysis layer to the features of the line layers they were copied from '''
+
+    def __init__(self, layers:list, sourceIds:dict = None):
+        # layerno -> QgsVectorLayer, in the order of the merge
+        self.layers = layers
+        # Feature id of the analysis layer -> (layerno, feature id in the line layer).
+        # None when the analysis layer is the line layer itself. Features that are not in the dictionary are bridges
+        self.sourceIds = sourceIds
+        return
+
+
+    def source(self, fid:int):
+        ''' Returns a tuple (layerno, feature id in the line layer), or None if the feature has been created by a bridge '''
+        if self.sourceIds is None:
+            return (0, fid)
+        return self.sourceIds.get(fid)
+
+
+    def attributeValues(self, fieldNames:list, featureIds:list = None) -> dict:
+        '''
+        Returns a dictionary of feature id of the analysis layer -> list of the values of the fields in the source feature,
+        for the given features of the analysis layer or for all of them. A field which does not exist in a layer, 
+        or an empty field name, gives None. One request without geometry is made per layer
+        '''
+        # layerno -> {source feature id: feature id of the analysis layer}, or None for all the features of the layer
+        layerIds = {}
+        if self.sourceIds is None:
+            layerIds[0] = None if featureIds is None else {fid: fid for fid in featureIds}
+        else:
+            for fid in (self.sourceIds.keys() if featureIds is None else featureIds):
+                source = self.sourceIds.get(fid)
+                if source is not None:
+                    layerIds.setdefault(source[0], {})[source[1]] = fid
+
+        values = {}
+        for layerno, ids in layerIds.items():
+            layer = self.layers[layerno]
+            indexes = [layer.fields().lookupField(name) if name != "" else -1 for name in fieldNames]
+
+            request = QgsFeatureRequest()
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+            request.setSubsetOfAttributes([i for i in indexes if i >= 0])
+            if ids is not None:
+                request.setFilterFids(list(ids.keys()))
+
+            feature = QgsFeature()
+            features = layer.getFeatures(request)
+            while features.nextFeature(feature):
+                fid = feature.id() if ids is None else ids.get(feature.id())
+                if fid is None:
+                    continue
+                attributes = feature.attributes()
+                values[fid] = [attributes[i] if i >= 0 else None for i in indexes]
+        return values
+
+
+    def countSplices(self, featureIds:list):
+        '''
+        Returns a tuple (splices, bridge crossings) of a path, given as the features of its edges in the order of the path.
+        Every change of source feature is a splice. Consecutive bridge features are one crossing, and the features
+        joined by the bridge count as one splice
+        '''
+        splices = 0
+        crossings = 0
+        previousSource = None
+        onBridge = False
+        for fid in featureIds:
+            source = self.source(fid)
+            if source is None:
+                if not onBridge:
+                    crossings += 1
+                    onBridge = True
+                continue
+            onBridge = False
+            if previousSource is not None and source != previousSource:
+                splices += 1
+            previousSource = source
+        return (splices, crossings)
+
+
+    def traversedFeatures(self, featureIds:list, lengths:list) -> list:
+        '''
+        Returns a list of [feature id of the analysis layer, layerno, feature id in the line layer, length] for each source feature 
+        of a path, in the order of the first traversal. The input is the feature and the length of every edge of the path.
+        The lengths of the bridges are summed in one item, where layerno and the feature id in the line layer are None
+        '''
+        items = {}
+        for fid, length in zip(featureIds, lengths):
+            source = self.source(fid)
+            if source is None:
+                source = (None, None)
+            item = items.get(source)
+            if item is None:
+                items[source] = [fid, source[0], source[1], length]
+            else:
+                item[3] += length
+        return list(items.values())
+
+
+
+class FeatureIdStrategy(QgsNetworkStrategy):
+    ''' 
+    The cost of an edge is the id of the feature it has been created from, so that the graph keeps 
+    a map of edge -> feature while it is built. It is never used as a criterion of dijkstra 
+    '''
+
+    def requiredAttributes(self) -> set:
+        return set()
+
+
+    def cost(self, distance:float, feature:QgsFeature) -> int:
+        return feature.id()
+
+
+
+class FiberLossStrategy(QgsNetworkStrategy):
+    '''
+    The cost of an edge is its optical loss in db: the attenuation of the cable of the feature,
+    plus the loss of a splice if the feature is flagged to have one. The splice loss is shared along
+    the length of the feature, so that a route traversing the whole feature counts exactly one splice
+    '''
+
+    def __init__(self, lossPerMeter:dict, defaultAttenuation:float):
+        super().__init__()
+        # Feature id of the analysis layer -> loss in db per meter
+        self.lossPerMeter = lossPerMeter
+        # Used for the features without a valid attenuation value and for the bridges
+        self.defaultLossPerMeter = defaultAttenuation / 1000.0
+        return
+
+
+    @classmethod
+    def fromFeatureSources(cls, featureSources:FeatureSources, pathLayer:QgsVectorLayer, attenuationField:str, spliceFlagField:str,
+                           defaultAttenuation:float, spliceLoss:float):
+        ''' Reads the attenuation (db/Km) and the splice flag of every feature and builds the strategy '''
+        values = featureSources.attributeValues([attenuationField, spliceFlagField])
+
+        lengths = {}
+        if spliceFlagField != "":
+            distanceArea = OtFSP_Geometry.distanceArea(pathLayer.crs())
+            request = QgsFeatureRequest().setNoAttributes()
+            for feature in pathLayer.getFeatures(request):
+                lengths[feature.id()] = distanceArea.measureLength(feature.geometry())
+
+        lossPerMeter = {}
+        for fid, (attenuation, spliceFlag) in values.items():
+            loss = cls.floatValue(attenuation, defaultAttenuation) / 1000.0
+            if cls.isFlagSet(spliceFlag) and lengths.get(fid, 0) > 0:
+                loss += spliceLoss / lengths[fid]
+            lossPerMeter[fid] = loss
+        return cls(lossPerMeter, defaultAttenuation)
+
+
+    @staticmethod
+    def floatValue(value, default:float) -> float:
+        # NULL, empty or text values fall back to the default
+        try:
+            return float(value)
+        except:
+            return default
+
+
+    @staticmethod
+    def isFlagSet(value) -> bool:
+        try:
+            return int(value) != 0
+        except:
+            return str(value).strip().lower() in ["true", "yes", "y", "t"]
+
+
+    def requiredAttributes(self) -> set:
+        # The attributes have already been read in the lookup
+        return set()
+
+
+    def cost(self, distance:float, feature:QgsFeature) -> float:
+        return distance * self.lossPerMeter.get(feature.id(), self.defaultLossPerMeter)
@@ -29,11 +29,13 @@ __copyright__ = '(C) 2024, Ilias Iliopoulos'
 
 
 import os
+from osgeo import ogr
 from qgis.PyQt import uic
 from qgis.PyQt.QtGui import QColor, QIcon, QCursor, QPixmap  
-from qgis.PyQt.QtWidgets import QDialog, QMessageBox, QPushButton, QListWidgetItem, QListWidget
-from qgis.PyQt.QtCore import Qt, QVariant, QSize
+from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QMessageBox, QProgressDialog, QPushButton,QListWidgetItem, QListWidget, QTableWidgetItem
+from qgis.PyQt.QtCore import Qt, QVariant, QSize, QDateTime
 from qgis.core import ( Qgis,
+                        QgsApplication,
                         QgsCoordinateReferenceSystem,
                         QgsCoordinateTransform,                        
                         QgsDistanceArea,
@@ -43,9 +45,11 @@ from qgis.core import ( Qgis,
                         QgsFields,
                         QgsGeometry,
                         QgsMemoryProviderUtils,
+                        QgsMessageLog,
                         QgsPointXY,
                         QgsProject,
                         QgsRectangle,
+                        QgsRelation,
                         QgsSettings,
                         QgsUnitTypes,
                         QgsVectorLayer, 
@@ -60,98 +64,26 @@ from qgis.analysis import *
 from .vertexTool import MapToolSnapToLayers
 from .geometry import OtFSP_Geometry
 from .flexjLineTool import MapToolFlexjLine
-from .bridge import BridgeLayer
+from .networkGraph import NetworkGraph
+from .networkStrategies import FeatureSources
+from .fiberLoss import FiberLoss
+from .routingEngine import RoutingEngine
+from .measurementCache import MeasurementCache
+from .stageTimer import StageTimer
+from .pluginSettings import PluginSettings
+from .resultWriter import RouteWriter
+from .processingProvider import OnTheFlyProcessingProvider
 from .bridgingPointTool import BridgingPointTool
 from .bridgingLineTool import BridgingLineTool
 import webbrowser # For local and online help
 
 # Compiled ui 
 #from .ui_Classes import DockWidgetDialog, ConfigurationDialog, ResultsDialog, ResultsNoFiberDialog, MarkerCoordinatesDialog, LayerSelectionDialog
-from .ui_Classes import ConfigurationDialog, ResultsDialog, ResultsNoFiberDialog, MarkerCoordinatesDialog, LayerSelectionDialog
+from .ui_Classes import ConfigurationDialog, ResultsDialog, ResultsNoFiberDialog, MarkerCoordinatesDialog, LayerSelectionDialog, AlternativeRoutesDialog
 
 class OnTheFlyShortestPath:
 
-    factoryDefaultSettings = {
-        "rubberBandColorRed" : 55,
-        "rubberBandColorGreen" : 165,
-        "rubberBandColorBlue" : 200,
-        "rubberBandOpacity" : 128,        
-        "rubberBandSize" : 8,
-        "markerColorRed" : 255,
-        "markerColorGreen" : 30,
-        "markerColorBlue" : 50,
-        "markerOpacity" : 255,       
-        "markerSize" : 10,
-        "decimalDigits" : 2,
-        "topologyTolerance" : 0.0,
-        "toleranceUnitsIndex" : 0,
-        "includeStartStop" : 1,
-        "resultDialogTypeIndex" : 0, 
-        "distanceUnitsIndex" : 0, # ["meters", "Kilometers", "yards", "feet", "nutical miles", "imperial miles"]
-        "selectedCrsMethod" : 0, # 0 Project, 1 Layer, 2 Custom
-        "customCrs" : 0, # EPSG id
-        "connectorLoss" : 0.4, # db per connector
-        "numberOfConnectorsAtEntry" : 3,
-        "numberOfConnectorsAtExit" : 3,
-        "spliceLoss" : 0.15, # db per splice
-        "spliceFrequency" : 1.0, # Km
-        "cableLoss" : 0.25,       # db/Km    
-        "fixedLoss" : 0,  # db e.g. Acccount for splitters 1:2->4db, 1:4->7db, 1:8->11db, 1:16->15db, 1:32->19db, 1:64->23db
-        "coordinateFormatIndex" : 0, # ["x y", "y x", "x, y", "y, x"]
-        "addResultLayer" : 0, # add the result rubberband path to map as a temporary layer
-        "addMergedLayer": 0, # add the merged layer to map as a temporary layer
-
-        "snappingToolSnappingProviderIndex" : 0, # 0 internal, 1 QGIS, 2 Both
-        "snappingToolColorRed" : 0,
-        "snappingToolColorGreen" : 0,
-        "snappingToolColorBlue" : 255,
-        "snappingToolOpacity" : 255,       
-        "snappingToolSize" : 12,        
-        "snappingToolSnapMethod" : 1, # controls the snap behaviour of the marker (snap to vertices of point and line layers or snap to edges (the entire line) of line layers)
-        "snappingToolSnapPixels" : 10, # marker snapping tolerance in pixels
-        "snappingToolSnapToMatchedPoint" : 1, # Yes,No to snap the marker to the map feature or to leave the marker at the cursor location
-        "snappingToolShowToolTip" : 1, # Makes the tooltip of the snapping tool visisble
-        "snappingToolSnappingBehaviourIndex" : 1, # 0 Snap to all layers, 1 snap only to selected layers,   2 snap to active layer
-
-        "bridgingPointToolColorRed": 255,
-        "bridgingPointToolColorGreen": 0,
-        "bridgingPointToolColorBlue": 0,
-        "bridgingPointToolOpacity": 128,
-        "bridgingPointToolSize": 12,
-        "bridgingPointToolRadius" : 1, # The radius from a bridge point where the nearest edge of line layer is located, for the purpose of creating bridges between layers
-        "bridgingPointToolAddBridgePointsToMap": 0, # The conf value is not passed to the bridging tool class but is used in the current class (at least in this version)
-        "bridgingPointToolSameLayer" : 1, # 1 Allow same layer bridging. This does not keep a memory on which feature belonged to which original layer, and is lighter on computer resources
-        "bridgingPointToolAskBeforeDelete" :1, # Show a message box asking before deleting set bridging points
-        
-        "bridgingLineToolColorRed": 12,
-        "bridgingLineToolColorGreen": 0,
-        "bridgingLineToolColorBlue": 255,
-        "bridgingLineToolOpacity": 128,
-        "bridgingLineToolSize": 12,
-        "bridgingLineToolLineWidth" : 3,
-        "bridgingLineToolLineStyleIndex" : 0, # Qt::SolidLine - 1
-        "bridgingLineToolRadius" : 0, 
-        "bridgingLineToolAddBridgeLinesToMap": 0, 
-        "bridgingLineToolAskBeforeDelete" :1, # Show a message box asking before deleting set bridging points        
-                
-        "flexjLineToolColorRed" : 222,
-        "flexjLineToolColorGreen" : 155,
-        "flexjLineToolColorBlue" : 67,
-        "flexjLineToolOpacity" : 128,
-        "flexjLineToolMarkerSize" : 10,
-        "flexjLineToolLineWidth" : 3,
-        "flexjLineToolLineStyleIndex" : 2, # Qt::DashDotLine - 1     
-        "flexjLineToolShowDistance" : 1,
-        "flexjLineToolSlopingDistance" : 0,
-        "flexjLineToolAngleCorrection" : 0, # Difference in angle implementation of the QgsAnnotationPointTextItem.setAngle(). Do not know if it is related to the OS or to QGIS versions
-        "flexjLineToolShowTotalDistance" : 0,
-        "flexjLineToolDistanceDecimalDigits" : 2,
-        "flexjLineToolKeepBaseUnit" : 1,
-        
-        "featureLimitExtentIndex": 0, # 0 No limits
-        "maxNumFeaturesPerLayer" : 0,
-        "entryExitLengthLimit" : 0
-    }
+    factoryDefaultSettings = PluginSettings.factoryDefaultSettings
     
     defaultStartMarkerIcon = QgsVertexMarker.ICON_CIRCLE
     defaultEndMarkerIcon = QgsVertexMarker.ICON_BOX
@@ -172,7 +104,7 @@ class OnTheFlyShortestPath:
     # A list to hold the option items of the configuration dialog for distance units
     distanceUnits = ["meters", "Kilometers", "yards", "feet", "nautical miles", "miles"]
     # A list to hold the result units. Has the same order as the above list. 
-    resultUnitsList = ["m", "Km", "yd", "ft", "NM", "mi"]    
+    resultUnitsList = RoutingEngine.resultUnitsList
     # A list to hold same distance units but in the format that is identified by .QgsUnitTypes.decodeDistanceUnit() to allow unit conversion
     # See https://api.qgis.org/api/qgsunittypes_8cpp_source.html for allowed values
     encodedDistanceUnits = ["meters", "km", "yd", "feet", "nautical miles", "mi"]
@@ -181,8 +113,24 @@ class OnTheFlyShortestPath:
     snappingProviders = ["Plugin", "QGIS", "Both"]
     
     # A list of options to control the snapping of markers
-    snappingToolSnapMethods = ["None", "Vertex", "Segment"]
+    snappingToolSnapMethods = ["None", "Vertex", "Segment", "Network junction"]
     
+    # A list of the calculations of the calculate button
+    calculationModes = ["Shortest path", "Diverse pair", "K shortest paths", "Service area", "Nearest facility"]
+    CALCULATION_SHORTEST_PATH = 0
+    CALCULATION_DIVERSE_PAIR = 1
+    CALCULATION_K_SHORTEST_PATHS = 2
+    CALCULATION_SERVICE_AREA = 3
+    CALCULATION_NEAREST_FACILITY = 4
+
+    # The quantities that can limit the service area
+    serviceAreaLimitTypes = ["Length", "Fiber loss"]
+    SERVICE_AREA_LIMIT_LENGTH = 0
+    SERVICE_AREA_LIMIT_LOSS = 1
+
+    # Colors of the rubberbands of the routes other than the main route, e.g. the protection path of a diverse pair
+    alternativeRubberBandColors = [QColor(230, 120, 20, 160), QColor(40, 160, 60, 160), QColor(150, 60, 200, 160), QColor(200, 40, 120, 160), QColor(90, 90, 90, 160)]
+
     # A list of options to select to the behaviour on snapping to layers
     snappingToolSnappingBehaviours = ["All layers", "Selected layers", "Active layer"]
     
@@ -208,6 +156,16 @@ class OnTheFlyShortestPath:
     
     # A default name for the created temp layer
     resultLayerName = "shortestPath"
+    # The measurements appended to a result layer file are written to the file in batches of this size
+    resultLayerBatchSize = 10
+    # The number of the last measurements kept in the measurement cache
+    measurementCacheSize = 64
+    # A default name for the temp layer of the service area
+    serviceAreaLayerName = "serviceArea"
+    # A default name for the temp layer of the nearest facility assignment
+    nearestFacilityLayerName = "nearestFacility"
+    # The subscribers of the nearest facility assignment written between two checks of the cancel button
+    nearestFacilityChunkSize = 1000
     # A default name for the created merged temp layer
     mergedLayerName = "analysisLayer"
     # Default name for the bridging points layer
@@ -219,10 +177,19 @@ class OnTheFlyShortestPath:
     bridgingLinesMarkerLayerName = "bridgingLinesMarkerLayer"
     
     mapToolIsSet = False
+
+    # The configuration parameters on which the network graph depends. A change in any of them requires a new graph
+    networkGraphConfigKeys = ["topologyTolerance", "toleranceUnitsIndex", "bridgingPointToolSameLayer", "bridgingPointToolRadius", 
+                              "bridgingLineToolRadius", "featureLimitExtentIndex", "maxNumFeaturesPerLayer",
+                              "minimumLossRouting", "attenuationField", "spliceFlagField", "cableLoss", "spliceLoss", "countSplices", "addFeatureReport"]
     
     # HARD CODED NUMBER OF MARKERS. THIS IS NOT A USER DEFINED VARIABLE 
     # IT IS ASSOCIATED WITH DIALOG VISUAL ELEMENTS
     numMarkers = 5
+
+    # Maximum number of waypoints, start and end included, set with the flexjLine tool or taken from a point layer.
+    # The waypoints in excess of the markers of the dock dialog are kept in self.middleWaypoints
+    maxNumWaypoints = 100
     
     # The path to the html help file. It is also the source of the online page of github.fryktoria.io
     # Github Pages has been configured to render the content from /docs.
@@ -273,6 +240,10 @@ class OnTheFlyShortestPath:
         #self.layerSelectionDlg = uic.loadUi(os.path.join(self.plugin_dir, "./", "DlgLayerSelection.ui"))
         self.layerSelectionDlg = LayerSelectionDialog()
         self.layerSelectionDlg.modal = True        
+
+        # Load the form listing the routes of the k shortest paths
+        self.alternativeRoutesDlg = AlternativeRoutesDialog()
+        self.alternativeRoutesDlg.modal = False
        
         self.coordButtonClickedIndex = -1
 
@@ -286,6 +257,8 @@ class OnTheFlyShortestPath:
         
         # A list to store rubberbands
         self.rubberBands=[]
+        # Rubberbands of the routes other than the main route, e.g. the protection path of a diverse pair
+        self.alternativeRubberBands = []
         
         # A dictionary to store the analysis points.
         '''
@@ -300,6 +273,27 @@ class OnTheFlyShortestPath:
         Perhaps I should modify the marker structure to operate in a similar manner -> Done in 1.2.1
         '''
         self.pointsDict={}
+
+        # Middle waypoints that do not fit in the markers of the dock dialog, e.g. from the flexjLine tool or a point layer.
+        # They are visited after the middle markers of the dock dialog and before the end point
+        self.middleWaypoints = []
+        self.waypointMarkers = []
+        # The waypoints of the last calculation, in the order they have been visited
+        self.visitedWaypoints = []
+        # The id of the last route added to the map as a result layer. Relates the result layer to the table of the traversed features
+        self.lastRouteId = 0
+        # The layer id of the result layer and of the table of the traversed features, to which the measurements are appended,
+        # the result layer file of the result layer, and the number of the measurements not written to the file yet
+        self.resultLayerId = None
+        self.traversedFeaturesTableId = None
+        self.resultLayerSource = ""
+        self.pendingResults = 0
+        # The results of the last measurements on the current graph, so that measuring the same markers again is instant
+        self.measurementCache = MeasurementCache(self.measurementCacheSize)
+        # The time of the stages and the size of the input of the last calculation, shown in the results dialog
+        self.calculationTimer = StageTimer()
+        # The timer of the routing engines, see routingEngine()
+        self.stageTimer = self.calculationTimer
        
         # A dictionary to pass data to the results dialog
         self.resultsDict = {
@@ -319,6 +313,11 @@ class OnTheFlyShortestPath:
             "costOnGraphMeters" : 0,
             "exitCostMeters" : 0,
             "totalCostMeters" : 0,            
+            "cableLossOnGraph" : None, # Fiber loss from the attenuation of the traversed features, if available
+            "spliceCount" : None, # Splices counted on the path, if available
+            "bridgeCrossings" : None,
+            "traversedFeatures" : None, # Rows of the table of the traversed features, if requested
+            "alternatives" : [], # Results of the routes other than the main route, in the order of the alternative rubberbands
         }
         
         
@@ -344,22 +343,33 @@ class OnTheFlyShortestPath:
         # Instantiate a geometry object to use in all susequent actions
         self.geom = OtFSP_Geometry()
 
-        # Keep in the merged layer some data from the original layer (to be used e.g. for same layer bridging)  
-        self.originalLayerInfoFields = [ 
-                                         QgsField("layerno", QVariant.String),
-                                         #QgsField("layerid", QVariant.String), The following two fields could be activated if for any reason , the information needs to exist in the merged layer
-                                         #QgsField("featureid", QVariant.Double) 
-                                        ]
-     
+        # The graph of the analysis layer, reused as long as the layers and the configuration do not change
+        self.networkGraph = None
+        # The layers whose data changes invalidate the graph
+        self.networkGraphLayers = []
+
         # Read the stored settings from the QgsSettings mechanism 
         # In Windows could be C:\Users\<username>\AppData\Roaming\QGIS\QGIS3\profiles\default\QGIS\QGIS3.ini      
         self.readQgsSettings()
+
+        # The Processing provider of the algorithms, registered by initProcessing()
+        self.processingProvider = None
          
         return
 
 
+    def initProcessing(self) -> None:
+        ''' Called by QGIS, and by initGui() for older versions, to register the Processing algorithms '''
+        if self.processingProvider is None:
+            self.processingProvider = OnTheFlyProcessingProvider()
+            QgsApplication.processingRegistry().addProvider(self.processingProvider)
+        return
+
+
     def initGui(self):
     
+        self.initProcessing()
+
         # Hide the unit labels on the dock widget. I do not want to set them to null 
         # in Qt designer because I want everything to be visible to the developer
         self.dockDlg.lengthUnits.setText("")
@@ -380,7 +390,7 @@ class OnTheFlyShortestPath:
                                                 
         self.pointTool.canvasClicked.connect(self.display_point)
                 
-        self.flexjLineTool = MapToolFlexjLine(self.canvas, self.iface, self.numMarkers)
+        self.flexjLineTool = MapToolFlexjLine(self.canvas, self.iface, self.maxNumWaypoints)
         self.flexjLineTool.setSnappingToolParameters( 
                     snappingBehaviour = self.currentConfig["snappingToolSnappingBehaviourIndex"],
                     snappingMethod = self.currentConfig["snappingToolSnapMethod"],                
@@ -402,9 +412,11 @@ class OnTheFlyShortestPath:
                                                     decimalDigits = self.currentConfig["flexjLineToolDistanceDecimalDigits"],
                                                     distanceUnits = self.encodedDistanceUnits[self.currentConfig["distanceUnitsIndex"]],
                                                     keepBaseUnit = self.currentConfig["flexjLineToolKeepBaseUnit"],
-                                                    angleCorrection = self.currentConfig["flexjLineToolAngleCorrection"]   
+                                                    angleCorrection = self.currentConfig["flexjLineToolAngleCorrection"],
+                                                    showNetworkDistance = self.currentConfig["flexjLineToolShowNetworkDistance"]
                                                   )
         self.flexjLineTool.canvasClicked.connect(self.addRubberBandPoint)
+        self.flexjLineTool.setNetworkDistanceFunction(self.networkDistance)
         
         self.bridgingPointTool = BridgingPointTool(self.canvas, self.iface)
         # Set the same snapping parameters as the normal snapping tools. Avoid extra settings in the configuration dialog.
@@ -481,6 +493,10 @@ class OnTheFlyShortestPath:
         
         self.resultsDlg.OkButton.clicked.connect(self.on_resultsDlg_results_ok)
         self.resultsDlgNoFiber.OkButton.clicked.connect(self.on_resultsDlgNoFiber_results_ok)
+        self.resultsDlg.performanceButton.toggled.connect(self.on_resultsDlg_performance_toggled)
+        self.resultsDlgNoFiber.performanceButton.toggled.connect(self.on_resultsDlgNoFiber_performance_toggled)
+        self.resultsDlg.exportPerformanceButton.clicked.connect(self.on_results_export_performance_clicked)
+        self.resultsDlgNoFiber.exportPerformanceButton.clicked.connect(self.on_results_export_performance_clicked)
         
         # The configuration dialog does not have two independent buttons but a "buttonBox" with two visual buttons
         # where the entire buttonBox widget activates the accepted (click OK) and rejected (click cancel) events
@@ -494,6 +510,10 @@ class OnTheFlyShortestPath:
         self.configurationDlg.mQgsProjectionSelectionWidget.crsChanged.connect(self.on_configurationDlg_customCrsChange)
         
         self.markerCoordinatesDlg.closeButton.clicked.connect(self.on_markerCoordinatesDlg_closeButton)
+
+        self.alternativeRoutesDlg.closeButton.clicked.connect(self.on_alternativeRoutesDlg_closeButton)
+        self.alternativeRoutesDlg.routesTable.itemSelectionChanged.connect(self.showSelectedRoutes)
+        self.alternativeRoutesDlg.showAllRoutes.stateChanged.connect(self.showSelectedRoutes)
         
         # Identify when a new layer is added, removed, re-named to the project in order to re-populate the layers
         QgsProject.instance().layersAdded.connect(self.on_layer_tree_changed)
@@ -511,6 +531,9 @@ class OnTheFlyShortestPath:
         
         # Identify when the project CRS changes
         QgsProject.instance().crsChanged.connect(self.on_project_crsChanged)
+        # The cached measurement contexts depend on the project CRS and transform context
+        QgsProject.instance().crsChanged.connect(OtFSP_Geometry.clearMeasurementContexts)
+        QgsProject.instance().transformContextChanged.connect(OtFSP_Geometry.clearMeasurementContexts)
         #QgsProject.instance().ellipsoidChanged.connect(self.on_project_crsChanged)
                
         # Identify the condition where another toolset is activated, so that we must unpress all buttons of the dock dialog
@@ -564,6 +587,11 @@ class OnTheFlyShortestPath:
         self.canvas.unsetMapTool(self.flexjLineTool)
         self.canvas.unsetMapTool(self.bridgingPointTool)
         self.canvas.unsetMapTool(self.bridgingLineTool)
+        MapToolSnapToLayers.snappingIndexes.clear()
+        self.commitResultLayer()
+        if self.processingProvider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.processingProvider)
+            self.processingProvider = None
         return
  
  
@@ -575,10 +603,13 @@ class OnTheFlyShortestPath:
         conf = self.currentConfig
         factory = self.factoryDefaultSettings       
         # I need to cast the values to int or float.        
-        floats = ["topologyTolerance", "connectorLoss", "spliceLoss", "spliceFrequency", "cableLoss", "fixedLoss", "bridgingPointToolRadius", "bridgingLineToolRadius"]        
+        floats = ["topologyTolerance", "connectorLoss", "spliceLoss", "spliceFrequency", "cableLoss", "fixedLoss", "bridgingPointToolRadius", "bridgingLineToolRadius", "serviceAreaLimit"]
+        strings = ["attenuationField", "spliceFlagField", "reportFields", "facilityLayer", "batchOutputFile", "resultLayerFile"]
         for key in self.factoryDefaultSettings.keys(): 
             if key in floats:        
                 conf[key] = float(s.value(p + key, factory[key]))
+            elif key in strings:
+                conf[key] = str(s.value(p + key, factory[key])).strip()
             else:
                 conf[key] = int(s.value(p + key, factory[key]))
         return
@@ -622,6 +653,9 @@ class OnTheFlyShortestPath:
         self.setDlgCheckBox(dlg.includeStartStop, dict["includeStartStop"])
         self.setDlgCheckBox(dlg.addResultLayer, dict["addResultLayer"]) 
         self.setDlgCheckBox(dlg.addMergedLayer, dict["addMergedLayer"])
+        self.setDlgCheckBox(dlg.addFeatureReport, dict["addFeatureReport"])
+        dlg.reportFields.setText(dict["reportFields"])
+        dlg.resultLayerFile.setText(dict["resultLayerFile"])
 
            
         self.populateComboBox(dlg.distanceUnits, self.distanceUnits, dict["distanceUnitsIndex"])                   
@@ -646,6 +680,10 @@ class OnTheFlyShortestPath:
         dlg.spliceFrequency.setValue(dict["spliceFrequency"])
         dlg.cableLoss.setValue(dict["cableLoss"]) 
         dlg.fixedLoss.setValue(dict["fixedLoss"])
+        self.setDlgCheckBox(dlg.minimumLossRouting, dict["minimumLossRouting"])
+        dlg.attenuationField.setText(dict["attenuationField"])
+        dlg.spliceFlagField.setText(dict["spliceFlagField"])
+        self.setDlgCheckBox(dlg.countSplices, dict["countSplices"])
  
         self.populateComboBox(dlg.coordinateFormat, self.coordinateFormats, dict["coordinateFormatIndex"])
         
@@ -681,6 +719,7 @@ class OnTheFlyShortestPath:
         dlg.flexjLineToolDistanceDecimalDigits.setValue(dict["flexjLineToolDistanceDecimalDigits"])
         self.setDlgCheckBox(dlg.flexjLineToolKeepBaseUnit, dict["flexjLineToolKeepBaseUnit"])
         self.setDlgCheckBox(dlg.flexjLineToolAngleCorrection, dict["flexjLineToolAngleCorrection"])
+        self.setDlgCheckBox(dlg.flexjLineToolShowNetworkDistance, dict["flexjLineToolShowNetworkDistance"])
         
         currentBridgingPointToolColor = QColor(
                                         int(dict["bridgingPointToolColorRed"]), 
@@ -712,6 +751,15 @@ class OnTheFlyShortestPath:
         self.populateComboBox(dlg.featureLimitExtent, self.limitExtentOptions, dict["featureLimitExtentIndex"])
         dlg.maxNumFeaturesPerLayer.setValue(dict["maxNumFeaturesPerLayer"])
         dlg.entryExitLengthLimit.setValue(dict["entryExitLengthLimit"])
+        self.setDlgCheckBox(dlg.waypointsFromSelectedPoints, dict["waypointsFromSelectedPoints"])
+        self.setDlgCheckBox(dlg.optimizeWaypointOrder, dict["optimizeWaypointOrder"])
+        self.populateComboBox(dlg.calculationMode, self.calculationModes, dict["calculationModeIndex"])
+        self.setDlgCheckBox(dlg.diversePairNodeDisjoint, dict["diversePairNodeDisjoint"])
+        dlg.numberOfRoutes.setValue(dict["numberOfRoutes"])
+        self.populateComboBox(dlg.serviceAreaLimitType, self.serviceAreaLimitTypes, dict["serviceAreaLimitTypeIndex"])
+        dlg.serviceAreaLimit.setValue(dict["serviceAreaLimit"])
+        dlg.facilityLayer.setText(dict["facilityLayer"])
+        dlg.batchOutputFile.setText(dict["batchOutputFile"])
         
         return        
 
@@ -736,6 +784,9 @@ class OnTheFlyShortestPath:
         conf["includeStartStop"] = self.checkBoxCheckedValue(dlg.includeStartStop)
         conf["addResultLayer"] = self.checkBoxCheckedValue(dlg.addResultLayer) 
         conf["addMergedLayer"] = self.checkBoxCheckedValue(dlg.addMergedLayer)
+        conf["addFeatureReport"] = self.checkBoxCheckedValue(dlg.addFeatureReport)
+        conf["reportFields"] = dlg.reportFields.text().strip()
+        conf["resultLayerFile"] = dlg.resultLayerFile.text().strip()
 
         conf["distanceUnitsIndex"] = self.getComboBoxIndex(dlg.distanceUnits, self.distanceUnits)
         conf["toleranceUnitsIndex"] = self.getComboBoxIndex(dlg.toleranceUnits, self.distanceUnits)  
@@ -761,6 +812,10 @@ class OnTheFlyShortestPath:
         conf["spliceFrequency"] = dlg.spliceFrequency.value()
         conf["cableLoss"] = dlg.cableLoss.value() 
         conf["fixedLoss"] = dlg.fixedLoss.value() 
+        conf["minimumLossRouting"] = self.checkBoxCheckedValue(dlg.minimumLossRouting)
+        conf["attenuationField"] = dlg.attenuationField.text().strip()
+        conf["spliceFlagField"] = dlg.spliceFlagField.text().strip()
+        conf["countSplices"] = self.checkBoxCheckedValue(dlg.countSplices)
 
         conf["snappingToolSnappingProviderIndex"] = self.getComboBoxIndex(dlg.snappingToolSnappingProvider, self.snappingProviders)
         conf["snappingToolColorRed"] = dlg.snappingToolColor.color().red()
@@ -787,6 +842,7 @@ class OnTheFlyShortestPath:
         conf["flexjLineToolDistanceDecimalDigits"] = dlg.flexjLineToolDistanceDecimalDigits.value()
         conf["flexjLineToolKeepBaseUnit"] = self.checkBoxCheckedValue(dlg.flexjLineToolKeepBaseUnit)
         conf["flexjLineToolAngleCorrection"] = self.checkBoxCheckedValue(dlg.flexjLineToolAngleCorrection)
+        conf["flexjLineToolShowNetworkDistance"] = self.checkBoxCheckedValue(dlg.flexjLineToolShowNetworkDistance)
                  
         conf["bridgingPointToolColorRed"] = dlg.bridgingPointToolColor.color().red()
         conf["bridgingPointToolColorGreen"] = dlg.bridgingPointToolColor.color().green()
@@ -812,6 +868,15 @@ class OnTheFlyShortestPath:
         conf["featureLimitExtentIndex"] = self.getComboBoxIndex(dlg.featureLimitExtent, self.limitExtentOptions)
         conf["maxNumFeaturesPerLayer"] = dlg.maxNumFeaturesPerLayer.value()
         conf["entryExitLengthLimit"] = dlg.entryExitLengthLimit.value()
+        conf["waypointsFromSelectedPoints"] = self.checkBoxCheckedValue(dlg.waypointsFromSelectedPoints)
+        conf["optimizeWaypointOrder"] = self.checkBoxCheckedValue(dlg.optimizeWaypointOrder)
+        conf["calculationModeIndex"] = self.getComboBoxIndex(dlg.calculationMode, self.calculationModes)
+        conf["diversePairNodeDisjoint"] = self.checkBoxCheckedValue(dlg.diversePairNodeDisjoint)
+        conf["numberOfRoutes"] = dlg.numberOfRoutes.value()
+        conf["serviceAreaLimitTypeIndex"] = self.getComboBoxIndex(dlg.serviceAreaLimitType, self.serviceAreaLimitTypes)
+        conf["serviceAreaLimit"] = dlg.serviceAreaLimit.value()
+        conf["facilityLayer"] = dlg.facilityLayer.text().strip()
+        conf["batchOutputFile"] = dlg.batchOutputFile.text().strip()
         
         # Store to QGIS settings repository
         self.storeQgsSettings()
@@ -876,6 +941,7 @@ class OnTheFlyShortestPath:
         
         self.dockDlg.flexjLineButton.setStyleSheet(self.pushedButtonStyleSheet) 
         self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())        
+        self.prepareNetworkGraph()
         return
 
 
@@ -947,6 +1013,7 @@ class OnTheFlyShortestPath:
         self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
         self.bridgingPointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())       
         self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
+        self.invalidateNetworkGraph()
         
         return
 
@@ -1060,6 +1127,7 @@ class OnTheFlyShortestPath:
         self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
         self.bridgingPointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList()) 
         self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList()) 
+        self.invalidateNetworkGraph()
         return        
 
 
@@ -1087,7 +1155,8 @@ class OnTheFlyShortestPath:
         
         # Update with the current layers
         self.pointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
-        
+        self.prepareNetworkGraph()
+
         self.uncheckAllCoordinateButtons()           
         button.setChecked(True) 
         
@@ -1210,6 +1279,7 @@ class OnTheFlyShortestPath:
         
         self.uncheckAllCoordinateButtons()
         self.hideMarkers()
+        self.setMiddleWaypoints([])
 
         self.dockDlg.startCoordinatesButton.setStyleSheet(self.pushButtonOriginalStylesheet)
         self.dockDlg.middleCoordinatesButton.setStyleSheet(self.pushButtonOriginalStylesheet)
@@ -1223,6 +1293,7 @@ class OnTheFlyShortestPath:
         self.populateMarkerCoordinatesDialog()        
         self.selectedLineLayersIdList.clear()
         self.selectedPointLayersIdList.clear()
+        self.invalidateNetworkGraph()
 
         self.populateLayerSelector()
         return
@@ -1235,11 +1306,14 @@ class OnTheFlyShortestPath:
         #print("Starting calculation")         
 
         # Are we using the flexjLine tool?
-        flexjLineToolMarkers = self.flexjLineTool.getMarkerPoints()      
-        if len(flexjLineToolMarkers) >= 2: # at least start and end point
-            # Use the markers of the  flexjLine tool to update the marker dictionary            
-            self.pointsDict.clear()
-            self.updateCoordinateButtonsOnDictionary(flexjLineToolMarkers)  
+        flexjLineToolWaypoints = self.flexjLineTool.getMarkerPointList()      
+        if len(flexjLineToolWaypoints) >= 2: # at least start and end point
+            # Use the markers of the  flexjLine tool to update the marker dictionary and the middle waypoints          
+            self.setWaypoints(flexjLineToolWaypoints)
+        elif self.currentConfig["waypointsFromSelectedPoints"] == 1:
+            layerWaypoints = self.waypointsFromActiveLayer()
+            if len(layerWaypoints) >= 2:
+                self.setWaypoints(layerWaypoints)
         
         # Necessary if we use flexjLine tool or not        
         self.flexjLineTool.reset()
@@ -1247,14 +1321,19 @@ class OnTheFlyShortestPath:
         # Dialog may be open. Update with the new data        
         self.populateMarkerCoordinatesDialog()
             
+        calculationMode = self.currentConfig["calculationModeIndex"]
+        # The nearest facility assignment does not use the markers and the service area needs only the start point
+        usesMarkers = calculationMode != self.CALCULATION_NEAREST_FACILITY
+        usesEndMarker = calculationMode not in [self.CALCULATION_SERVICE_AREA, self.CALCULATION_NEAREST_FACILITY]
+
         # Make sure that we have at least a start and stop marker   
-        if  0 not in self.pointsDict: # start point exists
+        if  0 not in self.pointsDict and usesMarkers: # start point exists
             #print ("Invalid start coordinates")
             self.iface.messageBar().pushMessage("Error", "Invalid start coordinates", level=Qgis.Warning, duration=5)
             self.dockDlg.calculateButton.setStyleSheet(self.pushButtonOriginalStylesheet)
             return
     
-        if  (self.numMarkers - 1) not in self.pointsDict: # end point exists
+        if  (self.numMarkers - 1) not in self.pointsDict and usesEndMarker: # end point exists
             #print ("Invalid end coordinates")
             self.iface.messageBar().pushMessage("Error", "Invalid end coordinates", level=Qgis.Warning, duration=5)
             self.dockDlg.calculateButton.setStyleSheet(self.pushButtonOriginalStylesheet)
@@ -1287,7 +1366,12 @@ class OnTheFlyShortestPath:
             calcReturnValue = -2
         '''    
             
-        calcReturnValue = self.calculate(self.pointsDict)
+        if calculationMode == self.CALCULATION_SERVICE_AREA:
+            calcReturnValue = self.calculateServiceArea(self.pointsDict[0])
+        elif calculationMode == self.CALCULATION_NEAREST_FACILITY:
+            calcReturnValue = self.assignNearestFacilities()
+        else:
+            calcReturnValue = self.calculate(self.waypointsList())
         if calcReturnValue < 0:
             self.iface.messageBar().pushMessage("Warning", "No route found", level=Qgis.Warning, duration=3)
             self.dockDlg.resultLength.setText("No route found")
@@ -1322,6 +1406,11 @@ class OnTheFlyShortestPath:
         self.markerCoordinatesDlg.hide()
         self.dockDlg.eyeButton.setStyleSheet(self.pushButtonOriginalStylesheet)
         return
+
+
+    def on_alternativeRoutesDlg_closeButton(self) -> None:
+        self.alternativeRoutesDlg.hide()
+        return
         
         
     def on_configurationDlg_config_complete_ok(self) -> None:
@@ -1370,7 +1459,8 @@ class OnTheFlyShortestPath:
                                                     decimalDigits = self.currentConfig["flexjLineToolDistanceDecimalDigits"],
                                                     distanceUnits = self.encodedDistanceUnits[self.currentConfig["distanceUnitsIndex"]],
                                                     keepBaseUnit = self.currentConfig["flexjLineToolKeepBaseUnit"],
-                                                    angleCorrection = self.currentConfig["flexjLineToolAngleCorrection"]
+                                                    angleCorrection = self.currentConfig["flexjLineToolAngleCorrection"],
+                                                    showNetworkDistance = self.currentConfig["flexjLineToolShowNetworkDistance"]
                                                   )
                                         
         # Update snapping parameters and visuals for the bridging tool
@@ -1408,6 +1498,8 @@ class OnTheFlyShortestPath:
                                                         showTotalDistance = 0
                                                         )                                         
         self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())  
+        # The graph is rebuilt only if the configuration it depends on has changed
+        self.prepareNetworkGraph()
    
         self.populateMarkerCoordinatesDialog()
         if self.currentConfig["resultDialogTypeIndex"] == 1 or self.currentConfig["resultDialogTypeIndex"] == 3:
@@ -1501,6 +1593,8 @@ class OnTheFlyShortestPath:
 
         # Transform any bridging markers that have been set
         self.bridgingPointTool.changeCrs(QgsProject.instance().crs())
+        # The graph and its junctions refer to the previous CRS
+        self.invalidateNetworkGraph()
         return
  
  
@@ -1512,6 +1606,39 @@ class OnTheFlyShortestPath:
     def on_resultsDlgNoFiber_results_ok(self) -> None:
         self.resultsDlgNoFiber.hide()
         return
+
+
+    def on_resultsDlg_performance_toggled(self, checked:bool) -> None:
+        self.expandPerformanceSection(self.resultsDlg, checked)
+        return
+
+
+    def on_resultsDlgNoFiber_performance_toggled(self, checked:bool) -> None:
+        self.expandPerformanceSection(self.resultsDlgNoFiber, checked)
+        return
+
+
+    def expandPerformanceSection(self, dlg:QDialog, expand:bool) -> None:
+        ''' The results dialogs have a fixed size. The Performance section is below the bottom of the dialog, until the dialog is expanded '''
+        dlg.performanceButton.setArrowType(Qt.DownArrow if expand else Qt.RightArrow)
+        if expand:
+            dlg.setFixedHeight(dlg.exportPerformanceButton.geometry().bottom() + 6)
+        else:
+            dlg.setFixedHeight(dlg.performanceButton.geometry().bottom() + 6)
+        return
+
+
+    def on_results_export_performance_clicked(self) -> None:
+        ''' Saves the time of the stages and the size of the input of the last calculation as JSON '''
+        (fileName, fileFilter) = QFileDialog.getSaveFileName(None, "Export performance", "", "JSON files (*.json)")
+        if fileName == "":
+            return
+        try:
+            with open(fileName, "w") as f:
+                f.write(self.calculationTimer.toJson())
+        except:
+            self.iface.messageBar().pushMessage("Error", "Cannot write the file " + fileName, level=Qgis.Critical, duration=5)
+        return
         
          
     def uncheckAllCoordinateButtons(self) -> None:
@@ -1543,7 +1670,9 @@ class OnTheFlyShortestPath:
             return None        
        
           
-    def calculate(self, markerDictionary) -> int:
+    def calculate(self, waypoints:list) -> int:
+        ''' Calculates the route that visits the waypoints in the order of the list. Each leg is routed on the same graph '''
+        self.stageTimer = StageTimer()
 
         measureCrs = self.activeCrs() 
         if measureCrs is None:
@@ -1551,14 +1680,93 @@ class OnTheFlyShortestPath:
             return -1  
 
         # I need the marker data early, in order to calculate the extents of the merged layer
-        # Convert dict to a list, having only the values. I make sure the order is retained,
-        # so that I reference freely the i and the i+1 item
-        sortedPointsDict = dict(sorted(markerDictionary.items()))
-        pointsList = list(sortedPointsDict.values())
+        # The order of the list is the order of the visit, so that I reference freely the i and the i+1 item
+        pointsList = list(waypoints)
         ''' The coordinates stored when clicking the buttons are those of the Project CRS. We like this because we want to associated
             these values with what is shown on the current map. We need to transform coordinates if necessary '''  
         trPointsList = self.transformedPointsList(pointsList, self.projectCrs, measureCrs)     
        
+        previousGraph = self.networkGraph
+        networkGraph = self.getNetworkGraph(measureCrs, pointsList)
+        if networkGraph is None:
+            return -1
+        self.stageTimer.setCount("waypoints", len(pointsList))
+        self.stageTimer.setCount("features", networkGraph.pathLayer.featureCount())
+        self.stageTimer.setCount("vertices", networkGraph.graph.vertexCount())
+        self.stageTimer.setCount("edges", networkGraph.graph.edgeCount())
+        # The merge, the bridges and the build of the graph do not run when the graph is reused
+        self.stageTimer.setCount("graphReused", int(networkGraph is previousGraph))
+
+        engine = self.routingEngine()
+        d = engine.calculate(networkGraph, trPointsList, self.measurementCache)
+        self.pushEngineMessages(engine)
+        if d is None:
+            return -1
+
+        calculationMode = self.currentConfig["calculationModeIndex"]
+        # The waypoints in the order they have been visited, in the Project CRS
+        self.visitedWaypoints = [pointsList[i] for i in d["waypointOrder"]]
+        self.resultsDict.update(d)
+
+        with self.stageTimer.stage("rubberBands"):
+            for route in d["legRoutes"]:
+                self.rubberBands.append(self.createRouteRubberBand(measureCrs, route))
+            for i, alternative in enumerate(d["alternatives"]):
+                rb = self.createRouteRubberBand(measureCrs, alternative["route"], self.alternativeRubberBandColors[i % len(self.alternativeRubberBandColors)])
+                # The k shortest paths, besides the first, are shown when selected in the list of the routes
+                if calculationMode == self.CALCULATION_K_SHORTEST_PATHS:
+                    rb.hide()
+                self.alternativeRubberBands.append(rb)
+        self.stageTimer.stop()
+        self.calculationTimer = self.stageTimer
+        QgsMessageLog.logMessage("Calculation of " + self.stageTimer.started + "\n" + self.stageTimer.report(), self.pluginName, level=Qgis.Info)
+     
+        # Show length result in dockWidget
+        if self.currentConfig["includeStartStop"]:
+            self.dockDlg.resultLength.setText(self.formatLengthValue(self.resultsDict["totalCost"])) 
+        else:
+            self.dockDlg.resultLength.setText(self.formatLengthValue(self.resultsDict["costOnGraph"]))
+        self.dockDlg.lengthUnits.setText(self.resultsDict["lengthUnits"])
+        
+        # Show the fiber loss in dockWidget
+        if calculationMode == self.CALCULATION_DIVERSE_PAIR and len(d["alternatives"]) > 0:
+            self.resultsDict["note"] = self.routeSummary("Working", self.resultsDict) + "   " + self.routeSummary("Protection", self.resultsDict["alternatives"][0])
+            self.iface.messageBar().pushMessage("Info", self.resultsDict["note"], level=Qgis.Info, duration=10)
+        if self.currentConfig["includeStartStop"]:
+            self.dockDlg.fiberLoss.setText(self.formatLossValue(self.resultsDict["fiberTotalLoss"]))
+        else:
+            self.dockDlg.fiberLoss.setText(self.formatLossValue(self.resultsDict["fiberLossOnGraph"]))
+        self.dockDlg.fiberLossUnits.setText(self.resultsDict["fiberLossUnits"])
+        
+        # List the routes of the k shortest paths. The first route is shown until another one is selected
+        if calculationMode == self.CALCULATION_K_SHORTEST_PATHS:
+            self.populateAlternativeRoutesDialog()
+            self.alternativeRoutesDlg.show()
+            self.alternativeRoutesDlg.activateWindow()
+
+        # Show the results dialog, if configured to do so
+        if self.currentConfig["resultDialogTypeIndex"] == 3:
+            self.showResultDlg(self.resultsDlgNoFiber, self.resultsDict) 
+        elif self.currentConfig["resultDialogTypeIndex"] == 2:            
+            self.showResultDlg(self.resultsDlg, self.resultsDict)
+        
+        if self.currentConfig["addResultLayer"] == 1:
+            self.addRubberBandsToMap()
+        
+        # Update selected layer locators for all tools, so that after calculate, all tools will be ready to snap properly        
+        self.pointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList()) 
+        self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
+        self.bridgingPointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
+        self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
+        
+        return 0
+
+               
+    def preparePathLayer(self, pointsList = None):
+        ''' 
+        Returns a tuple (path layer, FeatureSources) where the path layer is the layer on which the graph is built. This is either the selected layer or a memory layer
+        merging the selected layers, with the bridges created by the bridging tools and the bridging point layers. Returns (None, None) on error
+        '''
         layersList = self.selectedLayersList() 
         layersListWithId = self.selectedLayersListWithId()
         
@@ -1600,22 +1808,22 @@ class OnTheFlyShortestPath:
 
         if num_layers < 1:
             self.iface.messageBar().pushMessage("Error", "One or more line layers must be selected...", level=Qgis.Critical, duration=5)
-            return -1  
+            return (None, None)  
         # I could add the parameter for the limit on the map canvas extent, so that I use the limits on the merged layer even if I only have one layer    
         elif num_layers == 1 and self.currentConfig["bridgingPointToolSameLayer"] == 0 and len(linesMarkerPointList) <= 0 and self.currentConfig["featureLimitExtentIndex"] == 0: 
             pathLayer = layersList[0]
+            featureSources = FeatureSources([pathLayer])
         else:
             # Note: I create the merged layer at the Project CRS, not the measure CRS
+            sourceIds = {}
             pathLayer = self.mergedMemoryLayer(self.projectCrs, layersListWithId, storeOriginalLayerInfo = not bool(self.currentConfig["bridgingPointToolSameLayer"]), 
                                                featureLimitExtentIndex = self.currentConfig["featureLimitExtentIndex"], pointsList = pointsList,
-                                               layerFeatureLimit = self.currentConfig["maxNumFeaturesPerLayer"]) 
+                                               layerFeatureLimit = self.currentConfig["maxNumFeaturesPerLayer"], sourceIds = sourceIds) 
             if pathLayer is None:
-                return -1
+                return (None, None)
+            featureSources = FeatureSources([layer for (layerId, layer) in layersListWithId], sourceIds)
             pointsLayerList.extend(self.selectedPointLayersList()) 
 
-            # Fuctionality for point layers used as bridges
-            bridge = BridgeLayer(self.iface)
-            
             # Add a new bridge point layer created from the on-the-fly bridge markers. The on-the-fly bridge layer is at the Project CRS          
             bridgingPoints = self.bridgingPointTool.markersAsPointsXY()
             if len(bridgingPoints) > 0:            
@@ -1628,202 +1836,468 @@ class OnTheFlyShortestPath:
 
             bridgingPointsToleranceMapUnits = self.toleranceToMapUnits(pathLayer.crs(), self.currentConfig["toleranceUnitsIndex"], self.currentConfig["bridgingPointToolRadius"]) 
             bridgingLinesToleranceMapUnits = self.toleranceToMapUnits(pathLayer.crs(), self.currentConfig["toleranceUnitsIndex"], self.currentConfig["bridgingLineToolRadius"])
-            bridge.setTolerance(bridgePointTolerance = bridgingPointsToleranceMapUnits, bridgeLineTolerance = bridgingLinesToleranceMapUnits)
-                       
             # NOTICE the not operator. We store original data only if we do not want same layer bridging            
-            bridge.setLayers( pointsLayerList, pathLayer, storeOriginalLayerInfo = not bool(self.currentConfig["bridgingPointToolSameLayer"]))
-            bridge.createBridges()
+            self.routingEngine().createBridges(pathLayer, pointsLayerList, bridgingPointsToleranceMapUnits, bridgingLinesToleranceMapUnits, 
+                                               storeOriginalLayerInfo = not bool(self.currentConfig["bridgingPointToolSameLayer"]))
             
             
         if pathLayer == None:
             self.iface.messageBar().pushMessage("Error", "Error getting/merging layer...", level=Qgis.Critical, duration=5)
-            return -1            
+            return (None, None)            
               
         if pathLayer.crs().authid() == "":
             self.iface.messageBar().pushMessage("Error", "Path layer does not have a valid CRS", level=Qgis.Critical, duration=5)
-            return -1
+            return (None, None)
         #print ("CRS of path layer: ", pathLayer.crs().authid())
 
-        entryCost = 0
-        costOnGraph = 0
-        exitCost = 0
-         
-        numPointPairs = len(trPointsList) - 1
-        for i in range(0,numPointPairs): 
-
-            if i == 0:
-                ''' First rubberband, from start point to next point which can either be a middle point or the end point
-                 If the second point is a middle point, calculate the point on graph nearest to the middle point (middlePointOnGraph)
-                 to be used in next iteration. '''
-                (rb, costs, middlePointOnGraph) = self.findRoute(measureCrs, pathLayer, trPointsList[i], trPointsList[i+1], self.currentConfig["includeStartStop"])
-            else:
-                # For the second rubberband, use the point on graph middlePointOnGraph calculated in the previous iteration
-                (rb, costs, middlePointOnGraph) = self.findRoute(measureCrs, pathLayer, middlePointOnGraph, trPointsList[i+1], False)
-                
-            if rb is None:
-                self.deleteRubberBands()
-                return -1 
-                
-            self.rubberBands.insert(i, rb) 
-            
-            # First pair
-            if i == 0:    
-                entryCost = costs["entryCost"]
-                
-            # Last pair. Note: can also be the first pair if middle point is not present            
-            if i == (numPointPairs - 1):    
-                costOnGraph += costs["costOnGraph"]
-                exitCost = costs["exitCost"]
-                # Final rubberband from the graph to the end point
-                if self.currentConfig["includeStartStop"]:
-                    self.rubberBands[i].addPoint(self.transformPointCoordinates(trPointsList[numPointPairs], measureCrs, self.projectCrs))
-              
-            # Between two middle points    
+        return (pathLayer, featureSources)
+
+
+    def networkGraphKey(self, measureCrs:QgsCoordinateReferenceSystem, pointsList = None) -> tuple:
+        ''' Returns a key of everything the graph depends on. A graph with the same key can be reused '''
+        key = [ measureCrs.authid() if measureCrs.authid() != "" else measureCrs.toWkt(),
+                self.projectCrs.authid(),
+                tuple(self.selectedLineLayersIdList),
+                tuple(self.selectedPointLayersIdList),
+                tuple((p.x(), p.y()) for p in self.bridgingPointTool.markersAsPointsXY()),
+                tuple(tuple((p.x(), p.y()) for p in line) for line in self.bridgingLineTool.lineVerticesList())
+              ]
+        for configKey in self.networkGraphConfigKeys:
+            key.append(self.currentConfig[configKey])
+        # The extent of the merged layer may depend on the canvas or on the markers
+        if self.currentConfig["featureLimitExtentIndex"] == 1:
+            key.append(self.iface.mapCanvas().extent().toString())
+        elif self.currentConfig["featureLimitExtentIndex"] in self.limitExtentIndexToScale and pointsList is not None:
+            key.append(tuple((p.x(), p.y()) for p in pointsList))
+        return tuple(key)
+
+
+    def getNetworkGraph(self, measureCrs:QgsCoordinateReferenceSystem, pointsList = None) -> NetworkGraph:
+        ''' Returns the cached graph if its input has not changed. Otherwise, prepares the analysis layer and builds a new graph '''
+        key = self.networkGraphKey(measureCrs, pointsList)
+        if self.networkGraph is not None and self.networkGraph.key == key:
+            return self.networkGraph
+
+        (pathLayer, featureSources) = self.preparePathLayer(pointsList)
+        if pathLayer is None:
+            return None
+
+        ''' An exception may occur if QGIS does not know how to make a transformation, e.g.
+               No transform is available between IAU_2015:200021660 - Kleopatra (2015) - Sphere / Ocentric / Tranverse Mercator and ESRI:102082 - Korea_2000_Korea_Central_Belt_2010.
+               Unknown error (code 4096)
+        '''
+        try:
+            topologyTolerance = self.toleranceToMapUnits(measureCrs, self.currentConfig["toleranceUnitsIndex"], self.currentConfig["topologyTolerance"])
+            graph = self.routingEngine().buildGraph(pathLayer, measureCrs, topologyTolerance, featureSources, key)
+        except:
+            self.iface.messageBar().pushMessage("Error", "The network graph could not be built", level=Qgis.Critical, duration=5)
+            return None
+
+        self.setNetworkGraph(graph)
+        return graph
+
+
+    def setNetworkGraph(self, graph:NetworkGraph) -> None:
+        ''' Caches the graph and passes it to the snapping tools. Any change in the data of the layers invalidates the graph '''
+        for layer in self.networkGraphLayers:
+            try:
+                layer.dataChanged.disconnect(self.invalidateNetworkGraph)
+            except:
+                # The layer has been deleted
+                pass
+        self.networkGraphLayers = []
+
+        self.networkGraph = graph
+        if graph is not None:
+            graph.setDisplayCrs(self.projectCrs, QgsProject.instance().transformContext())
+            for layer in self.selectedLayersList() + self.selectedPointLayersList():
+                layer.dataChanged.connect(self.invalidateNetworkGraph)
+                self.networkGraphLayers.append(layer)
+
+        for tool in [self.pointTool, self.flexjLineTool, self.bridgingPointTool, self.bridgingLineTool]:
+            tool.setJunctionIndex(graph)
+        return
+
+
+    def invalidateNetworkGraph(self) -> None:
+        self.setNetworkGraph(None)
+        return
+
+
+    def prepareNetworkGraph(self) -> None:
+        ''' 
+        When markers snap to the network junctions or the flexjLine tool shows the network distance, 
+        makes sure that the graph of the current layers exists 
+        '''
+        if self.currentConfig["snappingToolSnapMethod"] != MapToolSnapToLayers.MARKER_SNAPS_TO_NETWORK_JUNCTIONS and \
+           self.currentConfig["flexjLineToolShowNetworkDistance"] == 0:
+            return
+        if len(self.selectedLayersList()) < 1:
+            return
+        measureCrs = self.activeCrs()
+        if measureCrs is None:
+            return
+        # The build of the graph is not a stage of the last calculation
+        self.stageTimer = StageTimer()
+        self.getNetworkGraph(measureCrs)
+        return
+
+
+    def calculateServiceArea(self, startPoint:QgsPointXY) -> int:
+        ''' 
+        Draws the part of the network that is reachable from the start point within the length or the fiber loss limit of the configuration.
+        One search of dijkstra runs from the start point and stops at the limit. The edges that are partially reachable are cut at the limit.
+        The fiber loss of the edges is calculated with the parameters of calculateFiberLoss(). The exit connectors and, if the start point
+        is included, the entry to the network count in the limit 
+        '''
+        measureCrs = self.activeCrs() 
+        if measureCrs is None:
+            self.iface.messageBar().pushMessage("Error", "Invalid measure CRS", level=Qgis.Critical, duration=5)
+            return -1  
+
+        # The extent of the markers does not apply, because the reach of the service area is not known in advance
+        networkGraph = self.getNetworkGraph(measureCrs)
+        if networkGraph is None:
+            return -1
+
+        conf = self.currentConfig
+        trStartPoint = self.transformPointCoordinates(startPoint, self.projectCrs, measureCrs)
+        (graph, indexes, tiedPoints) = networkGraph.tiePoints([trStartPoint])
+        entryCost = self.geom.distanceP2P(measureCrs, trStartPoint, tiedPoints[0])
+
+        (metersPerUnit, conversionIndex, lengthUnits) = self.graphLengthUnits(measureCrs)
+        lengths = networkGraph.edgeCosts(graph, 0)
+
+        ''' The costs of the search are on the graph. A cost is converted to the units of the limit, counted from the start point, 
+            as (cost + costOffset) * costScale '''
+        if conf["serviceAreaLimitTypeIndex"] == self.SERVICE_AREA_LIMIT_LENGTH:
+            arcCosts = lengths
+            costOffset = entryCost if conf["includeStartStop"] else 0
+            costScale = self.geom.convertDistanceUnits(metersPerUnit, conversionIndex)
+            limitUnits = lengthUnits
+        else:
+            # The loss of the edges from the loss strategy of the graph, or from the length and the loss per Km of the configuration
+            if networkGraph.lossCriterion >= 0:
+                arcCosts = networkGraph.edgeCosts(graph, networkGraph.lossCriterion)
             else:
-                costOnGraph += costs["costOnGraph"]
-
-        # Get the details of the measurements, i.e. the distance units of the CRS
-        crsData = self.geom.crsDetails(measureCrs)          
-        self.resultsDict["ellipsoid"] = crsData[0] 
-        self.resultsDict["crs"] = crsData[1] + "/" + crsData[2] 
-        self.resultsDict["lengthUnits"] = crsData[3]
-
-        ''' We expect that the distance units returned by crsData[3] will be meters in order to make 
-            our conversions. Most CRS and associated ellipsoids' units are in meters or can be converted by QGIS from 
-            feet or other unit to meters. If not, or in case a CRS is not defined for the project,
-            we present a warning and return the values and units returnded by QgsDistanceArea class without conversion 
-            From 1.2.1, we convert to meters and use meters for fiber loss calculations    
-            
+                arcCosts = [length * metersPerUnit / 1000.0 * conf["cableLoss"] for length in lengths]
+            # The splices are estimated from the splice frequency, unless they are flagged on the features.
+            # The splices counted at the changes of feature depend on the path, so they cannot be counted by the search
+            if networkGraph.lossCriterion < 0 or conf["spliceFlagField"] == "" or conf["countSplices"] == 1:
+                arcCosts = [cost + self.spliceLoss(length * metersPerUnit) for cost, length in zip(arcCosts, lengths)]
+            costOffset = conf["connectorLoss"] * conf["numberOfConnectorsAtExit"]
+            if conf["includeStartStop"]:
+                entryMeters = entryCost * metersPerUnit
+                costOffset += conf["connectorLoss"] * conf["numberOfConnectorsAtEntry"] + self.spliceLoss(entryMeters) + entryMeters / 1000.0 * conf["cableLoss"]
+            if self.dockDlg.addFixedLoss.isChecked():
+                costOffset += conf["fixedLoss"]
+            costScale = 1.0
+            limitUnits = "db"
+
+        limitOnGraph = conf["serviceAreaLimit"] / costScale - costOffset
+        if limitOnGraph < 0:
+            self.iface.messageBar().pushMessage("Warning", "The limit of the service area is exceeded before the network is reached", level=Qgis.Warning, duration=5)
+            return -1
+        parts = networkGraph.graphPaths(graph).serviceArea(indexes[0], limitOnGraph, arcCosts)
+
+        # The reachable parts of the edges, as lines in the measure CRS, with the costs at their ends and their length
+        lines = []
+        partData = []
+        for (i, startCost, fraction) in parts:
+            edge = graph.edge(i)
+            p1 = graph.vertex(edge.fromVertex()).point()
+            p2 = graph.vertex(edge.toVertex()).point()
+            lines.append([p1, QgsPointXY(p1.x() + fraction * (p2.x() - p1.x()), p1.y() + fraction * (p2.y() - p1.y()))])
+            partData.append(((startCost + costOffset) * costScale, (startCost + fraction * arcCosts[i] + costOffset) * costScale, lengths[i] * fraction))
+        if conf["includeStartStop"]:
+            lines.append([trStartPoint, tiedPoints[0]])
+            partData.append((0, costOffset * costScale, entryCost))
+        partData = [(fromCost, toCost, self.geom.convertDistanceUnits(length * metersPerUnit, conversionIndex)) for (fromCost, toCost, length) in partData]
+
+        if measureCrs != self.projectCrs:
+            try:
+                tr = QgsCoordinateTransform(measureCrs, self.projectCrs, QgsProject.instance().transformContext())
+                lines = [[tr.transform(p) for p in line] for line in lines]
+            except:
+                self.iface.messageBar().pushMessage("Error", "Coordinate transformation of the service area failed", level=Qgis.Critical, duration=5)
+                return -1
+        rb = self.createRubberBand()
+        rb.setToGeometry(QgsGeometry.fromMultiPolylineXY(lines), None)
+        self.rubberBands.append(rb)
+
+        reachableLength = sum(length for (fromCost, toCost, length) in partData)
+        self.dockDlg.resultLength.setText(self.formatLengthValue(reachableLength))
+        self.dockDlg.lengthUnits.setText(lengthUnits)
+        self.dockDlg.fiberLoss.setText("")
+        self.iface.messageBar().pushMessage("Info", "Network reachable within " + str(conf["serviceAreaLimit"]) + " " + limitUnits + ": " 
+                                            + self.formatLengthValue(reachableLength) + " " + lengthUnits, level=Qgis.Info, duration=10)
+
+        if conf["addResultLayer"] == 1:
+            self.addServiceAreaLayer(lines, partData, limitUnits, lengthUnits)
+        return 0
+
+
+    def graphLengthUnits(self, measureCrs:QgsCoordinateReferenceSystem) -> tuple:
+        ''' 
+        Returns a tuple (meters per unit of the lengths of the graph, conversion index, units) for the conversion of the lengths of the graph 
+        to the result units, as calculate() does: the lengths are in meters and are converted, unless the CRS uses other units
         '''
-        if self.resultsDict["lengthUnits"] == "meters":
-            conversionIndex = self.currentConfig["distanceUnitsIndex"]
-            # From 1.0.4, we use the converted units
-            self.resultsDict["lengthUnits"] = self.resultUnitsList[self.currentConfig["distanceUnitsIndex"]]
-            
-            #1.2.1
-            # We store the results in meters to use in fiber loss calculations where attenuation is given as db/Km
-            self.resultsDict["entryCostMeters"] = entryCost
-            self.resultsDict["costOnGraphMeters"] = costOnGraph
-            self.resultsDict["exitCostMeters"] = exitCost
-            self.resultsDict["totalCostMeters"] = entryCost + costOnGraph + exitCost          
-            
-        else: 
-            # Not really sure if necessary. Probably setting the ellipsoid in QgsGraphBuilder(currentCrs, True, topologyTolerance, currentCrs.ellipsoidAcronym())
-            # defines an ellipsoidal measurement, which uses the metric system. QGIS documentation does not cover the issue.            
-            conversionIndex = -1
-            self.iface.messageBar().pushMessage("Warning", "Base distance unit is not meters but " + crsData[3] +". Unit conversion is taking place", level=Qgis.Warning, duration=5)
-            self.resultsDict["entryCostMeters"] = self.geom.lengthInMeters(entryCost, measureCrs)
-            self.resultsDict["costOnGraphMeters"] = self.geom.lengthInMeters(costOnGraph, measureCrs)
-            self.resultsDict["exitCostMeters"] = self.geom.lengthInMeters(exitCost, measureCrs)
-            self.resultsDict["totalCostMeters"] = self.resultsDict["entryCostMeters"] + self.resultsDict["costOnGraphMeters"] + self.resultsDict["exitCostMeters"]          
-                        
-        # Now that I have the entry and exit cost in meters, I will apply the limit check
-        entryExitLimit = float(self.currentConfig["entryExitLengthLimit"])
-        if self.currentConfig["entryExitLengthLimit"] != 0 and (entryCost > entryExitLimit or exitCost > entryExitLimit):
-            self.iface.messageBar().pushMessage("Warning", "Entry or exit cost is higher than the preset limit. Check the distance of the start/end marker from the entry/exit points of the path.", level=Qgis.Warning, duration=5)
+        crsData = self.geom.crsDetails(measureCrs)
+        if crsData[3] == "meters":
+            return (1.0, self.currentConfig["distanceUnitsIndex"], self.resultUnitsList[self.currentConfig["distanceUnitsIndex"]])
+        return (self.geom.lengthInMeters(1.0, measureCrs), -1, crsData[3])
 
 
-        
-        # Convert distances in the configuration selected units if the original unit is in meters, otherwise leave as is   
-        self.resultsDict["entryCost"] = self.geom.convertDistanceUnits(entryCost, conversionIndex)
-        self.resultsDict["costOnGraph"] = self.geom.convertDistanceUnits(costOnGraph, conversionIndex)
-        self.resultsDict["exitCost"] = self.geom.convertDistanceUnits(exitCost, conversionIndex)
-        self.resultsDict["totalCost"] = self.resultsDict["entryCost"] + self.resultsDict["costOnGraph"] + self.resultsDict["exitCost"]  
-     
-        # Show length result in dockWidget
-        if self.currentConfig["includeStartStop"]:
-            self.dockDlg.resultLength.setText(self.formatLengthValue(self.resultsDict["totalCost"])) 
+    def assignNearestFacilities(self) -> int:
+        ''' 
+        Assigns every point of the active layer (the selected points, or all of them if none is selected) to the nearest point 
+        of the facility layer by network length. The facilities and the subscribers are tied to the network together and one search 
+        of dijkstra runs from all the facilities at once, which labels every vertex of the graph with its nearest facility.
+        The assignment is added to the map as a layer with the path from the facility to each subscriber 
+        '''
+        conf = self.currentConfig
+        facilityLayer = None
+        for layer in QgsProject.instance().mapLayersByName(conf["facilityLayer"]):
+            if isinstance(layer, QgsVectorLayer) and layer.geometryType() == QgsWkbTypes.PointGeometry:
+                facilityLayer = layer
+                break
+        if facilityLayer is None:
+            self.iface.messageBar().pushMessage("Error", "The facility layer of the configuration is not a point layer of the project", level=Qgis.Critical, duration=5)
+            return -1
+        subscriberLayer = self.iface.activeLayer()
+        if not isinstance(subscriberLayer, QgsVectorLayer) or subscriberLayer.geometryType() != QgsWkbTypes.PointGeometry or subscriberLayer == facilityLayer:
+            self.iface.messageBar().pushMessage("Error", "The active layer must be the point layer of the subscribers", level=Qgis.Critical, duration=5)
+            return -1
+
+        measureCrs = self.activeCrs() 
+        if measureCrs is None:
+            self.iface.messageBar().pushMessage("Error", "Invalid measure CRS", level=Qgis.Critical, duration=5)
+            return -1  
+
+        facilities = self.layerPoints(facilityLayer, measureCrs)
+        subscribers = self.layerPoints(subscriberLayer, measureCrs, subscriberLayer.selectedFeatureCount() > 0)
+        if len(facilities) == 0 or len(subscribers) == 0:
+            self.iface.messageBar().pushMessage("Error", "There are no facilities or no subscribers", level=Qgis.Critical, duration=5)
+            return -1
+
+        # The extent of the markers does not apply
+        networkGraph = self.getNetworkGraph(measureCrs)
+        if networkGraph is None:
+            return -1
+
+        points = [point for (fid, point) in facilities + subscribers]
+        (graph, indexes, tiedPoints) = networkGraph.tiePoints(points)
+        if conf["includeStartStop"]:
+            entryCosts = [self.geom.distanceP2P(measureCrs, point, tiedPoint) for point, tiedPoint in zip(points, tiedPoints)]
         else:
-            self.dockDlg.resultLength.setText(self.formatLengthValue(self.resultsDict["costOnGraph"]))
-        self.dockDlg.lengthUnits.setText(self.resultsDict["lengthUnits"])
-        
-        # Calculate fiber loss parameters and show result in dockWidget
-        self.calculateFiberLoss()
-        if self.currentConfig["includeStartStop"]:
-            self.dockDlg.fiberLoss.setText(self.formatLossValue(self.resultsDict["fiberTotalLoss"]))
+            entryCosts = [0] * len(points)
+        numFacilities = len(facilities)
+        sources = [(indexes[i], entryCosts[i]) for i in range(numFacilities) if indexes[i] >= 0]
+        # The index of each source in the list of the facilities
+        sourceFacilities = [i for i in range(numFacilities) if indexes[i] >= 0]
+
+        graphPaths = networkGraph.graphPaths(graph)
+        (costs, predecessors, nearest) = graphPaths.nearestSources(sources, networkGraph.edgeCosts(graph, 0))
+
+        (metersPerUnit, conversionIndex, lengthUnits) = self.graphLengthUnits(measureCrs)
+        output = self.nearestFacilityOutput()
+        if output is None:
+            return -1
+        (writer, layer) = output
+        # One transformation for all the paths
+        tr = None
+        if measureCrs != self.projectCrs:
+            tr = QgsCoordinateTransform(measureCrs, self.projectCrs, QgsProject.instance().transformContext())
+
+        # Each subscriber is written as soon as its path is known, so that the memory does not grow with the number of subscribers
+        progress = QProgressDialog("Assigning the subscribers to the nearest facilities", "Cancel", 0, len(subscribers), self.iface.mainWindow())
+        progress.setWindowModality(Qt.WindowModal)
+        numAssigned = 0
+        numWritten = 0
+        features = []
+        for j, (subscriberId, subscriberPoint) in enumerate(subscribers):
+            if j % self.nearestFacilityChunkSize == 0:
+                if layer is not None and len(features) > 0:
+                    layer.dataProvider().addFeatures(features)
+                    features = []
+                progress.setValue(j)
+                if progress.wasCanceled():
+                    break
+            numWritten += 1
+            idx = indexes[numFacilities + j]
+            if idx < 0 or nearest[idx] < 0:
+                (geometry, attributes) = (None, [subscriberId, None, None, None])
+            else:
+                (facilityVertex, facilityCost) = sources[nearest[idx]]
+                (facilityId, facilityPoint) = facilities[sourceFacilities[nearest[idx]]]
+                line = [graph.vertex(facilityVertex).point()] + [graph.vertex(graph.edge(i).toVertex()).point() for i in graphPaths.pathTo(predecessors, facilityVertex, idx)]
+                length = costs[idx]
+                if conf["includeStartStop"]:
+                    line = [facilityPoint] + line + [subscriberPoint]
+                    length += entryCosts[numFacilities + j]
+                geometry = QgsGeometry.fromPolylineXY(line)
+                if tr is not None:
+                    geometry.transform(tr)
+                attributes = [subscriberId, facilityId, self.geom.convertDistanceUnits(length * metersPerUnit, conversionIndex), lengthUnits]
+                numAssigned += 1
+
+            if writer is not None:
+                try:
+                    writer.addFeature(geometry, attributes)
+                except:
+                    self.iface.messageBar().pushMessage("Error", "The batch output file could not be written", level=Qgis.Critical, duration=5)
+                    progress.close()
+                    return -1
+            else:
+                feature = QgsFeature(layer.fields())
+                if geometry is not None:
+                    feature.setGeometry(geometry)
+                feature.setAttributes(attributes)
+                features.append(feature)
+        progress.close()
+        if layer is not None and len(features) > 0:
+            layer.dataProvider().addFeatures(features)
+        # The subscribers written before a cancel are kept
+        self.addNearestFacilityLayer(writer, layer)
+
+        self.dockDlg.resultLength.setText("")
+        self.dockDlg.fiberLoss.setText("")
+        message = str(numAssigned) + " of " + str(len(subscribers)) + " subscribers assigned to " + str(len(facilities)) + " facilities"
+        if numWritten < len(subscribers):
+            self.iface.messageBar().pushMessage("Warning", message + ". The assignment has been canceled", level=Qgis.Warning, duration=10)
+        elif numAssigned < len(subscribers):
+            self.iface.messageBar().pushMessage("Warning", message + ". The rest cannot reach a facility on the network", level=Qgis.Warning, duration=10)
         else:
-            self.dockDlg.fiberLoss.setText(self.formatLossValue(self.resultsDict["fiberLossOnGraph"]))
-        self.dockDlg.fiberLossUnits.setText(self.resultsDict["fiberLossUnits"])
-        
-        # Show the results dialog, if configured to do so
-        if self.currentConfig["resultDialogTypeIndex"] == 3:
-            self.showResultDlg(self.resultsDlgNoFiber, self.resultsDict) 
-        elif self.currentConfig["resultDialogTypeIndex"] == 2:            
-            self.showResultDlg(self.resultsDlg, self.resultsDict)
-        
-        if self.currentConfig["addResultLayer"] == 1:
-            self.addRubberBandsToMap()
-        
-        # Update selected layer locators for all tools, so that after calculate, all tools will be ready to snap properly        
-        self.pointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList()) 
-        self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
-        self.bridgingPointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
-        self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
-        
+            self.iface.messageBar().pushMessage("Info", message, level=Qgis.Info, duration=10)
         return 0
 
-               
-    def findRoute(self, currentCrs:QgsCoordinateReferenceSystem, pathLayer:QgsVectorLayer, fromPoint:QgsPointXY, toPoint:QgsPointXY, addStartPoint = False) -> None:
-        ''' Runs dijkstra and create the rubberbands ''' 
-        
-        ''' An exception may occur if QGIS does not know how to make a transformation, e.g.
-               No transform is available between IAU_2015:200021660 - Kleopatra (2015) - Sphere / Ocentric / Tranverse Mercator and ESRI:102082 - Korea_2000_Korea_Central_Belt_2010.
-               Unknown error (code 4096)
+
+    def layerPoints(self, layer:QgsVectorLayer, crs:QgsCoordinateReferenceSystem, selectedOnly:bool = False) -> list:
+        ''' Returns a list of (feature id, point) of the features of a point layer, with the points transformed to the CRS. A multipoint gives its first point '''
+        if selectedOnly:
+            features = layer.selectedFeatures()
+        else:
+            features = layer.getFeatures(QgsFeatureRequest().setNoAttributes())
+        ids = []
+        points = []
+        for feature in features:
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            ids.append(feature.id())
+            if geometry.isMultipart():
+                points.append(geometry.asMultiPoint()[0])
+            else:
+                points.append(geometry.asPoint())
+        return list(zip(ids, self.transformedPointsList(points, layer.crs(), crs)))
+
+
+    def nearestFacilityOutput(self):
+        ''' 
+        Returns a tuple (writer, layer) where the nearest facility assignment is written, one feature per subscriber, with the path from its facility.
+        The writer of the batch output file of the configuration writes the features in chunks, or, without an output file, the features are added 
+        to the temp layer. The other item is None. Returns None if the output cannot be created
         '''
-        try:
-            director = QgsVectorLayerDirector(pathLayer, -1, '', '', '', QgsVectorLayerDirector.DirectionBoth)
-            strategy = QgsNetworkDistanceStrategy()
-            director.addStrategy(strategy)
-       
-            topologyTolerance = self.toleranceToMapUnits(currentCrs, self.currentConfig["toleranceUnitsIndex"], self.currentConfig["topologyTolerance"])
-            builder = QgsGraphBuilder(currentCrs, True, topologyTolerance, currentCrs.ellipsoidAcronym())
-            
-        except:
-            return(None, None, None)
-        
-        # These are the coordinates of the points on the line that are closest to the start and stop points
-        tiedPoints = director.makeGraph(builder, [fromPoint, toPoint])
-        tStart, tStop = tiedPoints
-        #print("Tied points on the line:", tiedPoints)
-
-        graph = builder.graph()
-        idxStart = graph.findVertex(tStart)
-        idxEnd = graph.findVertex(tStop)
-        (tree, costs) = QgsGraphAnalyzer.dijkstra(graph, idxStart, 0)
-        #print(idxStart, idxEnd, tStart, tStop, tree[idxEnd])
-        if tree[idxEnd] == -1:
-            #print('No route!')            
-            return(None, None, None)
-
-        # Measure the distance from the start and stop point to the entry and exit point of the graph
-        entry_cost = self.geom.distanceP2P(currentCrs, fromPoint, tStart)      
-        exit_cost = self.geom.distanceP2P(currentCrs, tStop, toPoint)
-
-        # set all results to a dictionary to be used by calling function
-        analysis_results = {
-            "entryCost": entry_cost,
-            "costOnGraph": costs[idxEnd],
-            "exitCost": exit_cost,
-        }            
-
-        # Add last point
-        route = [graph.vertex(idxEnd).point()]
-
-        # Iterate the graph
-        while idxEnd != idxStart:
-            idxEnd = graph.edge(tree[idxEnd]).fromVertex()
-            route.insert(0, graph.vertex(idxEnd).point())
+        fields = QgsFields()
+        for field in [  QgsField("subscriber", QVariant.LongLong),
+                        QgsField("facility", QVariant.LongLong),
+                        QgsField("length", QVariant.Double),
+                        QgsField("lengthunits", QVariant.String)
+                     ]:
+            fields.append(field)
+
+        outputFile = self.currentConfig["batchOutputFile"]
+        if outputFile != "":
+            if os.path.exists(outputFile) and self.askUser("The batch output file exists", "Replace " + outputFile + "?") != QMessageBox.Ok:
+                return None
+            try:
+                writer = RouteWriter(outputFile, self.nearestFacilityLayerName, fields, self.projectCrs, self.nearestFacilityChunkSize)
+            except:
+                self.iface.messageBar().pushMessage("Error", "The batch output file could not be written", level=Qgis.Critical, duration=5)
+                return None
+            return (writer, None)
+
+        layer = self.createMemLayer(self.nearestFacilityLayerName, QgsProject.instance().crs(), fields = fields)
+        if layer is None:
+            return None
+        return (None, layer)
+
+
+    def addNearestFacilityLayer(self, writer:RouteWriter, layer:QgsVectorLayer) -> None:
+        ''' Adds to the map the layer of the nearest facility assignment, after the features have been written to the output of nearestFacilityOutput() '''
+        if writer is not None:
+            try:
+                writer.close()
+            except:
+                self.iface.messageBar().pushMessage("Error", "The batch output file could not be written", level=Qgis.Critical, duration=5)
+                return
+            (uri, provider) = writer.layerSource()
+            QgsProject.instance().addMapLayer(QgsVectorLayer(uri, self.nearestFacilityLayerName, provider))
+            return
+
+        layer.updateExtents()
+        QgsProject.instance().addMapLayer(layer)
+        return
+
+
+    def addServiceAreaLayer(self, lines:list, partData:list, costUnits:str, lengthUnits:str) -> None:
+        ''' Adds a temp layer with one feature per reachable part of the service area, with the costs at its two ends and its length '''
+        fields = QgsFields()
+        for field in [  QgsField("fromcost", QVariant.Double),
+                        QgsField("tocost", QVariant.Double),
+                        QgsField("costunits", QVariant.String),
+                        QgsField("length", QVariant.Double),
+                        QgsField("lengthunits", QVariant.String)
+                     ]:
+            fields.append(field)
+        layer = self.createMemLayer(self.serviceAreaLayerName, QgsProject.instance().crs(), fields = fields)
+        if layer is None:
+            return
+
+        features = []
+        for line, (fromCost, toCost, length) in zip(lines, partData):
+            feature = QgsFeature(fields)
+            feature.setGeometry(QgsGeometry.fromPolylineXY(line))
+            feature.setAttribute("fromcost", fromCost)
+            feature.setAttribute("tocost", toCost)
+            feature.setAttribute("costunits", costUnits)
+            feature.setAttribute("length", length)
+            feature.setAttribute("lengthunits", lengthUnits)
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        QgsProject.instance().addMapLayer(layer)
+        return
+
+
+    def networkDistance(self, fromPoint:QgsPointXY, toPoint:QgsPointXY) -> float:
+        ''' 
+        Returns the network distance in meters between two points of the map canvas, using the cached graph, or -1 if it is not available 
+        or a point is not within the snapping tolerance of a vertex of the graph. The lengths of the graph are converted to meters as calculate() does
+        '''
+        if self.networkGraph is None:
+            return -1
+        tolerance = self.flexjLineTool.tolerance if self.flexjLineTool.tolerance is not None else self.flexjLineTool.updateTolerance()
+        cost = self.networkGraph.networkDistance(fromPoint, toPoint, tolerance)
+        if cost < 0:
+            return -1
+        (metersPerUnit, conversionIndex, lengthUnits) = self.graphLengthUnits(self.networkGraph.crs)
+        return cost * metersPerUnit
+
+
+    def createRouteRubberBand(self, currentCrs:QgsCoordinateReferenceSystem, route:list, color:QColor = None) -> QgsRubberBand:
+        ''' Creates the rubberband of a route, given as (x, y) coordinates in currentCrs '''
         rb = self.createRubberBand()
+        if color is not None:
+            rb.setColor(color)
 
         ''' I need to transform to the map coordinates in order to draw
          To avoid checking CRSs for every point, a programming ugly method is below.
          Yet, I prefer to save system resources and be faster, if possible '''         
         # Update: Since the merged layer and the calculations are only done in the projectCRS, the transdformations below are now reduntant. I am just keeping it in case I use this with a different CRS. 
         if currentCrs == self.projectCrs:
-            if addStartPoint:
-                rb.addPoint(fromPoint)             
-            for p in route:
-                rb.addPoint(p)                 
+            for (x, y) in route:
+                rb.addPoint(QgsPointXY(x, y))                 
         else: 
             ''' Create a transformation instance to be used for subsequent point transformations
             The creation of this instance is heavy on system resources and causes unnecessary delays, 
@@ -1835,12 +2309,10 @@ class OnTheFlyShortestPath:
                 #use something that will not probably fail, to allow the subsequent .transform() operations
                 tr = QgsCoordinateTransform(QgsProject.instance().crs(), QgsProject.instance().crs(), QgsProject.instance().transformContext())
             
-            if addStartPoint:
-                rb.addPoint(tr.transform(fromPoint))             
-            for p in route:
-                rb.addPoint(tr.transform(p))  
+            for (x, y) in route:
+                rb.addPoint(tr.transform(QgsPointXY(x, y)))  
               
-        return (rb, analysis_results, tStop)
+        return rb
 
     
     def createRubberBand(self) -> QgsRubberBand:
@@ -1858,9 +2330,12 @@ class OnTheFlyShortestPath:
 
 
     def deleteRubberBands(self) -> None:
-        for rb in self.rubberBands:
+        for rb in self.rubberBands + self.alternativeRubberBands:
             self.canvas.scene().removeItem(rb)       
         self.rubberBands.clear()               
+        self.alternativeRubberBands.clear()
+        # The listed routes do not exist any more
+        self.alternativeRoutesDlg.routesTable.setRowCount(0)
         return            
 
 
@@ -1875,6 +2350,8 @@ class OnTheFlyShortestPath:
         for rb in self.rubberBands:
             rb.setColor(rubberBandColor)
             rb.setWidth(self.currentConfig["rubberBandSize"]) 
+        for rb in self.alternativeRubberBands:
+            rb.setWidth(self.currentConfig["rubberBandSize"]) 
         return            
        
 
@@ -1912,17 +2389,85 @@ class OnTheFlyShortestPath:
                               int(self.currentConfig["markerColorBlue"]),
                               int(self.currentConfig["markerOpacity"])
                             )      
-        for m in self.markers:
+        for m in self.markers + self.waypointMarkers:
             m.setColor(markerColor)
             m.setFillColor(markerColor)
             m.setIconSize(self.currentConfig["markerSize"])           
         return
+
+
+    def setMiddleWaypoints(self, points:list) -> None:
+        ''' Sets the middle waypoints that are visited after the middle markers of the dock dialog, and shows a marker for each one '''
+        for m in self.waypointMarkers:
+            self.canvas.scene().removeItem(m)
+        self.waypointMarkers.clear()
+        self.middleWaypoints = list(points)
+
+        markerColor = QColor(
+                              int(self.currentConfig["markerColorRed"]), 
+                              int(self.currentConfig["markerColorGreen"]), 
+                              int(self.currentConfig["markerColorBlue"]),
+                              int(self.currentConfig["markerOpacity"])
+                            )      
+        for p in self.middleWaypoints:
+            m = QgsVertexMarker(self.canvas)
+            m.setIconType(self.defaultMiddleMarkerIcon)
+            m.setColor(markerColor)
+            m.setFillColor(markerColor)
+            m.setIconSize(self.currentConfig["markerSize"])
+            m.setCenter(p)
+            self.waypointMarkers.append(m)
+        return
+
+
+    def setWaypoints(self, points:list) -> None:
+        ''' 
+        Sets the start, end and any number of middle waypoints from a list of points in the Project CRS.
+        Start and end are assigned to the dock dialog buttons and all middle points become middle waypoints
+        '''
+        self.pointsDict.clear()
+        self.updateCoordinateButtonsOnDictionary({0: points[0], self.numMarkers - 1: points[-1]})
+        self.setMiddleWaypoints(points[1:-1])
+        return
+
+
+    def waypointsList(self) -> list:
+        ''' 
+        Returns the points in the order they are visited: the start point, the middle markers of the dock dialog, 
+        the middle waypoints and the end point 
+        '''
+        dockMiddlePoints = [self.pointsDict[key] for key in sorted(self.pointsDict.keys()) if key != 0 and key != self.numMarkers - 1]
+        waypoints = dockMiddlePoints + self.middleWaypoints
+        if 0 in self.pointsDict:
+            waypoints.insert(0, self.pointsDict[0])
+        if (self.numMarkers - 1) in self.pointsDict:
+            waypoints.append(self.pointsDict[self.numMarkers - 1])
+        return waypoints
+
+
+    def waypointsFromActiveLayer(self) -> list:
+        ''' Returns the selected points of the active layer in the order of their feature ids, transformed to the Project CRS '''
+        layer = self.iface.activeLayer()
+        if not isinstance(layer, QgsVectorLayer) or layer.geometryType() != QgsWkbTypes.PointGeometry:
+            return []
+        points = []
+        for feature in sorted(layer.selectedFeatures(), key = lambda f: f.id()):
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            if geometry.isMultipart():
+                points.append(geometry.asMultiPoint()[0])
+            else:
+                points.append(geometry.asPoint())
+            if len(points) >= self.maxNumWaypoints:
+                self.iface.messageBar().pushMessage("Warning", "Only the first " + str(self.maxNumWaypoints) + " selected points are used as waypoints", level=Qgis.Warning, duration=5)
+                break
+        return self.transformedPointsList(points, layer.crs(), self.projectCrs)
  
 
     def spliceLoss(self, length:float) -> float:
         ''' Returns the splice loss of a length of fiber cable (in meters), given the configuration data '''      
-        spliceLoss = length / 1000.0 / self.currentConfig["spliceFrequency"] * self.currentConfig["spliceLoss"] if self.currentConfig["spliceFrequency"] != 0 else 0
-        return spliceLoss
+        return FiberLoss(self.currentConfig).spliceLoss(length)
         
     
     def formatLengthValue(self, length:float) -> str:
@@ -1939,33 +2484,86 @@ class OnTheFlyShortestPath:
         return str(floatFormat%loss)
         
     
-    def calculateFiberLoss(self) -> None:
+    def routeSummary(self, name:str, d:dict) -> str:
+        ''' Returns a line with the length and the fiber loss of a route, as shown in the dock widget '''
+        (length, loss) = self.displayedLengthAndLoss(d)
+        summary = name + ": " + length
+        if loss != "":
+            summary += ", " + loss
+        return summary
+
+
+    def displayedLengthAndLoss(self, d:dict):
+        ''' Returns the length and the fiber loss of a route as shown in the dock widget, formatted with their units. The loss is empty if it is not shown '''
+        if self.currentConfig["includeStartStop"]:
+            length, loss = d["totalCost"], d["fiberTotalLoss"]
+        else:
+            length, loss = d["costOnGraph"], d["fiberLossOnGraph"]
+        if self.currentConfig["resultDialogTypeIndex"] == 1 or self.currentConfig["resultDialogTypeIndex"] == 3:
+            return (self.formatLengthValue(length) + " " + d["lengthUnits"], "")
+        return (self.formatLengthValue(length) + " " + d["lengthUnits"], self.formatLossValue(loss) + " " + d["fiberLossUnits"])
+
+
+    def populateAlternativeRoutesDialog(self) -> None:
+        ''' Lists the main route and the alternative routes, with the color of their rubberbands, and selects the main route '''
+        table = self.alternativeRoutesDlg.routesTable
+        routes = [self.resultsDict] + self.resultsDict["alternatives"]
+        colors = [self.rubberBands[0].strokeColor()] + [rb.strokeColor() for rb in self.alternativeRubberBands]
+        table.blockSignals(True)
+        table.setRowCount(len(routes))
+        for row, d in enumerate(routes):
+            (length, loss) = self.displayedLengthAndLoss(d)
+            routeItem = QTableWidgetItem(str(row + 1))
+            routeItem.setBackground(colors[row])
+            table.setItem(row, 0, routeItem)
+            table.setItem(row, 1, QTableWidgetItem(length))
+            table.setItem(row, 2, QTableWidgetItem(loss))
+        table.selectRow(0)
+        table.blockSignals(False)
+        self.showSelectedRoutes()
+        return
+
+
+    def showSelectedRoutes(self) -> None:
+        ''' Shows the rubberband of the route selected in the alternative routes dialog and hides the others, unless all routes are shown '''
+        dlg = self.alternativeRoutesDlg
+        if dlg.routesTable.rowCount() == 0:
+            return
+        rows = [index.row() for index in dlg.routesTable.selectionModel().selectedRows()]
+        selectedRow = rows[0] if len(rows) > 0 else 0
+        showAll = dlg.showAllRoutes.isChecked()
+        # Row 0 is the main route, which may have one rubberband per leg
+        routeRubberBands = [self.rubberBands] + [[rb] for rb in self.alternativeRubberBands]
+        for row, rubberBands in enumerate(routeRubberBands):
+            for rb in rubberBands:
+                if showAll or row == selectedRow:
+                    rb.show()
+                else:
+                    rb.hide()
+        return
+
+
+    def calculateFiberLoss(self, d:dict = None) -> None:
         ''' Runs after the results dictionary has been populated with the proper lengths.
-            Adjustment is made with the division of length by 1000.0 because the cinfiguration parameters are in db/Km   '''
-        d = self.resultsDict
-        
-        conectorLossAtEntry = (self.currentConfig["connectorLoss"] * self.currentConfig["numberOfConnectorsAtEntry"])
-        conectorLossAtExit = (self.currentConfig["connectorLoss"] * self.currentConfig["numberOfConnectorsAtExit"])
-             
-        d["fiberLossEntry"] = conectorLossAtEntry \
-                              + self.spliceLoss(d["entryCostMeters"]) \
-                              + d["entryCostMeters"] /1000.0 * self.currentConfig["cableLoss"] 
-        
-        d["fiberLossExit"] = conectorLossAtExit \
-                             + self.spliceLoss(d["exitCostMeters"]) \
-                             + d["exitCostMeters"] /1000.0 * self.currentConfig["cableLoss"] 
-                                                        
-        d["fiberLossOnGraph"] =  d["costOnGraphMeters"] / 1000.0 * self.currentConfig["cableLoss"] \
-                                 + self.spliceLoss(d["costOnGraphMeters"]) 
-        
-        if self.dockDlg.addFixedLoss.isChecked():
-            d["fiberLossOnGraph"]  += self.currentConfig["fixedLoss"]
-               
-        d["fiberTotalLoss"] = d["fiberLossEntry"] + d["fiberLossOnGraph"] + d["fiberLossExit"]
+            Updates self.resultsDict, unless another results dictionary is given   '''
+        if d is None:
+            d = self.resultsDict
         
         ''' Although the fiberLossUnits is set in the initial configuration and it is not foreseen to be changed,
-            this is the place to set it properly, potentially depending on the calculations above '''        
-        d["fiberLossUnits"] = "db"        
+            FiberLoss is the place to set it properly, potentially depending on the calculations '''        
+        self.routingEngine().calculateFiberLoss(d)
+        return
+
+
+    def routingEngine(self) -> RoutingEngine:
+        ''' Returns the engine of the routes, with the current configuration '''
+        return RoutingEngine(self.currentConfig, self.dockDlg.addFixedLoss.isChecked(), self.stageTimer)
+
+
+    def pushEngineMessages(self, engine:RoutingEngine) -> None:
+        ''' Shows in the message bar the messages of the last calculation of the engine '''
+        for (title, message, level) in engine.messages:
+            self.iface.messageBar().pushMessage(title, message, level=level, duration=5)
         return
     
     
@@ -2001,8 +2599,12 @@ class OnTheFlyShortestPath:
         dlg.ellipsoidTxt.setText(d["ellipsoid"])
         dlg.crsTxt.setText(d["crs"])
         
-        # Keep for future use
-        dlg.errorTxt.setText("")
+        # Notes on the calculation, e.g. the protection path of a diverse pair
+        dlg.errorTxt.setText(d.get("note", ""))
+
+        ''' Performance section, collapsed until the user expands it '''
+        dlg.performanceTxt.setPlainText(self.calculationTimer.report())
+        self.expandPerformanceSection(dlg, dlg.performanceButton.isChecked())
         
         # exec() is required instead of show() to make the result window modal. 
         # The setting in Qt Designer does not work
@@ -2045,6 +2647,8 @@ class OnTheFlyShortestPath:
                 self.dockDlg.startCoordinatesTextbox.setText(self.formatPointCoordinates(trPoint)) 
             elif key == (self.numMarkers - 1):
                 self.dockDlg.endCoordinatesTextbox.setText(self.formatPointCoordinates(trPoint))
+
+        self.setMiddleWaypoints(self.transformedPointsList(self.middleWaypoints, fromCrs, toCrs))
         
         # Also update the marker coordinates dialog
         self.populateMarkerCoordinatesDialog()
@@ -2128,111 +2732,52 @@ class OnTheFlyShortestPath:
         return mem_layer 
         
         
-    def mergedMemoryLayer(self, crs:QgsCoordinateReferenceSystem, layersListWithId, storeOriginalLayerInfo:bool = False, layerFeatureLimit = 0, featureLimitExtentIndex = 0, pointsList = None) -> QgsVectorLayer:
-        ''' Merge layers into a memory layer '''
+    def mergedMemoryLayer(self, crs:QgsCoordinateReferenceSystem, layersListWithId, storeOriginalLayerInfo:bool = False, layerFeatureLimit = 0, featureLimitExtentIndex = 0, pointsList = None, sourceIds:dict = None) -> QgsVectorLayer:
+        ''' Merge layers into a memory layer. If sourceIds is given, it is filled with merged feature id -> (layerno, original feature id) '''
         if len(layersListWithId) <= 0:
             return None
 
-        pathLayer = self.createMemLayer(self.mergedLayerName, crs)
-        if pathLayer is None:
-            return None
-        pathLayerDataProvider = pathLayer.dataProvider()
-            
-        if storeOriginalLayerInfo == True:
-                
-            pathLayerDataProvider.addAttributes(self.originalLayerInfoFields)                     
-            pathLayer.updateFields()
-            newFields = QgsFields()
-            for newField in self.originalLayerInfoFields:
-                newFields.append(newField) 
-         
-        for layerno, (layerId, layer) in enumerate(layersListWithId):
-            #print (f"layerno {layerno} layerId {layerId} layer {layer} ")
-        
-            if layer.crs().authid() == "":
-                self.iface.messageBar().pushMessage("Warning", "Layer " + layer.name() + " does not have a valid CRS", level=Qgis.Warning, duration=5)
-                # just ignore and continue to the next layer
-            else:
-                #print(layer.name(), layer.crs().authid())
-                # Since we want only the geometry and not the fields, this is supposed to be faster than layer.getFeatures()
-                # We also want to limit the extent of the features to the contents of the screen
-                filter = QgsFeatureRequest()            
-                filter.setNoAttributes()
-
-                if layerFeatureLimit > 0:
-                    #print("Set limit of maximum number of features per layer to ", layerFeatureLimit)
-                    filter.setLimit(layerFeatureLimit) 
-                
-                # Set the extent scale usinf the mapping dictionary, if applicable
-                scale = 0 # entire layer
-                if pointsList is not None:
-                    if featureLimitExtentIndex in self.limitExtentIndexToScale:
-                        scale = self.limitExtentIndexToScale[featureLimitExtentIndex]
+        layers = []
+        requests = []
+        for (layerId, layer) in layersListWithId:
+            # Since we want only the geometry and not the fields, this is supposed to be faster than layer.getFeatures()
+            # We also want to limit the extent of the features to the contents of the screen
+            filter = QgsFeatureRequest()            
+            filter.setNoAttributes()
 
+            if layerFeatureLimit > 0:
+                filter.setLimit(layerFeatureLimit) 
             
-                if featureLimitExtentIndex == 1:
-                    #print ("Using map canvas extent ", self.iface.mapCanvas().extent())
-                    if crs == layer.crs():                    
-                        filter.setFilterRect(self.iface.mapCanvas().extent()) # limit features to map canvas
-                    else:    
-                        # Must convert the current project map canvas extent to the extent of the layer CRS 
-                        extent = self.iface.mapCanvas().extent()
-                        bottomLeftPoint = QgsPointXY(extent.xMinimum(), extent.yMinimum())
-                        topRightPoint = QgsPointXY(extent.xMaximum(), extent.yMaximum())
-                        filter.setFilterRect(self.setExtentScale(self.transformedPointsList([bottomLeftPoint, topRightPoint], crs, layer.crs()), scale))
-                    
-                                      
-                elif scale > 0:
-                    #print ("Limit extent to scale ", scale) 
-                    #print ("Markers ", self.transformedPointsList(pointsList, self.projectCrs, layer.crs()))
-                    #print ("Rectangle ", self.setExtentScale(self.transformedPointsList(pointsList, self.projectCrs, layer.crs()), scale))
-                    
-                    # Must transform the CRS of the points from the project crs to the layer to crs in order to calculate the extents for this specific layer
-                    filter.setDestinationCrs(layer.crs(), QgsProject.instance().transformContext())
-                    #print (f"Project CRS {crs}  Layer Crs {filter.destinationCrs()}" )
-                    filter.setFilterRect(self.setExtentScale(self.transformedPointsList(pointsList, crs, layer.crs()), scale))
-
-
-                
-                features = layer.getFeatures(filter)
-         
-                # Take a shortcut if we do not need original layer info, to avoid going through each feature 
-                if storeOriginalLayerInfo == False and layer.crs().authid() == crs.authid():
-                    pathLayerDataProvider.addFeatures(features)
-
-                else:
-                    doTransform = False                
-                    if layer.crs().authid() != crs.authid():
-                        #print ("Different authids. Must transform")
-                        # NOTE: Does transformation maintains topological snapping between layers of different CRS or when two layers of a CRS are transformed to the memory layer CRS?
-                        try:
-                            xform = QgsCoordinateTransform(layer.crs(), crs, QgsProject.instance().transformContext())
-                        except:
-                            self.iface.messageBar().pushMessage("Error", "Coordinate transformation of merging layers failed", level=Qgis.Critical, duration=5)
-                            return None
-                            
-                        doTransform = True         
-                    
-                    for feature in features:
-                        transformationError = False
-                        geometry = feature.geometry()
-                        if doTransform == True:
-                            try:
-                               geometry.transform(xform)
-                            except:
-                               transformationError = True
-                                                
-                        if transformationError == False:       
-                            mergedFeature = QgsFeature()
-                            mergedFeature.setGeometry(geometry)
-                            if storeOriginalLayerInfo == True:
-                                mergedFeature.setFields(newFields)
-                                mergedFeature.setAttribute("layerno", layerno)
-                                #mergedFeature.setAttribute("layerid", str(layerId))
-                                #mergedFeature.setAttribute("featureid", feature.id())                                 
-                            pathLayerDataProvider.addFeatures([mergedFeature])
- 
-        pathLayer.updateExtents()
+            # Set the extent scale usinf the mapping dictionary, if applicable
+            scale = 0 # entire layer
+            if pointsList is not None:
+                if featureLimitExtentIndex in self.limitExtentIndexToScale:
+                    scale = self.limitExtentIndexToScale[featureLimitExtentIndex]
+
+            # A layer without a valid CRS is reported and skipped by the merge
+            validCrs = layer.crs().authid() != ""
+            if validCrs and featureLimitExtentIndex == 1:
+                if crs == layer.crs():                    
+                    filter.setFilterRect(self.iface.mapCanvas().extent()) # limit features to map canvas
+                else:    
+                    # Must convert the current project map canvas extent to the extent of the layer CRS 
+                    extent = self.iface.mapCanvas().extent()
+                    bottomLeftPoint = QgsPointXY(extent.xMinimum(), extent.yMinimum())
+                    topRightPoint = QgsPointXY(extent.xMaximum(), extent.yMaximum())
+                    filter.setFilterRect(self.setExtentScale(self.transformedPointsList([bottomLeftPoint, topRightPoint], crs, layer.crs()), scale))
+            elif validCrs and scale > 0:
+                # Must transform the CRS of the points from the project crs to the layer to crs in order to calculate the extents for this specific layer
+                filter.setDestinationCrs(layer.crs(), QgsProject.instance().transformContext())
+                filter.setFilterRect(self.setExtentScale(self.transformedPointsList(pointsList, crs, layer.crs()), scale))
+
+            layers.append(layer)
+            requests.append(filter)
+
+        engine = self.routingEngine()
+        pathLayer = engine.mergeLayers(crs, layers, requests, QgsProject.instance().transformContext(), storeOriginalLayerInfo, sourceIds, self.mergedLayerName)
+        self.pushEngineMessages(engine)
+        if pathLayer is None:
+            return None
         pathLayer.commitChanges()
         # Add merged layer to the layer browser
         if self.currentConfig["addMergedLayer"] == 1:
@@ -2321,15 +2866,12 @@ class OnTheFlyShortestPath:
         return        
 
     
-    def addRubberBandsToMap(self) -> None:
-        if len(self.rubberBands) <= 0:
-            return
-        layer = self.createMemLayer(self.resultLayerName, QgsProject.instance().crs())
-        pr = layer.dataProvider()
-
+    def resultLayerFields(self) -> QgsFields:
         # types:  QVariant.String, QVariant.Int, QVariant.Double  
-                
-        tempLayerfields = [
+        fields = QgsFields()
+        for field in [
+            QgsField("routeid", QVariant.Int),
+            QgsField("timestamp", QVariant.DateTime),
             QgsField("start", QVariant.String),
             QgsField("end", QVariant.String),
             QgsField("length", QVariant.Double),
@@ -2342,16 +2884,111 @@ class OnTheFlyShortestPath:
             QgsField("entryloss", QVariant.Double),
             QgsField("pathloss", QVariant.Double),            
             QgsField("exitloss", QVariant.Double),                        
-            QgsField("middle1", QVariant.String),
-            QgsField("middle2", QVariant.String),
-            QgsField("middle3", QVariant.String),
+            QgsField("splices", QVariant.Int),
+            QgsField("bridges", QVariant.Int),
+            QgsField("waypoints", QVariant.String),
+            QgsField("numlegs", QVariant.Int),
+            QgsField("leglengths", QVariant.String),
             QgsField("crs", QVariant.String),
             QgsField("ellipsoid", QVariant.String)
-        ]
-        
-        # Add fields to the provider        
-        pr.addAttributes(tempLayerfields)
-        layer.updateFields()  # Update the layer's schema
+        ]:
+            fields.append(field)
+        return fields
+
+
+    def resultLayer(self) -> QgsVectorLayer:
+        ''' 
+        Returns the layer to which the measurements are appended. It is created when it is not in the project, either as a temp layer 
+        or in the result layer file of the configuration, where an existing layer is reused. The route ids continue from the largest id of the layer
+        '''
+        fileName = self.currentConfig["resultLayerFile"]
+        layer = QgsProject.instance().mapLayer(self.resultLayerId) if self.resultLayerId is not None else None
+        if layer is not None and self.resultLayerSource == fileName:
+            return layer
+        self.commitResultLayer()
+
+        if fileName == "":
+            layer = self.createMemLayer(self.resultLayerName, QgsProject.instance().crs(), fields = self.resultLayerFields())
+            if layer is None:
+                return None
+            # The index of a memory layer is updated by every added feature, instead of being rebuilt by the canvas
+            layer.dataProvider().createSpatialIndex()
+            QgsProject.instance().addMapLayer(layer)
+        else:
+            uri = fileName + "|layername=" + self.resultLayerName
+            # The layer of the file may already be in the project, e.g. from a previous session
+            layer = None
+            for projectLayer in QgsProject.instance().mapLayers().values():
+                if isinstance(projectLayer, QgsVectorLayer) and projectLayer.source() == uri:
+                    layer = projectLayer
+                    break
+            if layer is None:
+                try:
+                    if not os.path.exists(fileName):
+                        RouteWriter(fileName, self.resultLayerName, self.resultLayerFields(), QgsProject.instance().crs()).close()
+                except:
+                    self.iface.messageBar().pushMessage("Error", "The result layer file could not be created", level=Qgis.Critical, duration=5)
+                    return None
+                layer = QgsVectorLayer(uri, self.resultLayerName, "ogr")
+                if not layer.isValid():
+                    self.iface.messageBar().pushMessage("Error", "The result layer file does not have a valid " + self.resultLayerName + " layer", level=Qgis.Critical, duration=5)
+                    return None
+                QgsProject.instance().addMapLayer(layer)
+
+        idx = layer.fields().indexOf("routeid")
+        if idx >= 0:
+            try:
+                self.lastRouteId = max(self.lastRouteId, int(layer.maximumValue(idx)))
+            except:
+                # An empty layer
+                pass
+        self.resultLayerId = layer.id()
+        self.resultLayerSource = fileName
+        self.traversedFeaturesTableId = None
+        return layer
+
+
+    def appendResultFeatures(self, layer:QgsVectorLayer, features:list) -> None:
+        ''' 
+        Appends features to an accumulating layer. A temp layer is written directly. A file layer receives the features in its edit buffer, 
+        so that they are shown at once, and the buffer is committed to the file by commitResultLayer 
+        '''
+        if layer.providerType() == "memory":
+            layer.dataProvider().addFeatures(features)
+            layer.updateExtents()
+            layer.triggerRepaint()
+            return
+        if not layer.isEditable():
+            layer.startEditing()
+        layer.addFeatures(features)
+        return
+
+
+    def commitResultLayer(self) -> None:
+        ''' 
+        Writes to the file the measurements that are still in the edit buffer of the result layer, 
+        together with the rows of their traversed features 
+        '''
+        if self.pendingResults == 0 or self.resultLayerId is None:
+            return
+        layer = QgsProject.instance().mapLayer(self.resultLayerId)
+        if layer is not None and layer.isEditable():
+            if not layer.commitChanges():
+                self.iface.messageBar().pushMessage("Error", "The measurements could not be written to the result layer file", level=Qgis.Critical, duration=5)
+        table = QgsProject.instance().mapLayer(self.traversedFeaturesTableId) if self.traversedFeaturesTableId is not None else None
+        if table is not None and table.isEditable():
+            if not table.commitChanges():
+                self.iface.messageBar().pushMessage("Error", "The traversed features could not be written to the result layer file", level=Qgis.Critical, duration=5)
+        self.pendingResults = 0
+        return
+
+
+    def addRubberBandsToMap(self) -> None:
+        if len(self.rubberBands) <= 0:
+            return
+        layer = self.resultLayer()
+        if layer is None:
+            return
         
         geometry = QgsGeometry()
         # We shall collect the points of all rubberbands in a list and then we will create one multilinestring
@@ -2363,46 +3000,158 @@ class OnTheFlyShortestPath:
                 pointsList.append(rb.getPoint(0, i))                
         geometry.addPointsXY(pointsList, QgsWkbTypes.LineGeometry)                   
 
+        # The rubberbands are in the Project CRS, while a result layer file keeps the CRS of the project where it was created
+        if layer.crs() != self.projectCrs:
+            try:
+                geometry.transform(QgsCoordinateTransform(self.projectCrs, layer.crs(), QgsProject.instance().transformContext()))
+            except:
+                self.iface.messageBar().pushMessage("Error", "The route cannot be transformed to the CRS of the result layer", level=Qgis.Critical, duration=5)
+                return
+
         # Add as one feature to the layer  
-        feature = QgsFeature()
+        feature = QgsFeature(layer.fields())
         feature.setGeometry(geometry)
+
+        def setAttribute(name, value):
+            # A result layer file written by an older version may not have all the fields
+            if layer.fields().indexOf(name) >= 0:
+                feature.setAttribute(name, value)
+            return
         
-        # To use feature.setAttribute() by name, I need to do this
-        fields = QgsFields()
-        for newField in tempLayerfields:
-            fields.append(newField)       
-        feature.setFields(fields, True)
-        
-        feature.setAttribute("start", self.formatPointCoordinates(self.pointsDict[0]))
-        feature.setAttribute("end", self.formatPointCoordinates(self.pointsDict[self.numMarkers - 1]))
-        feature.setAttribute("length", self.formatLengthValue(self.resultsDict["totalCost"]))
-        feature.setAttribute("lengthunits", self.resultsDict["lengthUnits"])              
-        feature.setAttribute("entrylength", self.formatLengthValue(self.resultsDict["entryCost"]))
-        feature.setAttribute("pathlength", self.formatLengthValue(self.resultsDict["costOnGraph"]))
-        feature.setAttribute("exitlength", (self.resultsDict["exitCost"]))
+        self.lastRouteId += 1
+        setAttribute("routeid", self.lastRouteId)
+        setAttribute("timestamp", QDateTime.currentDateTime())
+        setAttribute("start", self.formatPointCoordinates(self.pointsDict[0]))
+        setAttribute("end", self.formatPointCoordinates(self.pointsDict[self.numMarkers - 1]))
+        setAttribute("length", self.formatLengthValue(self.resultsDict["totalCost"]))
+        setAttribute("lengthunits", self.resultsDict["lengthUnits"])              
+        setAttribute("entrylength", self.formatLengthValue(self.resultsDict["entryCost"]))
+        setAttribute("pathlength", self.formatLengthValue(self.resultsDict["costOnGraph"]))
+        setAttribute("exitlength", (self.resultsDict["exitCost"]))
         
         # Do not add values to fiber fields if fiber measurements are not required. 
         if not (self.currentConfig["resultDialogTypeIndex"] == 1 or self.currentConfig["resultDialogTypeIndex"] == 3):        
-            feature.setAttribute("fiberloss", self.formatLossValue(self.resultsDict["fiberTotalLoss"]))
-            feature.setAttribute("lossunits", self.resultsDict["fiberLossUnits"])                 
-            feature.setAttribute("entryloss", self.formatLossValue(self.resultsDict["fiberLossEntry"]))
-            feature.setAttribute("pathloss", self.formatLossValue(self.resultsDict["fiberLossOnGraph"]))
-            feature.setAttribute("exitloss", self.formatLossValue(self.resultsDict["fiberLossExit"]))
+            setAttribute("fiberloss", self.formatLossValue(self.resultsDict["fiberTotalLoss"]))
+            setAttribute("lossunits", self.resultsDict["fiberLossUnits"])                 
+            setAttribute("entryloss", self.formatLossValue(self.resultsDict["fiberLossEntry"]))
+            setAttribute("pathloss", self.formatLossValue(self.resultsDict["fiberLossOnGraph"]))
+            setAttribute("exitloss", self.formatLossValue(self.resultsDict["fiberLossExit"]))
+            if self.resultsDict["spliceCount"] is not None:
+                setAttribute("splices", self.resultsDict["spliceCount"])
+                setAttribute("bridges", self.resultsDict["bridgeCrossings"])
             
-        if 1 in self.pointsDict:
-            feature.setAttribute("middle1", self.formatPointCoordinates(self.pointsDict[1]))
-        if 2 in self.pointsDict:    
-            feature.setAttribute("middle2", self.formatPointCoordinates(self.pointsDict[2]))
-        if 3 in self.pointsDict:    
-            feature.setAttribute("middle3", self.formatPointCoordinates(self.pointsDict[3]))
+        # All middle points, in the order they are visited, separated by semicolons
+        middlePoints = self.visitedWaypoints[1:-1]
+        setAttribute("waypoints", "; ".join(self.formatPointCoordinates(p) for p in middlePoints))
+        setAttribute("numlegs", len(self.rubberBands))
+        setAttribute("leglengths", "; ".join(self.formatLengthValue(legCost) for legCost in self.resultsDict.get("legCosts", [])))
             
-        feature.setAttribute("crs", self.resultsDict["crs"])
-        feature.setAttribute("ellipsoid", self.resultsDict["ellipsoid"])
+        setAttribute("crs", self.resultsDict["crs"])
+        setAttribute("ellipsoid", self.resultsDict["ellipsoid"])
              
-        pr.addFeatures([feature])        
-        layer.updateExtents()
-        layer.commitChanges()
-        QgsProject.instance().addMapLayer(layer)            
+        self.appendResultFeatures(layer, [feature])
+        
+        if self.resultsDict.get("traversedFeatures") is not None:
+            self.addTraversedFeaturesTable(layer, self.lastRouteId)
+
+        # A route and its traversed features are written to the file in the same batch
+        if layer.providerType() != "memory":
+            self.pendingResults += 1
+            if self.pendingResults >= self.resultLayerBatchSize:
+                self.commitResultLayer()
+        return
+
+
+    def traversedFeaturesTable(self, resultLayer:QgsVectorLayer, reportFields:list) -> QgsVectorLayer:
+        ''' 
+        Returns the table of the traversed features of the routes of the result layer, related to it by the field routeid. 
+        The table is created when it is not in the project, as a temp table, or in the result layer file, where an existing table is reused.
+        The report fields it does not have yet are added to it
+        '''
+        table = QgsProject.instance().mapLayer(self.traversedFeaturesTableId) if self.traversedFeaturesTableId is not None else None
+        if table is None:
+            tableName = self.resultLayerName + "Features"
+            fields = QgsFields()
+            for field in [  QgsField("routeid", QVariant.Int),
+                            QgsField("seq", QVariant.Int),
+                            QgsField("layer", QVariant.String),
+                            QgsField("featureid", QVariant.LongLong),
+                            QgsField("length", QVariant.Double),
+                            QgsField("lengthunits", QVariant.String)
+                         ]:
+                fields.append(field)
+            if resultLayer.providerType() == "memory":
+                table = self.createMemLayer(tableName, QgsProject.instance().crs(), geometryType = QgsWkbTypes.NoGeometry, fields = fields)
+                if table is None:
+                    return None
+                QgsProject.instance().addMapLayer(table)
+            else:
+                fileName = self.resultLayerSource
+                uri = fileName + "|layername=" + tableName
+                # The table of the file may already be in the project, e.g. from a previous session
+                for projectLayer in QgsProject.instance().mapLayers().values():
+                    if isinstance(projectLayer, QgsVectorLayer) and projectLayer.source() == uri:
+                        table = projectLayer
+                        break
+                if table is None:
+                    try:
+                        # The table is added to the file, or reused if the file already has it
+                        RouteWriter(fileName, tableName, fields, QgsProject.instance().crs(), geometryType = ogr.wkbNone, replaceFile = False).close()
+                    except:
+                        self.iface.messageBar().pushMessage("Error", "The table of the traversed features could not be created in the result layer file", level=Qgis.Critical, duration=5)
+                        return None
+                    table = QgsVectorLayer(uri, tableName, "ogr")
+                    if not table.isValid():
+                        self.iface.messageBar().pushMessage("Error", "The result layer file does not have a valid " + tableName + " table", level=Qgis.Critical, duration=5)
+                        return None
+                    QgsProject.instance().addMapLayer(table)
+            self.traversedFeaturesTableId = table.id()
+        
+            # The table is shown in the attribute form of the route. A project of a previous session may already have the relation
+            relationManager = QgsProject.instance().relationManager()
+            if not relationManager.relation(table.id()).isValid():
+                relation = QgsRelation()
+                relation.setId(table.id())
+                relation.setName(table.name())
+                relation.setReferencingLayer(table.id())
+                relation.setReferencedLayer(resultLayer.id())
+                relation.addFieldPair("routeid", "routeid")
+                if relation.isValid():
+                    relationManager.addRelation(relation)
+
+        newFields = [QgsField(name, QVariant.String) for name in reportFields if table.fields().indexOf(name) < 0]
+        if len(newFields) > 0:
+            # The rows in the edit buffer of a file table are written before its fields change
+            if table.isEditable():
+                self.commitResultLayer()
+            table.dataProvider().addAttributes(newFields)
+            table.updateFields()
+        return table
+
+
+    def addTraversedFeaturesTable(self, resultLayer:QgsVectorLayer, routeId:int) -> None:
+        ''' Appends one row per traversed feature of the route to the table of the traversed features '''
+        reportFields = self.resultsDict["reportFields"]
+        table = self.traversedFeaturesTable(resultLayer, reportFields)
+        if table is None:
+            return
+        # A report field with the name of a field of the table is skipped
+        fixedFields = ["routeid", "seq", "layer", "featureid", "length", "lengthunits"]
+        
+        features = []
+        for seq, (layerName, sourceId, length, values) in enumerate(self.resultsDict["traversedFeatures"], 1):
+            feature = QgsFeature(table.fields())
+            feature.setAttribute("routeid", routeId)
+            feature.setAttribute("seq", seq)
+            feature.setAttribute("layer", layerName)
+            feature.setAttribute("featureid", sourceId)
+            feature.setAttribute("length", self.formatLengthValue(length))
+            feature.setAttribute("lengthunits", self.resultsDict["lengthUnits"])
+            for name, value in zip(reportFields, values):
+                if value is not None and name not in fixedFields:
+                    feature.setAttribute(name, value)
+            features.append(feature)
+        self.appendResultFeatures(table, features)
         return
         
         
@@ -2466,6 +3215,7 @@ class OnTheFlyShortestPath:
         self.flexjLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
         self.bridgingPointTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
         self.bridgingLineTool.setLayersToSnap(self.selectedLayersList() + self.selectedPointLayersList())
+        self.invalidateNetworkGraph()
         
         return            
     
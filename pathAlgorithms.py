@@ -0,0 +1,432 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    pathAlgorithms.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import heapq
+import math
+
+'''
+Path searches which are not offered by QgsGraphAnalyzer. They run on a copy of the arcs of a QgsGraph,
+so that the module does not depend on QGIS. The index of an arc is the index of the edge in the QgsGraph.
+'''
+
+class GraphPaths:
+
+    def __init__(self, numVertices:int, arcs:list):
+        self.numVertices = numVertices
+        # Arc index -> (from vertex, to vertex, cost)
+        self.arcs = arcs
+        # Vertex -> indexes of the arcs leaving the vertex
+        self.outArcs = [[] for i in range(numVertices)]
+        # Vertex -> indexes of the arcs entering the vertex
+        self.inArcs = [[] for i in range(numVertices)]
+        for i, (fromVertex, toVertex, cost) in enumerate(arcs):
+            self.outArcs[fromVertex].append(i)
+            self.inArcs[toVertex].append(i)
+        return
+
+
+    def pathCost(self, path:list) -> float:
+        ''' Returns the sum of the costs of a path given as a list of arcs '''
+        return sum(self.arcs[i][2] for i in path)
+
+
+    def shortestPathTree(self, source:int, target:int = -1):
+        '''
+        Returns a tuple (costs, predecessor arcs) of dijkstra from the source vertex. Unreachable vertices have cost math.inf
+        and predecessor -1. If a target is given, the search stops when the target is reached
+        '''
+        costs = [math.inf] * self.numVertices
+        predecessors = [-1] * self.numVertices
+        costs[source] = 0
+        heap = [(0, source)]
+        while len(heap) > 0:
+            (cost, vertex) = heapq.heappop(heap)
+            if cost > costs[vertex]:
+                continue
+            if vertex == target:
+                break
+            for i in self.outArcs[vertex]:
+                (fromVertex, toVertex, arcCost) = self.arcs[i]
+                newCost = cost + arcCost
+                if newCost < costs[toVertex]:
+                    costs[toVertex] = newCost
+                    predecessors[toVertex] = i
+                    heapq.heappush(heap, (newCost, toVertex))
+        return (costs, predecessors)
+
+
+    def nearestSources(self, sources:list, arcCosts:list = None):
+        '''
+        Returns a tuple (costs, predecessor arcs, nearest sources) of one search of dijkstra from all the sources at once, 
+        given as a list of (vertex, initial cost). The nearest source of a vertex is the index in the list of the source 
+        with the minimum cost to the vertex, or -1 if the vertex is not reachable. The arcCosts, if given, replace the costs of the arcs
+        '''
+        if arcCosts is None:
+            arcCosts = [cost for (fromVertex, toVertex, cost) in self.arcs]
+        costs = [math.inf] * self.numVertices
+        predecessors = [-1] * self.numVertices
+        nearest = [-1] * self.numVertices
+        heap = []
+        for i, (vertex, cost) in enumerate(sources):
+            if cost < costs[vertex]:
+                costs[vertex] = cost
+                nearest[vertex] = i
+                heapq.heappush(heap, (cost, vertex))
+        while len(heap) > 0:
+            (cost, vertex) = heapq.heappop(heap)
+            if cost > costs[vertex]:
+                continue
+            for i in self.outArcs[vertex]:
+                toVertex = self.arcs[i][1]
+                newCost = cost + arcCosts[i]
+                if newCost < costs[toVertex]:
+                    costs[toVertex] = newCost
+                    predecessors[toVertex] = i
+                    nearest[toVertex] = nearest[vertex]
+                    heapq.heappush(heap, (newCost, toVertex))
+        return (costs, predecessors, nearest)
+
+
+    def reverseShortestPathTree(self, target:int):
+        '''
+        Returns a tuple (costs, successor arcs) of dijkstra towards the target vertex, i.e. the cost of the shortest path 
+        from every vertex to the target and the first arc of the path. Unreachable vertices have cost math.inf and successor -1
+        '''
+        costs = [math.inf] * self.numVertices
+        successors = [-1] * self.numVertices
+        costs[target] = 0
+        heap = [(0, target)]
+        while len(heap) > 0:
+            (cost, vertex) = heapq.heappop(heap)
+            if cost > costs[vertex]:
+                continue
+            for i in self.inArcs[vertex]:
+                (fromVertex, toVertex, arcCost) = self.arcs[i]
+                newCost = cost + arcCost
+                if newCost < costs[fromVertex]:
+                    costs[fromVertex] = newCost
+                    successors[fromVertex] = i
+                    heapq.heappush(heap, (newCost, fromVertex))
+        return (costs, successors)
+
+
+    def pathTo(self, predecessors:list, source:int, target:int) -> list:
+        ''' Returns the arcs from the source to the target of a shortest path tree, or None if the target is not reachable '''
+        path = []
+        vertex = target
+        while vertex != source:
+            i = predecessors[vertex]
+            if i < 0:
+                return None
+            path.append(i)
+            vertex = self.arcs[i][0]
+        path.reverse()
+        return path
+
+
+    def diversePair(self, source:int, target:int, nodeDisjoint:bool = False) -> list:
+        '''
+        Returns the pair of edge-disjoint paths (or node-disjoint, except for the source and the target) with the minimum total cost,
+        as two lists of arcs with the cheaper path first. Returns a list with one path if there is no diverse pair, or an empty list
+        if the target is not reachable.
+        The pair is found as the minimum cost flow of two units, with two searches of dijkstra on reduced costs (Suurballe).
+        The two directions of a segment count as one edge, so a segment is never used by both paths
+        '''
+        n = self.numVertices
+        numNodes = 2 * n if nodeDisjoint else n
+
+        # Residual network. Edge e and e ^ 1 are the forward and the backward edge
+        edgeTo = []
+        edgeCapacity = []
+        edgeCost = []
+        # Residual edge -> arc of the graph, or -1 for the edges splitting a vertex
+        edgeArc = []
+        nodeEdges = [[] for i in range(numNodes)]
+
+        def addEdge(fromNode, toNode, capacity, cost, arc):
+            nodeEdges[fromNode].append(len(edgeTo))
+            edgeTo.append(toNode)
+            edgeCapacity.append(capacity)
+            edgeCost.append(cost)
+            edgeArc.append(arc)
+            nodeEdges[toNode].append(len(edgeTo))
+            edgeTo.append(fromNode)
+            edgeCapacity.append(0)
+            edgeCost.append(-cost)
+            edgeArc.append(arc)
+            return
+
+        for i, (fromVertex, toVertex, cost) in enumerate(self.arcs):
+            if fromVertex == toVertex:
+                continue
+            if nodeDisjoint:
+                # The arcs leave from the "out" node of a vertex and enter its "in" node
+                addEdge(fromVertex + n, toVertex, 1, cost, i)
+            else:
+                addEdge(fromVertex, toVertex, 1, cost, i)
+        if nodeDisjoint:
+            for vertex in range(n):
+                addEdge(vertex, vertex + n, 2 if vertex in [source, target] else 1, 0, -1)
+
+        sourceNode = source + n if nodeDisjoint else source
+        targetNode = target
+        potentials = [0] * numNodes
+        flow = 0
+        for unit in range(2):
+            costs = [math.inf] * numNodes
+            predecessors = [-1] * numNodes
+            costs[sourceNode] = 0
+            heap = [(0, sourceNode)]
+            while len(heap) > 0:
+                (cost, node) = heapq.heappop(heap)
+                if cost > costs[node]:
+                    continue
+                for e in nodeEdges[node]:
+                    if edgeCapacity[e] <= 0:
+                        continue
+                    toNode = edgeTo[e]
+                    newCost = cost + edgeCost[e] + potentials[node] - potentials[toNode]
+                    if newCost < costs[toNode]:
+                        costs[toNode] = newCost
+                        predecessors[toNode] = e
+                        heapq.heappush(heap, (newCost, toNode))
+            if costs[targetNode] == math.inf:
+                break
+            # Keeps the reduced costs non negative for the next search
+            for node in range(numNodes):
+                potentials[node] += min(costs[node], costs[targetNode])
+            node = targetNode
+            while node != sourceNode:
+                e = predecessors[node]
+                edgeCapacity[e] -= 1
+                edgeCapacity[e ^ 1] += 1
+                node = edgeTo[e ^ 1]
+            flow += 1
+
+        if flow == 0:
+            return []
+
+        # The arcs of the graph which carry flow. Flows in the two directions of a segment cancel each other
+        usedArcs = set()
+        for e in range(0, len(edgeTo), 2):
+            if edgeArc[e] >= 0 and edgeCapacity[e] == 0:
+                usedArcs.add(edgeArc[e])
+        segments = {}
+        for i in usedArcs:
+            (fromVertex, toVertex, cost) = self.arcs[i]
+            segments.setdefault((fromVertex, toVertex), []).append(i)
+        for i in list(usedArcs):
+            if i not in usedArcs:
+                continue
+            (fromVertex, toVertex, cost) = self.arcs[i]
+            for j in segments.get((toVertex, fromVertex), []):
+                if j in usedArcs:
+                    usedArcs.discard(i)
+                    usedArcs.discard(j)
+                    break
+
+        # Decompose the flow into paths
+        leaving = {}
+        for i in usedArcs:
+            leaving.setdefault(self.arcs[i][0], []).append(i)
+        paths = []
+        for unit in range(flow):
+            path = []
+            vertex = source
+            visited = set()
+            while vertex != target:
+                if vertex in visited or len(leaving.get(vertex, [])) == 0:
+                    path = None
+                    break
+                visited.add(vertex)
+                i = leaving[vertex].pop()
+                path.append(i)
+                vertex = self.arcs[i][1]
+            if path is not None:
+                paths.append(path)
+        paths.sort(key = lambda path: self.pathCost(path))
+        return paths
+
+
+    def kShortestPaths(self, source:int, target:int, k:int) -> list:
+        '''
+        Returns up to k loopless paths from the source to the target, as lists of arcs in the order of increasing cost (Yen).
+        Returns an empty list if the target is not reachable.
+        The tree of the shortest paths towards the target is computed once and shared by all the spur searches: 
+        a spur path follows the tree as long as the tree does not use a removed arc or vertex, otherwise the search 
+        is guided by the costs of the tree, which are a lower bound of the costs after the removal
+        '''
+        (costsToTarget, successors) = self.reverseShortestPathTree(target)
+        if source == target or costsToTarget[source] == math.inf:
+            return []
+
+        paths = [self.treePath(successors, source, target)]
+        # Candidate paths, as (cost, path). Paths already found or queued are kept in seen
+        candidates = []
+        seen = {tuple(paths[0])}
+        while len(paths) < k:
+            previousPath = paths[-1]
+            vertices = [source] + [self.arcs[i][1] for i in previousPath]
+            for j in range(len(previousPath)):
+                spurVertex = vertices[j]
+                rootPath = previousPath[:j]
+                # The next arc of every path found with the same root cannot be used by the spur path
+                bannedArcs = set(path[j] for path in paths if len(path) > j and path[:j] == rootPath)
+                # The root vertices cannot be visited again, so that the path is loopless
+                bannedVertices = set(vertices[:j])
+                spurPath = self.spurPath(spurVertex, target, bannedArcs, bannedVertices, costsToTarget, successors)
+                if spurPath is not None:
+                    path = rootPath + spurPath
+                    key = tuple(path)
+                    if key not in seen:
+                        seen.add(key)
+                        heapq.heappush(candidates, (self.pathCost(path), len(seen), path))
+            if len(candidates) == 0:
+                break
+            paths.append(heapq.heappop(candidates)[2])
+        return paths
+
+
+    def treePath(self, successors:list, source:int, target:int) -> list:
+        ''' Returns the arcs from the source to the target of a reverse shortest path tree, or None if the target is not reachable '''
+        path = []
+        vertex = source
+        while vertex != target:
+            i = successors[vertex]
+            if i < 0:
+                return None
+            path.append(i)
+            vertex = self.arcs[i][1]
+        return path
+
+
+    def spurPath(self, source:int, target:int, bannedArcs:set, bannedVertices:set, costsToTarget:list, successors:list) -> list:
+        ''' 
+        Returns the arcs of the shortest path from the source to the target which does not use the banned arcs and vertices,
+        or None if there is no such path. The costs to the target of the reverse tree guide the search (A*)
+        '''
+        # The path of the tree is still the shortest, if it is not affected by the removals
+        path = self.treePath(successors, source, target)
+        if path is not None and all(i not in bannedArcs and self.arcs[i][1] not in bannedVertices for i in path):
+            return path
+
+        costs = {source: 0}
+        predecessors = {}
+        heap = [(costsToTarget[source], source)]
+        while len(heap) > 0:
+            (estimate, vertex) = heapq.heappop(heap)
+            cost = costs[vertex]
+            if estimate > cost + costsToTarget[vertex]:
+                continue
+            if vertex == target:
+                break
+            for i in self.outArcs[vertex]:
+                if i in bannedArcs:
+                    continue
+                (fromVertex, toVertex, arcCost) = self.arcs[i]
+                if toVertex in bannedVertices or costsToTarget[toVertex] == math.inf:
+                    continue
+                newCost = cost + arcCost
+                if newCost < costs.get(toVertex, math.inf):
+                    costs[toVertex] = newCost
+                    predecessors[toVertex] = i
+                    heapq.heappush(heap, (newCost + costsToTarget[toVertex], toVertex))
+        if target not in costs:
+            return None
+
+        path = []
+        vertex = target
+        while vertex != source:
+            i = predecessors[vertex]
+            path.append(i)
+            vertex = self.arcs[i][0]
+        path.reverse()
+        return path
+
+
+    def serviceArea(self, source:int, limit:float, arcCosts:list = None) -> list:
+        '''
+        Returns the parts of the arcs that are reachable from the source vertex within the limit, as a list of 
+        (arc, cost at the start of the arc, fraction of the arc from its start). An arc which is not entirely reachable 
+        is cut at the exact limit. A segment reachable from both of its ends is split where the costs from its two ends meet,
+        so that no part of the network is given twice. The search of dijkstra stops at the limit.
+        The arcCosts, if given, replace the costs of the arcs
+        '''
+        if arcCosts is None:
+            arcCosts = [cost for (fromVertex, toVertex, cost) in self.arcs]
+
+        # Vertex -> cost, for the vertices within the limit
+        settled = {}
+        costs = {source: 0}
+        heap = [(0, source)]
+        while len(heap) > 0:
+            (cost, vertex) = heapq.heappop(heap)
+            if vertex in settled:
+                continue
+            settled[vertex] = cost
+            for i in self.outArcs[vertex]:
+                toVertex = self.arcs[i][1]
+                newCost = cost + arcCosts[i]
+                if newCost <= limit and newCost < costs.get(toVertex, math.inf):
+                    costs[toVertex] = newCost
+                    heapq.heappush(heap, (newCost, toVertex))
+
+        # Arc -> reachable fraction from the start of the arc
+        reached = {}
+        for vertex, cost in settled.items():
+            for i in self.outArcs[vertex]:
+                arcCost = arcCosts[i]
+                fraction = 1.0 if arcCost <= 0 or cost + arcCost <= limit else (limit - cost) / arcCost
+                if fraction > 0:
+                    reached[i] = fraction
+
+        # The arcs of the other direction of a segment, by (from vertex, to vertex)
+        reverseArcs = {}
+        for i in reached.keys():
+            (fromVertex, toVertex, cost) = self.arcs[i]
+            reverseArcs.setdefault((toVertex, fromVertex), []).append(i)
+
+        parts = []
+        done = set()
+        for i, fraction in reached.items():
+            if i in done:
+                continue
+            done.add(i)
+            (fromVertex, toVertex, cost) = self.arcs[i]
+            j = -1
+            for k in reverseArcs.get((fromVertex, toVertex), []):
+                if k not in done and arcCosts[k] == arcCosts[i]:
+                    j = k
+                    break
+            if j < 0 or arcCosts[i] <= 0:
+                parts.append((i, settled[fromVertex], fraction))
+                continue
+            done.add(j)
+            # The point of the segment where the costs from the two ends are equal
+            meeting = (settled[toVertex] - settled[fromVertex] + arcCosts[i]) / (2 * arcCosts[i])
+            meeting = min(1.0, max(0.0, meeting))
+            if min(fraction, meeting) > 0:
+                parts.append((i, settled[fromVertex], min(fraction, meeting)))
+            if min(reached[j], 1.0 - meeting) > 0:
+                parts.append((j, settled[toVertex], min(reached[j], 1.0 - meeting)))
+        return parts
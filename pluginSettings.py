@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    pluginSettings.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+'''
+The factory default configuration of the plugin. Kept apart from the plugin class, 
+so that the code without a GUI, e.g. the benchmark, can use it without importing the dialogs
+'''
+
+class PluginSettings:
+
+    factoryDefaultSettings = {
+        "rubberBandColorRed" : 55,
+        "rubberBandColorGreen" : 165,
+        "rubberBandColorBlue" : 200,
+        "rubberBandOpacity" : 128,        
+        "rubberBandSize" : 8,
+        "markerColorRed" : 255,
+        "markerColorGreen" : 30,
+        "markerColorBlue" : 50,
+        "markerOpacity" : 255,       
+        "markerSize" : 10,
+        "decimalDigits" : 2,
+        "topologyTolerance" : 0.0,
+        "toleranceUnitsIndex" : 0,
+        "includeStartStop" : 1,
+        "resultDialogTypeIndex" : 0, 
+        "distanceUnitsIndex" : 0, # ["meters", "Kilometers", "yards", "feet", "nutical miles", "imperial miles"]
+        "selectedCrsMethod" : 0, # 0 Project, 1 Layer, 2 Custom
+        "customCrs" : 0, # EPSG id
+        "connectorLoss" : 0.4, # db per connector
+        "numberOfConnectorsAtEntry" : 3,
+        "numberOfConnectorsAtExit" : 3,
+        "spliceLoss" : 0.15, # db per splice
+        "spliceFrequency" : 1.0, # Km
+        "cableLoss" : 0.25,       # db/Km    
+        "fixedLoss" : 0,  # db e.g. Acccount for splitters 1:2->4db, 1:4->7db, 1:8->11db, 1:16->15db, 1:32->19db, 1:64->23db
+        "minimumLossRouting" : 0, # Route by the minimum fiber loss instead of the minimum length
+        "attenuationField" : "", # Field of the line layers with the attenuation of the cable in db/Km. Empty to use cableLoss
+        "spliceFlagField" : "", # Field of the line layers which is set if the feature has a splice. Empty to use spliceFrequency
+        "countSplices" : 0, # Count the splices on the path from the changes of feature, instead of spliceFrequency or spliceFlagField
+        "coordinateFormatIndex" : 0, # ["x y", "y x", "x, y", "y, x"]
+        "addResultLayer" : 0, # add the result rubberband path to map as a temporary layer
+        "addMergedLayer": 0, # add the merged layer to map as a temporary layer
+        "addFeatureReport": 0, # add a table of the traversed features, related to the result layer
+        "reportFields": "", # comma separated fields of the line layers copied to the table of the traversed features
+        "resultLayerFile": "", # GeoPackage of the result layer, to which the measurements are appended. Empty for a temp layer
+
+        "snappingToolSnappingProviderIndex" : 0, # 0 internal, 1 QGIS, 2 Both
+        "snappingToolColorRed" : 0,
+        "snappingToolColorGreen" : 0,
+        "snappingToolColorBlue" : 255,
+        "snappingToolOpacity" : 255,       
+        "snappingToolSize" : 12,        
+        "snappingToolSnapMethod" : 1, # controls the snap behaviour of the marker (snap to vertices of point and line layers or snap to edges (the entire line) of line layers)
+        "snappingToolSnapPixels" : 10, # marker snapping tolerance in pixels
+        "snappingToolSnapToMatchedPoint" : 1, # Yes,No to snap the marker to the map feature or to leave the marker at the cursor location
+        "snappingToolShowToolTip" : 1, # Makes the tooltip of the snapping tool visisble
+        "snappingToolSnappingBehaviourIndex" : 1, # 0 Snap to all layers, 1 snap only to selected layers,   2 snap to active layer
+
+        "bridgingPointToolColorRed": 255,
+        "bridgingPointToolColorGreen": 0,
+        "bridgingPointToolColorBlue": 0,
+        "bridgingPointToolOpacity": 128,
+        "bridgingPointToolSize": 12,
+        "bridgingPointToolRadius" : 1, # The radius from a bridge point where the nearest edge of line layer is located, for the purpose of creating bridges between layers
+        "bridgingPointToolAddBridgePointsToMap": 0, # The conf value is not passed to the bridging tool class but is used in the current class (at least in this version)
+        "bridgingPointToolSameLayer" : 1, # 1 Allow same layer bridging. This does not keep a memory on which feature belonged to which original layer, and is lighter on computer resources
+        "bridgingPointToolAskBeforeDelete" :1, # Show a message box asking before deleting set bridging points
+        
+        "bridgingLineToolColorRed": 12,
+        "bridgingLineToolColorGreen": 0,
+        "bridgingLineToolColorBlue": 255,
+        "bridgingLineToolOpacity": 128,
+        "bridgingLineToolSize": 12,
+        "bridgingLineToolLineWidth" : 3,
+        "bridgingLineToolLineStyleIndex" : 0, # Qt::SolidLine - 1
+        "bridgingLineToolRadius" : 0, 
+        "bridgingLineToolAddBridgeLinesToMap": 0, 
+        "bridgingLineToolAskBeforeDelete" :1, # Show a message box asking before deleting set bridging points        
+                
+        "flexjLineToolColorRed" : 222,
+        "flexjLineToolColorGreen" : 155,
+        "flexjLineToolColorBlue" : 67,
+        "flexjLineToolOpacity" : 128,
+        "flexjLineToolMarkerSize" : 10,
+        "flexjLineToolLineWidth" : 3,
+        "flexjLineToolLineStyleIndex" : 2, # Qt::DashDotLine - 1     
+        "flexjLineToolShowDistance" : 1,
+        "flexjLineToolSlopingDistance" : 0,
+        "flexjLineToolAngleCorrection" : 0, # Difference in angle implementation of the QgsAnnotationPointTextItem.setAngle(). Do not know if it is related to the OS or to QGIS versions
+        "flexjLineToolShowTotalDistance" : 0,
+        "flexjLineToolDistanceDecimalDigits" : 2,
+        "flexjLineToolKeepBaseUnit" : 1,
+        "flexjLineToolShowNetworkDistance" : 0,
+        
+        "featureLimitExtentIndex": 0, # 0 No limits
+        "maxNumFeaturesPerLayer" : 0,
+        "entryExitLengthLimit" : 0,
+        "waypointsFromSelectedPoints" : 0,
+        "optimizeWaypointOrder" : 0,
+        "calculationModeIndex" : 0, # See calculationModes
+        "diversePairNodeDisjoint" : 0, # The paths of the diverse pair do not share vertices, besides the start and the end
+        "numberOfRoutes" : 3, # The number of routes of the k shortest paths
+        "serviceAreaLimitTypeIndex" : 1, # See serviceAreaLimitTypes
+        "serviceAreaLimit" : 28.0, # In the distance units of the results or in db, depending on the type of the limit
+        "facilityLayer" : "", # Name of the point layer of the facilities, e.g. splitters or cabinets, of the nearest facility assignment
+        "batchOutputFile" : "" # GeoPackage or CSV file where the nearest facility assignment is written in chunks. Empty for a temp layer
+    }
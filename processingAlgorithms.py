@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    processingAlgorithms.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import math
+
+from qgis.core import ( QgsCoordinateTransform,
+                        QgsFeature,
+                        QgsFeatureRequest,
+                        QgsFeatureSink,
+                        QgsField,
+                        QgsFields,
+                        QgsGeometry,
+                        QgsPointXY,
+                        QgsProcessing,
+                        QgsProcessingAlgorithm,
+                        QgsProcessingException,
+                        QgsProcessingParameterBoolean,
+                        QgsProcessingParameterDefinition,
+                        QgsProcessingParameterDistance,
+                        QgsProcessingParameterFeatureSink,
+                        QgsProcessingParameterFeatureSource,
+                        QgsProcessingParameterNumber,
+                        QgsProcessingParameterPoint,
+                        QgsWkbTypes
+                      )
+from qgis.analysis import QgsGraphAnalyzer
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+
+from .batchRouting import BatchRouter
+from .networkGraph import NetworkGraph
+from .routingEngine import RoutingEngine
+
+'''
+The algorithms of the Processing provider. Each run builds the graph of the network once and ties all 
+the points to it in one pass. One search of dijkstra is run per distinct start point and shared by all 
+the routes from that point. The lengths are in meters and the fiber loss in db, as in the dock widget.
+'''
+
+class RoutingAlgorithm(QgsProcessingAlgorithm):
+    ''' The parameters of the network and of the fiber loss, shared by the algorithms '''
+
+    NETWORK = "NETWORK"
+    TOLERANCE = "TOLERANCE"
+    INCLUDE_START_STOP = "INCLUDE_START_STOP"
+    PROCESSES = "PROCESSES"
+    OUTPUT = "OUTPUT"
+
+    # The pool of processes pays for starting the workers and publishing the graph, and its searches run in python, 
+    # at about half the speed of dijkstra of QGIS. It is used only when the work of the batch, the number of searches times 
+    # the number of edges of the graph, reaches this value. Measured with Benchmark.runBatchRouting(): the pool starts in
+    # 0.2 to 1 second and routes at 0.3 to 0.6 microseconds per edge, so that with 4 processes it is faster from about 4 million
+    poolMinimumWork = 4000000
+    # The searches sent to a worker at a time. A cancel takes effect when a chunk comes back
+    poolChunkSize = 4
+
+    # (parameter name, key of the configuration of the plugin, description, factory default of the plugin, integer)
+    lossParameters = [  ("CONNECTOR_LOSS", "connectorLoss", "Connector loss (db)", 0.4, False),
+                        ("CONNECTORS_AT_ENTRY", "numberOfConnectorsAtEntry", "Number of connectors at entry", 3, True),
+                        ("CONNECTORS_AT_EXIT", "numberOfConnectorsAtExit", "Number of connectors at exit", 3, True),
+                        ("SPLICE_LOSS", "spliceLoss", "Splice loss (db)", 0.15, False),
+                        ("SPLICE_FREQUENCY", "spliceFrequency", "Splice every (Km)", 1.0, False),
+                        ("CABLE_LOSS", "cableLoss", "Cable loss (db/Km)", 0.25, False),
+                        ("FIXED_LOSS", "fixedLoss", "Fixed loss, e.g. splitters (db)", 0.0, False)
+                     ]
+
+    # The fields of the lengths and the loss of a route, in the order of the attributes
+    resultFields = ["length", "entrylength", "pathlength", "exitlength", "fiberloss", "entryloss", "pathloss", "exitloss"]
+    resultKeys = ["totalCostMeters", "entryCostMeters", "costOnGraphMeters", "exitCostMeters", "fiberTotalLoss", "fiberLossEntry", "fiberLossOnGraph", "fiberLossExit"]
+
+    def tr(self, string:str) -> str:
+        return QCoreApplication.translate("Processing", string)
+
+
+    def createInstance(self):
+        return type(self)()
+
+
+    def group(self) -> str:
+        return self.tr("Routing")
+
+
+    def groupId(self) -> str:
+        return "routing"
+
+
+    def initNetworkParameters(self) -> None:
+        self.addParameter(QgsProcessingParameterFeatureSource(self.NETWORK, self.tr("Network line layer"), [QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterDistance(self.TOLERANCE, self.tr("Topology tolerance"), 0.0, self.NETWORK, minValue = 0.0))
+        self.addParameter(QgsProcessingParameterBoolean(self.INCLUDE_START_STOP, self.tr("Include the distance of the points from the network"), True))
+        for (name, key, description, default, isInteger) in self.lossParameters:
+            numberType = QgsProcessingParameterNumber.Integer if isInteger else QgsProcessingParameterNumber.Double
+            self.addParameter(QgsProcessingParameterNumber(name, self.tr(description), numberType, default, minValue = 0))
+        return
+
+
+    def prepareNetwork(self, parameters, context, feedback) -> None:
+        ''' Reads the common parameters and builds the graph of the network '''
+        network = self.parameterAsSource(parameters, self.NETWORK, context)
+        if network is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.NETWORK))
+        self.crs = network.sourceCrs()
+        self.includeStartStop = self.parameterAsBoolean(parameters, self.INCLUDE_START_STOP, context)
+        # There are no flags of splices on the features of the network
+        config = {"spliceFlagField": ""}
+        for (name, key, description, default, isInteger) in self.lossParameters:
+            config[key] = self.parameterAsInt(parameters, name, context) if isInteger else self.parameterAsDouble(parameters, name, context)
+        # The lengths and the loss are set by the routing engine of the dock widget, so that the results are the same
+        self.engine = RoutingEngine(config)
+        # As in the dock widget, the lengths of a CRS without meters are converted to meters
+        self.conversionIndex = 0 if self.engine.geom.crsDetails(self.crs)[3] == "meters" else -1
+
+        feedback.pushInfo(self.tr("Building the graph of the network"))
+        self.networkGraph = NetworkGraph(network, self.crs, self.parameterAsDouble(parameters, self.TOLERANCE, context))
+        return
+
+
+    def sourcePoints(self, source, context, feedback, lastVertex:bool = False) -> list:
+        ''' 
+        Returns a list of (feature id, point) of the features of a source, in the CRS of the network. The point is the first vertex 
+        of the geometry, and for lines the last vertex is appended to the item if requested 
+        '''
+        transform = QgsCoordinateTransform(source.sourceCrs(), self.crs, context.transformContext())
+        items = []
+        for feature in source.getFeatures(QgsFeatureRequest().setNoAttributes()):
+            if feedback.isCanceled():
+                break
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            geometry.transform(transform)
+            vertices = list(geometry.vertices())
+            item = (feature.id(), QgsPointXY(vertices[0]))
+            if lastVertex:
+                if len(vertices) < 2:
+                    continue
+                item += (QgsPointXY(vertices[-1]),)
+            items.append(item)
+        return items
+
+
+    def addProcessesParameter(self) -> None:
+        parameter = QgsProcessingParameterNumber(self.PROCESSES, self.tr("Parallel processes (1 to route in the QGIS process)"), QgsProcessingParameterNumber.Integer, 1, minValue = 1)
+        parameter.setFlags(parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(parameter)
+        return
+
+
+    def shortestPaths(self, graph, tasks:list, withPaths:bool, processes:int, feedback):
+        '''
+        Generator of the shortest paths of the tasks, given as (start vertex, end vertexes), in chunks of (task index, results), 
+        where the results are (end vertex, cost, path) as in CsrGraph.route(). With more than one process and a batch large enough
+        for the pool to be faster, see poolMinimumWork, the graph is published to a BatchRouter, otherwise dijkstra of QGIS runs here. 
+        Stops when the run is canceled
+        '''
+        if processes > 1 and len(tasks) > processes and len(tasks) * graph.edgeCount() >= self.poolMinimumWork:
+            return self.poolShortestPaths(graph, tasks, withPaths, processes, feedback.isCanceled)
+        if processes > 1:
+            feedback.pushInfo(self.tr("The batch is small. Routing in the QGIS process, which is faster than starting the parallel processes"))
+        return self.serialShortestPaths(graph, tasks, withPaths, feedback.isCanceled)
+
+
+    @classmethod
+    def poolShortestPaths(cls, graph, tasks:list, withPaths:bool, processes:int, isCanceled = None):
+        ''' Same as shortestPaths(), on a BatchRouter '''
+        arcs = []
+        for i in range(graph.edgeCount()):
+            edge = graph.edge(i)
+            arcs.append((edge.fromVertex(), edge.toVertex(), edge.cost(0)))
+        router = BatchRouter(graph.vertexCount(), arcs, processes, cls.poolChunkSize)
+        try:
+            for chunk in router.run(tasks, withPaths, isCanceled):
+                yield chunk
+        finally:
+            router.close()
+        return
+
+
+    @staticmethod
+    def serialShortestPaths(graph, tasks:list, withPaths:bool, isCanceled = None):
+        ''' Same as shortestPaths(), with dijkstra of QGIS in this process. The cancel is checked before each search '''
+        for taskIndex, (idxStart, idxEnds) in enumerate(tasks):
+            if isCanceled is not None and isCanceled():
+                return
+            (tree, costs) = QgsGraphAnalyzer.dijkstra(graph, idxStart, 0)
+            results = []
+            for idxEnd in idxEnds:
+                if idxEnd != idxStart and tree[idxEnd] == -1:
+                    results.append((idxEnd, math.inf, None))
+                    continue
+                path = None
+                if withPaths:
+                    path = []
+                    idx = idxEnd
+                    while idx != idxStart:
+                        path.append(tree[idx])
+                        idx = graph.edge(tree[idx]).fromVertex()
+                    path.reverse()
+                results.append((idxEnd, costs[idxEnd], path))
+            yield [(taskIndex, results)]
+        return
+
+
+    def route(self, graph, idxStart:int, cost:float, path:list, startPoint:QgsPointXY, endPoint:QgsPointXY, tiedStart:QgsPointXY, tiedEnd:QgsPointXY):
+        ''' 
+        Returns a tuple (points, results) of a route found by shortestPaths(), where the results have the lengths and the loss 
+        of calculateFiberLoss(). The points are None if the path has not been requested. Returns (None, None) if there is no route
+        '''
+        if math.isinf(cost):
+            return (None, None)
+        points = None
+        if path is not None:
+            points = [graph.vertex(idxStart).point()] + [graph.vertex(graph.edge(i).toVertex()).point() for i in path]
+
+        entryCost = 0
+        exitCost = 0
+        if self.includeStartStop:
+            entryCost = self.engine.geom.distanceP2P(self.crs, startPoint, tiedStart)
+            exitCost = self.engine.geom.distanceP2P(self.crs, tiedEnd, endPoint)
+            if points is not None:
+                points = [startPoint] + points + [endPoint]
+        d = {}
+        self.engine.setLengths(d, self.crs, self.conversionIndex, entryCost, cost, exitCost)
+        self.engine.calculateFiberLoss(d)
+        return (points, d)
+
+
+    def outputFields(self, idFields:list) -> QgsFields:
+        fields = QgsFields()
+        for field in idFields:
+            fields.append(field)
+        for name in self.resultFields:
+            fields.append(QgsField(name, QVariant.Double))
+        return fields
+
+
+    def addResult(self, sink, fields:QgsFields, ids:list, d:dict, points:list = None) -> None:
+        feature = QgsFeature(fields)
+        if points is not None:
+            feature.setGeometry(QgsGeometry.fromPolylineXY(points))
+        feature.setAttributes(ids + [d[key] for key in self.resultKeys])
+        sink.addFeature(feature, QgsFeatureSink.FastInsert)
+        return
+
+
+
+class PointPairRoutesAlgorithm(RoutingAlgorithm):
+
+    PAIRS = "PAIRS"
+
+    def name(self) -> str:
+        return "pointpairroutes"
+
+
+    def displayName(self) -> str:
+        return self.tr("Routes between point pairs")
+
+
+    def shortHelpString(self) -> str:
+        return self.tr("Finds the shortest route on the network from the first to the last vertex of each line of the pairs layer, "
+                       "e.g. the lines of a hub lines layer, and calculates its length and fiber loss. "
+                       "The pairs with the same start point share one search of the network. "
+                       "With more than one parallel process, the searches of a large batch run on a pool of processes that map one copy of the graph.")
+
+
+    def initAlgorithm(self, config = None) -> None:
+        self.initNetworkParameters()
+        self.addParameter(QgsProcessingParameterFeatureSource(self.PAIRS, self.tr("Point pairs (lines from start to end)"), [QgsProcessing.TypeVectorLine]))
+        self.addProcessesParameter()
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Routes"), QgsProcessing.TypeVectorLine))
+        return
+
+
+    def processAlgorithm(self, parameters, context, feedback) -> dict:
+        self.prepareNetwork(parameters, context, feedback)
+        pairsSource = self.parameterAsSource(parameters, self.PAIRS, context)
+        if pairsSource is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.PAIRS))
+        pairs = self.sourcePoints(pairsSource, context, feedback, True)
+
+        fields = self.outputFields([QgsField("pairid", QVariant.LongLong)])
+        (sink, destId) = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.LineString, self.crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        points = []
+        for (fid, startPoint, endPoint) in pairs:
+            points += [startPoint, endPoint]
+        (graph, indexes, tiedPoints) = self.networkGraph.tiePoints(points)
+
+        # One search per distinct start vertex, to the end vertexes of all the pairs that start there
+        pairsOfStart = {}
+        for k in range(len(pairs)):
+            if indexes[2 * k] >= 0 and indexes[2 * k + 1] >= 0:
+                pairsOfStart.setdefault(indexes[2 * k], []).append(k)
+        starts = list(pairsOfStart.keys())
+        tasks = [(idxStart, [indexes[2 * k + 1] for k in pairsOfStart[idxStart]]) for idxStart in starts]
+
+        processes = self.parameterAsInt(parameters, self.PROCESSES, context)
+        routed = 0
+        for chunk in self.shortestPaths(graph, tasks, True, processes, feedback):
+            for (taskIndex, results) in chunk:
+                idxStart = starts[taskIndex]
+                for k, (idxEnd, cost, path) in zip(pairsOfStart[idxStart], results):
+                    (fid, startPoint, endPoint) = pairs[k]
+                    (routePoints, d) = self.route(graph, idxStart, cost, path, startPoint, endPoint, tiedPoints[2 * k], tiedPoints[2 * k + 1])
+                    if d is not None:
+                        self.addResult(sink, fields, [fid], d, routePoints)
+                        routed += 1
+            feedback.setProgress(100.0 * routed / max(len(pairs), 1))
+
+        unreachable = len(pairs) - routed
+        if unreachable > 0:
+            feedback.pushInfo(self.tr("{} pairs have no route").format(unreachable))
+        return {self.OUTPUT: destId}
+
+
+
+class OneToManyRoutesAlgorithm(RoutingAlgorithm):
+
+    START = "START"
+    END_POINTS = "END_POINTS"
+
+    def name(self) -> str:
+        return "onetomanyroutes"
+
+
+    def displayName(self) -> str:
+        return self.tr("Routes from one point to many")
+
+
+    def shortHelpString(self) -> str:
+        return self.tr("Finds the shortest route on the network from the start point to each point of the end points layer, "
+                       "and calculates its length and fiber loss. All the routes share one search of the network.")
+
+
+    def initAlgorithm(self, config = None) -> None:
+        self.initNetworkParameters()
+        self.addParameter(QgsProcessingParameterPoint(self.START, self.tr("Start point")))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.END_POINTS, self.tr("End points"), [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Routes"), QgsProcessing.TypeVectorLine))
+        return
+
+
+    def processAlgorithm(self, parameters, context, feedback) -> dict:
+        self.prepareNetwork(parameters, context, feedback)
+        startPoint = self.parameterAsPoint(parameters, self.START, context, self.crs)
+        endSource = self.parameterAsSource(parameters, self.END_POINTS, context)
+        if endSource is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.END_POINTS))
+        ends = self.sourcePoints(endSource, context, feedback)
+
+        fields = self.outputFields([QgsField("endid", QVariant.LongLong)])
+        (sink, destId) = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.LineString, self.crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        (graph, indexes, tiedPoints) = self.networkGraph.tiePoints([startPoint] + [point for (fid, point) in ends])
+        if indexes[0] < 0:
+            raise QgsProcessingException(self.tr("The start point cannot be tied to the network"))
+        reachable = [k for k in range(len(ends)) if indexes[k + 1] >= 0]
+        tasks = [(indexes[0], [indexes[k + 1] for k in reachable])]
+
+        routed = 0
+        for chunk in self.shortestPaths(graph, tasks, True, 1, feedback):
+            for (taskIndex, results) in chunk:
+                for k, (idxEnd, cost, path) in zip(reachable, results):
+                    if feedback.isCanceled():
+                        break
+                    (fid, endPoint) = ends[k]
+                    (routePoints, d) = self.route(graph, indexes[0], cost, path, startPoint, endPoint, tiedPoints[0], tiedPoints[k + 1])
+                    if d is not None:
+                        self.addResult(sink, fields, [fid], d, routePoints)
+                        routed += 1
+                    feedback.setProgress(100.0 * (k + 1) / len(ends))
+
+        unreachable = len(ends) - routed
+        if unreachable > 0:
+            feedback.pushInfo(self.tr("{} end points have no route").format(unreachable))
+        return {self.OUTPUT: destId}
+
+
+
+class RouteMatrixAlgorithm(RoutingAlgorithm):
+
+    POINTS = "POINTS"
+
+    def name(self) -> str:
+        return "routematrix"
+
+
+    def displayName(self) -> str:
+        return self.tr("Route length and loss matrix")
+
+
+    def shortHelpString(self) -> str:
+        return self.tr("Calculates the length and the fiber loss of the shortest route on the network between every ordered pair "
+                       "of points of the layer, as a table. One search of the network is run per point. "
+                       "With more than one parallel process, the searches of a large batch run on a pool of processes that map one copy of the graph.")
+
+
+    def initAlgorithm(self, config = None) -> None:
+        self.initNetworkParameters()
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINTS, self.tr("Points"), [QgsProcessing.TypeVectorPoint]))
+        self.addProcessesParameter()
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Matrix"), QgsProcessing.TypeVector))
+        return
+
+
+    def processAlgorithm(self, parameters, context, feedback) -> dict:
+        self.prepareNetwork(parameters, context, feedback)
+        pointsSource = self.parameterAsSource(parameters, self.POINTS, context)
+        if pointsSource is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.POINTS))
+        items = self.sourcePoints(pointsSource, context, feedback)
+
+        fields = self.outputFields([QgsField("fromid", QVariant.LongLong), QgsField("toid", QVariant.LongLong)])
+        (sink, destId) = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.NoGeometry, self.crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        (graph, indexes, tiedPoints) = self.networkGraph.tiePoints([point for (fid, point) in items])
+        valid = [i for i in range(len(items)) if indexes[i] >= 0]
+        tasks = [(indexes[i], [indexes[j] for j in valid if j != i]) for i in valid]
+
+        processes = self.parameterAsInt(parameters, self.PROCESSES, context)
+        done = 0
+        for chunk in self.shortestPaths(graph, tasks, False, processes, feedback):
+            for (taskIndex, results) in chunk:
+                i = valid[taskIndex]
+                (fromId, fromPoint) = items[i]
+                for j, (idxEnd, cost, path) in zip([j for j in valid if j != i], results):
+                    (toId, toPoint) = items[j]
+                    (routePoints, d) = self.route(graph, indexes[i], cost, None, fromPoint, toPoint, tiedPoints[i], tiedPoints[j])
+                    if d is not None:
+                        self.addResult(sink, fields, [fromId, toId], d)
+                done += 1
+            feedback.setProgress(100.0 * done / max(len(valid), 1))
+        return {self.OUTPUT: destId}
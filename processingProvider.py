@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    processingProvider.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import os
+
+from qgis.core import QgsApplication, QgsProcessingProvider
+from qgis.PyQt.QtGui import QIcon
+
+from .processingAlgorithms import PointPairRoutesAlgorithm, OneToManyRoutesAlgorithm, RouteMatrixAlgorithm
+
+'''
+The Processing provider of the plugin, so that the routes and the fiber loss can be calculated 
+from models, batch runs and qgis_process, without the map canvas.
+'''
+
+class OnTheFlyProcessingProvider(QgsProcessingProvider):
+
+    def loadAlgorithms(self) -> None:
+        self.addAlgorithm(PointPairRoutesAlgorithm())
+        self.addAlgorithm(OneToManyRoutesAlgorithm())
+        self.addAlgorithm(RouteMatrixAlgorithm())
+        return
+
+
+    def id(self) -> str:
+        return "otfshortestpath"
+
+
+    def name(self) -> str:
+        return "On-the-Fly Shortest Path"
+
+
+    def icon(self) -> QIcon:
+        return QIcon(os.path.join(os.path.dirname(__file__), "logo.png"))
+
+
+
+class ProcessingPlugin:
+    ''' The plugin as loaded by qgis_process, without the QGIS interface. It offers only the Processing provider '''
+
+    def __init__(self):
+        self.provider = None
+        return
+
+
+    def initProcessing(self) -> None:
+        self.provider = OnTheFlyProcessingProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+        return
+
+
+    def initGui(self) -> None:
+        self.initProcessing()
+        return
+
+
+    def unload(self) -> None:
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+        return
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    resultWriter.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import csv
+import os
+
+from osgeo import ogr, osr
+from qgis.core import ( QgsCoordinateReferenceSystem,
+                        QgsFields,
+                        QgsGeometry
+                      )
+from qgis.PyQt.QtCore import Qt, QDateTime, QUrl, QVariant
+
+'''
+Writes the results of a batch to a GeoPackage or a CSV file while they are produced, instead of collecting
+them in a memory layer. The features are buffered and written in chunks of fixed size. Each chunk of a GeoPackage 
+is one transaction, and each chunk of a CSV file is flushed to the disk, so that the memory does not grow with the 
+size of the batch and the chunks already written are kept if the run stops.
+'''
+
+class RouteWriter:
+
+    # QVariant type of the fields -> OGR field type. Other types are written as text
+    ogrFieldTypes = { QVariant.Int: ogr.OFTInteger,
+                      QVariant.LongLong: ogr.OFTInteger64,
+                      QVariant.Double: ogr.OFTReal,
+                      QVariant.String: ogr.OFTString,
+                      QVariant.DateTime: ogr.OFTDateTime
+                    }
+
+    def __init__(self, fileName:str, layerName:str, fields:QgsFields, crs:QgsCoordinateReferenceSystem, chunkSize:int = 1000, 
+                 geometryType:int = ogr.wkbLineString, replaceFile:bool = True):
+        ''' 
+        Creates the file, replacing an existing one. The format is CSV, with the geometry as WKT, if the file name ends with .csv, otherwise GeoPackage.
+        If replaceFile is False, an existing GeoPackage is kept and the layer is added to it, or reused if the GeoPackage already has it
+        '''
+        self.fileName = fileName
+        self.layerName = layerName
+        self.crs = crs
+        self.chunkSize = chunkSize
+        # (geometry or None, attributes) of the features not written yet
+        self.buffer = []
+        self.featureCount = 0
+        self.isCsv = fileName.lower().endswith(".csv")
+
+        if self.isCsv:
+            self.file = open(fileName, "w", newline = "", encoding = "utf-8")
+            self.csvWriter = csv.writer(self.file)
+            self.csvWriter.writerow(["wkt"] + fields.names())
+            return
+
+        driver = ogr.GetDriverByName("GPKG")
+        if os.path.exists(fileName) and not replaceFile:
+            self.dataSource = ogr.Open(fileName, 1)
+            self.layer = self.dataSource.GetLayerByName(layerName)
+            if self.layer is not None:
+                self.layerDefinition = self.layer.GetLayerDefn()
+                return
+        else:
+            if os.path.exists(fileName):
+                driver.DeleteDataSource(fileName)
+            self.dataSource = driver.CreateDataSource(fileName)
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(crs.toWkt())
+        # GDAL 3 uses the axis order of the authority, e.g. latitude first for EPSG:4326, unless told otherwise
+        if hasattr(srs, "SetAxisMappingStrategy"):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        self.layer = self.dataSource.CreateLayer(layerName, srs if geometryType != ogr.wkbNone else None, geometryType)
+        for field in fields:
+            self.layer.CreateField(ogr.FieldDefn(field.name(), self.ogrFieldTypes.get(field.type(), ogr.OFTString)))
+        self.layerDefinition = self.layer.GetLayerDefn()
+        return
+
+
+    def addFeature(self, geometry:QgsGeometry, attributes:list) -> None:
+        ''' Adds a feature, in the order of the fields. The geometry may be None and the attributes may be None '''
+        self.buffer.append((geometry, attributes))
+        if len(self.buffer) >= self.chunkSize:
+            self.flush()
+        return
+
+
+    def flush(self) -> None:
+        ''' Writes the buffered features as one chunk '''
+        if len(self.buffer) == 0:
+            return
+        if self.isCsv:
+            for (geometry, attributes) in self.buffer:
+                wkt = geometry.asWkt() if geometry is not None else ""
+                self.csvWriter.writerow([wkt] + ["" if value is None else value for value in attributes])
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        else:
+            self.layer.StartTransaction()
+            for (geometry, attributes) in self.buffer:
+                feature = ogr.Feature(self.layerDefinition)
+                for i, value in enumerate(attributes):
+                    if isinstance(value, QDateTime):
+                        value = value.toString(Qt.ISODate)
+                    if value is not None:
+                        feature.SetField(i, value)
+                if geometry is not None:
+                    feature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(geometry.asWkb())))
+                self.layer.CreateFeature(feature)
+            self.layer.CommitTransaction()
+        self.featureCount += len(self.buffer)
+        self.buffer = []
+        return
+
+
+    def close(self) -> None:
+        ''' Writes the remaining features and closes the file '''
+        self.flush()
+        if self.isCsv:
+            self.file.close()
+        else:
+            # Dereferencing the OGR objects closes the file
+            self.layerDefinition = None
+            self.layer = None
+            self.dataSource = None
+        return
+
+
+    def layerSource(self):
+        ''' Returns a tuple (uri, provider) to load the written file as a layer '''
+        if self.isCsv:
+            uri = QUrl.fromLocalFile(self.fileName).toString() + "?delimiter=,&wktField=wkt&crs=" + self.crs.authid()
+            return (uri, "delimitedtext")
+        return (self.fileName + "|layername=" + self.layerName, "ogr")
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    routingEngine.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import ( Qgis,
+                        QgsCoordinateReferenceSystem,
+                        QgsCoordinateTransform,
+                        QgsCoordinateTransformContext,
+                        QgsFeature,
+                        QgsFeatureRequest,
+                        QgsField,
+                        QgsFields,
+                        QgsMemoryProviderUtils,
+                        QgsPointXY,
+                        QgsVectorLayer,
+                        QgsWkbTypes
+                      )
+from qgis.analysis import QgsGraphAnalyzer
+
+from .bridge import BridgeLayer
+from .fiberLoss import FiberLoss
+from .geometry import OtFSP_Geometry
+from .measurementCache import MeasurementCache
+from .stageTimer import StageTimer
+from .networkGraph import NetworkGraph
+from .networkStrategies import FeatureSources, FiberLossStrategy
+from .waypointOrder import WaypointOrder
+
+'''
+The routing of the plugin without the QGIS interface: the graph of the network, the bridges, the routes through
+the waypoints and the fiber loss. The input is the configuration dictionary of the plugin and points in the CRS
+of the graph. The routes are returned as lists of (x, y) coordinates, with the results dictionary of the plugin,
+so that the dock widget only draws them. The conditions that the user should know about are collected in 
+self.messages as (title, message, level), since there is no message bar to show them.
+'''
+
+class RoutingEngine:
+
+    # Same values as the calculation modes of the plugin that route between waypoints
+    CALCULATION_SHORTEST_PATH = 0
+    CALCULATION_DIVERSE_PAIR = 1
+    CALCULATION_K_SHORTEST_PATHS = 2
+
+    resultUnitsList = ["m", "Km", "yd", "ft", "NM", "mi"]
+
+    # The keys of the configuration that change the results of calculate() on the same graph
+    resultConfigKeys = ["calculationModeIndex", "numberOfRoutes", "diversePairNodeDisjoint", "optimizeWaypointOrder", "includeStartStop", 
+                        "entryExitLengthLimit", "distanceUnitsIndex", "countSplices", "addFeatureReport", "reportFields", "minimumLossRouting",
+                        "attenuationField", "spliceFlagField", "connectorLoss", "numberOfConnectorsAtEntry", "numberOfConnectorsAtExit", 
+                        "spliceLoss", "spliceFrequency", "cableLoss", "fixedLoss"]
+
+    def __init__(self, config:dict, addFixedLoss:bool = True, stageTimer:StageTimer = None):
+        self.config = config
+        self.addFixedLoss = addFixedLoss
+        # The time of the stages of the calculations is added to the timer
+        self.stageTimer = stageTimer if stageTimer is not None else StageTimer()
+        self.geom = OtFSP_Geometry()
+        self.messages = []
+        return
+
+
+    def addMessage(self, title:str, message:str, level = Qgis.Info) -> None:
+        self.messages.append((title, message, level))
+        return
+
+
+    def mergeLayers(self, crs:QgsCoordinateReferenceSystem, layers:list, requests:list, transformContext:QgsCoordinateTransformContext, 
+                    storeOriginalLayerInfo:bool = False, sourceIds:dict = None, layerName:str = "analysisLayer") -> QgsVectorLayer:
+        ''' 
+        Merges the features of the layers, read with the request of each layer, into a memory layer in the CRS. If storeOriginalLayerInfo is set, 
+        the features keep the number of their layer in the field "layerno", which is used by the bridges. If sourceIds is given, 
+        it is filled with merged feature id -> (layerno, original feature id). Returns None on error
+        '''
+        with self.stageTimer.stage("mergedMemoryLayer"):
+            fields = QgsFields()
+            if storeOriginalLayerInfo == True:
+                # Keep in the merged layer some data from the original layer (to be used e.g. for same layer bridging)
+                fields.append(QgsField("layerno", QVariant.String))
+            pathLayer = QgsMemoryProviderUtils.createMemoryLayer(layerName, fields, QgsWkbTypes.LineString, crs)
+            if not pathLayer.isValid():
+                self.addMessage("Error", "Failed to create memory layer", Qgis.Critical)
+                return None
+            # To avoid QGIS issuing warning message to save project and potential data loss if there are any non-empty memory layers present
+            pathLayer.setCustomProperty("skipMemoryLayersCheck", 1)
+            pathLayerDataProvider = pathLayer.dataProvider()
+
+            for layerno, (layer, request) in enumerate(zip(layers, requests)):
+                if layer.crs().authid() == "":
+                    # just ignore and continue to the next layer
+                    self.addMessage("Warning", "Layer " + layer.name() + " does not have a valid CRS", Qgis.Warning)
+                    continue
+                features = layer.getFeatures(request)
+
+                # Take a shortcut if we do not need original layer info, to avoid going through each feature 
+                if storeOriginalLayerInfo == False and layer.crs().authid() == crs.authid():
+                    if sourceIds is None:
+                        pathLayerDataProvider.addFeatures(features)
+                    else:
+                        features = list(features)
+                        originalIds = [feature.id() for feature in features]
+                        (result, addedFeatures) = pathLayerDataProvider.addFeatures(features)
+                        for originalId, addedFeature in zip(originalIds, addedFeatures):
+                            sourceIds[addedFeature.id()] = (layerno, originalId)
+                    continue
+
+                xform = None
+                if layer.crs().authid() != crs.authid():
+                    # NOTE: Does transformation maintains topological snapping between layers of different CRS or when two layers of a CRS are transformed to the memory layer CRS?
+                    try:
+                        xform = QgsCoordinateTransform(layer.crs(), crs, transformContext)
+                    except:
+                        self.addMessage("Error", "Coordinate transformation of merging layers failed", Qgis.Critical)
+                        return None
+
+                for feature in features:
+                    geometry = feature.geometry()
+                    if xform is not None:
+                        try:
+                            geometry.transform(xform)
+                        except:
+                            continue
+                    mergedFeature = QgsFeature()
+                    mergedFeature.setGeometry(geometry)
+                    if storeOriginalLayerInfo == True:
+                        mergedFeature.setFields(fields)
+                        mergedFeature.setAttribute("layerno", layerno)
+                    (result, addedFeatures) = pathLayerDataProvider.addFeatures([mergedFeature])
+                    if sourceIds is not None and result == True:
+                        sourceIds[addedFeatures[0].id()] = (layerno, feature.id())
+
+            pathLayer.updateExtents()
+        return pathLayer
+
+
+    def lossStrategy(self,pathLayer:QgsVectorLayer, featureSources:FeatureSources) -> FiberLossStrategy:
+        ''' 
+        Returns the strategy of the fiber loss of the edges, if the routes are by minimum loss or the attenuation is taken from the features.
+        Otherwise, returns None and the loss is calculated from the length of the route 
+        '''
+        conf = self.config
+        # When the splices are counted on the path, the splice flags are not used
+        spliceFlagField = conf["spliceFlagField"] if conf["countSplices"] == 0 else ""
+        if conf["minimumLossRouting"] == 0 and conf["attenuationField"] == "" and spliceFlagField == "":
+            return None
+        return FiberLossStrategy.fromFeatureSources(featureSources, pathLayer, conf["attenuationField"], spliceFlagField, 
+                                                    conf["cableLoss"], conf["spliceLoss"])
+
+
+    def buildGraph(self, pathLayer:QgsVectorLayer, crs:QgsCoordinateReferenceSystem, topologyTolerance:float, featureSources:FeatureSources = None, key = None) -> NetworkGraph:
+        ''' Builds the graph of the path layer with the criteria required by the configuration. The tolerance is in units of the CRS '''
+        if featureSources is None:
+            featureSources = FeatureSources([pathLayer])
+        with self.stageTimer.stage("lossStrategy"):
+            lossStrategy = self.lossStrategy(pathLayer, featureSources)
+        with self.stageTimer.stage("makeGraph"):
+            networkGraph = NetworkGraph(pathLayer, crs, topologyTolerance, key, featureSources, lossStrategy, 
+                                        self.config["minimumLossRouting"] == 1, 
+                                        self.config["countSplices"] == 1 or self.config["addFeatureReport"] == 1)
+        return networkGraph
+
+
+    def createBridges(self, pathLayer:QgsVectorLayer, pointLayers:list, bridgePointTolerance:float, bridgeLineTolerance:float, storeOriginalLayerInfo:bool) -> None:
+        ''' 
+        Adds to the path layer the lines that bridge the gaps at the points of the point layers. The first point layer is the layer of 
+        the markers of the bridging line tool, or None. The tolerances are in units of the CRS of the path layer
+        '''
+        bridge = BridgeLayer(None)
+        bridge.setTolerance(bridgePointTolerance = bridgePointTolerance, bridgeLineTolerance = bridgeLineTolerance)
+        bridge.setLayers(pointLayers, pathLayer, storeOriginalLayerInfo = storeOriginalLayerInfo)
+        with self.stageTimer.stage("createBridges"):
+            bridge.createBridges()
+        return
+
+
+    def routeOnGraph(self, networkGraph:NetworkGraph, graph, idxStart:int, edges:list) -> dict:
+        ''' 
+        Returns a dictionary with the points, the length, the fiber loss and the features of a route, given as the edges of the graph 
+        from the start vertex. When the route is by minimum loss, the length is the sum of the length of the edges
+        '''
+        start = graph.vertex(idxStart).point()
+        route = [(start.x(), start.y())]
+        length = 0
+        loss = 0
+        # The features of the path layer of the edges and the length of the edges
+        featureIds = []
+        featureLengths = []
+        for idx in edges:
+            edge = graph.edge(idx)
+            length += edge.cost(0)
+            if networkGraph.lossCriterion >= 0:
+                loss += edge.cost(networkGraph.lossCriterion)
+            if networkGraph.featureCriterion >= 0:
+                featureIds.append(int(edge.cost(networkGraph.featureCriterion)))
+                featureLengths.append(edge.cost(0))
+            p = graph.vertex(edge.toVertex()).point()
+            route.append((p.x(), p.y()))
+
+        return {
+            "route": route,
+            "costOnGraph": length,
+            "lossOnGraph": loss if networkGraph.lossCriterion >= 0 else None,
+            "featureIds": featureIds,
+            "featureLengths": featureLengths,
+        }
+
+
+    def findRoute(self, networkGraph:NetworkGraph, graph, idxStart:int, idxEnd:int) -> dict:
+        ''' 
+        Returns the result of routeOnGraph() for the shortest route between two vertices of a graph returned by networkGraph.tiePoints(), 
+        or None if there is no route
+        ''' 
+        with self.stageTimer.stage("dijkstra"):
+            (tree, costs) = QgsGraphAnalyzer.dijkstra(graph, idxStart, networkGraph.criterion)
+        if idxEnd != idxStart and tree[idxEnd] == -1:
+            return None
+
+        # Iterate the graph, from the end to the start
+        edges = []
+        idx = idxEnd
+        while idx != idxStart:
+            edges.append(tree[idx])
+            idx = graph.edge(tree[idx]).fromVertex()
+        edges.reverse()
+
+        d = self.routeOnGraph(networkGraph, graph, idxStart, edges)
+        if networkGraph.criterion == 0:
+            d["costOnGraph"] = costs[idxEnd]
+        return d
+
+
+    def findAlternativeRoutes(self, networkGraph:NetworkGraph, graph, idxStart:int, idxEnd:int) -> list:
+        ''' 
+        Same as findRoute() for all the routes of the calculation mode: the working and the protection path of the pair of diverse paths 
+        with the minimum total cost, or the k shortest paths. The first item is the main route. Returns an empty list if there is no route
+        '''
+        with self.stageTimer.stage("alternativePaths"):
+            if self.config["calculationModeIndex"] == self.CALCULATION_K_SHORTEST_PATHS:
+                paths = networkGraph.graphPaths(graph).kShortestPaths(idxStart, idxEnd, self.config["numberOfRoutes"])
+            else:
+                paths = networkGraph.graphPaths(graph).diversePair(idxStart, idxEnd, self.config["diversePairNodeDisjoint"] == 1)
+
+        return [self.routeOnGraph(networkGraph, graph, idxStart, edges) for edges in paths]
+
+
+    def waypointOrder(self, networkGraph:NetworkGraph, points:list) -> list:
+        ''' Returns the order of the visit of the waypoints, as indexes of the list of points '''
+        order = list(range(len(points)))
+        calculationMode = self.config["calculationModeIndex"]
+        if calculationMode in [self.CALCULATION_DIVERSE_PAIR, self.CALCULATION_K_SHORTEST_PATHS]:
+            # The modes that find several routes between the start and the end point
+            if len(points) > 2:
+                self.addMessage("Info", "The middle waypoints are not used by the " + ["", "diverse pair", "k shortest paths"][calculationMode])
+                order = [0, len(points) - 1]
+        elif self.config["optimizeWaypointOrder"] == 1 and len(points) > 3:
+            # Visit the middle waypoints in the order of the minimum total length
+            optimalOrder = WaypointOrder(networkGraph.costMatrix(points)).optimalOrder()
+            if optimalOrder != order:
+                self.addMessage("Info", "The middle waypoints have been reordered for the minimum total length")
+                order = optimalOrder
+        return order
+
+
+    def cacheKey(self, networkGraph:NetworkGraph, points:list) -> tuple:
+        ''' 
+        Returns the key of a measurement in a MeasurementCache: the waypoints, the configuration of the results and the fixed loss. 
+        A waypoint on a junction is keyed by its graph vertex, so that the markers snapped on the same junction give the same key
+        '''
+        waypoints = []
+        for p in points:
+            idx = networkGraph.vertexAt(p)
+            waypoints.append(("vertex", idx) if idx >= 0 else (p.x(), p.y()))
+        return (tuple(waypoints), tuple(self.config[key] for key in self.resultConfigKeys), self.addFixedLoss)
+
+
+    def calculate(self, networkGraph:NetworkGraph, points:list, cache:MeasurementCache = None) -> dict:
+        '''
+        Calculates the route that visits the waypoints, which are in the CRS of the graph. Each leg is routed on the same graph.
+        Returns the results dictionary of the plugin, with the route of each leg in "legRoutes" and the order of the visit of 
+        the waypoints in "waypointOrder". The items of "alternatives" have their route in "route". Returns None if there is no route.
+        If a cache is given, a measurement of the same waypoints on the same graph is returned from the cache
+        '''
+        self.messages = []
+        if cache is None:
+            return self.calculateRoute(networkGraph, points)
+        cache.setGraphVersion(networkGraph.version)
+        key = self.cacheKey(networkGraph, points)
+        cached = cache.get(key)
+        self.stageTimer.setCount("cachedMeasurement", int(cached is not None))
+        if cached is not None:
+            (d, self.messages) = cached
+            return d
+        d = self.calculateRoute(networkGraph, points)
+        cache.put(key, (d, self.messages))
+        return d
+
+
+    def calculateRoute(self, networkGraph:NetworkGraph, points:list) -> dict:
+        ''' Same as calculate(), without a cache '''
+        with self.stageTimer.stage("waypointOrder"):
+            order = self.waypointOrder(networkGraph, points)
+        points = [points[i] for i in order]
+        includeStartStop = self.config["includeStartStop"] == 1
+        calculationMode = self.config["calculationModeIndex"]
+
+        ''' All the waypoints are tied to the network on one graph, where each leg is routed between the points of the network 
+            nearest to its waypoints. If all the waypoints are junctions of the network, the cached graph is used '''
+        with self.stageTimer.stage("tiePoints"):
+            (graph, indexes, tiedPoints) = networkGraph.tiePoints(points)
+        # Measure the distance from the start and stop point to the entry and exit point of the graph
+        entryCost = self.geom.distanceP2P(networkGraph.crs, points[0], tiedPoints[0])
+        exitCost = self.geom.distanceP2P(networkGraph.crs, tiedPoints[-1], points[-1])
+
+        legs = []
+        # The routes other than the main route, e.g. the protection path of a diverse pair
+        alternatives = []
+        for i in range(len(points) - 1):
+            if calculationMode in [self.CALCULATION_DIVERSE_PAIR, self.CALCULATION_K_SHORTEST_PATHS]:
+                routes = self.findAlternativeRoutes(networkGraph, graph, indexes[i], indexes[i + 1])
+                if len(routes) == 0:
+                    return None
+                leg = routes[0]
+                alternatives = routes[1:]
+            else:
+                leg = self.findRoute(networkGraph, graph, indexes[i], indexes[i + 1])
+            if leg is None:
+                return None
+            legs.append(leg)
+        for route in legs + alternatives:
+            route["entryCost"] = entryCost
+            route["exitCost"] = exitCost
+
+        # The lines from the start and to the end point 
+        if includeStartStop:
+            start = (points[0].x(), points[0].y())
+            end = (points[-1].x(), points[-1].y())
+            legs[0]["route"].insert(0, start)
+            legs[-1]["route"].append(end)
+            for d in alternatives:
+                d["route"] = [start] + d["route"] + [end]
+
+        crs = networkGraph.crs
+        d = {}
+        # Get the details of the measurements, i.e. the distance units of the CRS
+        crsData = self.geom.crsDetails(crs)          
+        d["ellipsoid"] = crsData[0] 
+        d["crs"] = crsData[1] + "/" + crsData[2] 
+
+        ''' We expect that the distance units returned by crsData[3] will be meters in order to make 
+            our conversions. Most CRS and associated ellipsoids' units are in meters or can be converted by QGIS from 
+            feet or other unit to meters. If not, or in case a CRS is not defined for the project,
+            we return the values and units returned by QgsDistanceArea class without conversion 
+            From 1.2.1, we convert to meters and use meters for fiber loss calculations    
+        '''
+        if crsData[3] == "meters":
+            conversionIndex = self.config["distanceUnitsIndex"]
+            d["lengthUnits"] = self.resultUnitsList[conversionIndex]
+        else: 
+            conversionIndex = -1
+            d["lengthUnits"] = crsData[3]
+            self.addMessage("Warning", "Base distance unit is not meters but " + crsData[3] +". Unit conversion is taking place", Qgis.Warning)
+
+        self.setLengths(d, crs, conversionIndex, entryCost, sum(leg["costOnGraph"] for leg in legs), exitCost)
+        entryExitLimit = float(self.config["entryExitLengthLimit"])
+        if entryExitLimit != 0 and (entryCost > entryExitLimit or exitCost > entryExitLimit):
+            self.addMessage("Warning", "Entry or exit cost is higher than the preset limit. Check the distance of the start/end marker from the entry/exit points of the path.", Qgis.Warning)
+
+        featureIds = [fid for leg in legs for fid in leg["featureIds"]]
+        featureLengths = [length for leg in legs for length in leg["featureLengths"]]
+        d["legCosts"] = [self.geom.convertDistanceUnits(leg["costOnGraph"], conversionIndex) for leg in legs]
+        d["cableLossOnGraph"] = sum(leg["lossOnGraph"] for leg in legs) if networkGraph.lossCriterion >= 0 else None
+        self.setSplices(d, networkGraph, featureIds)
+        d["traversedFeatures"] = None
+        if networkGraph.featureCriterion >= 0 and self.config["addFeatureReport"] == 1:
+            with self.stageTimer.stage("traversedFeatures"):
+                d["traversedFeatures"] = self.traversedFeatures(d, networkGraph.featureSources, featureIds, featureLengths, conversionIndex)
+        self.calculateFiberLoss(d)
+
+        d["alternatives"] = [self.alternativeRouteResults(networkGraph, conversionIndex, d["lengthUnits"], alternative) for alternative in alternatives]
+        d["note"] = ""
+        if calculationMode == self.CALCULATION_DIVERSE_PAIR and len(alternatives) == 0:
+            self.addMessage("Warning", "There is no diverse path. Only the working path is shown", Qgis.Warning)
+            d["note"] = "No diverse path"
+        elif calculationMode == self.CALCULATION_K_SHORTEST_PATHS and len(alternatives) == 0:
+            self.addMessage("Info", "There is no other route between the start and the end point")
+            d["note"] = "No alternative route"
+
+        d["legRoutes"] = [leg["route"] for leg in legs]
+        d["waypointOrder"] = order
+        return d
+
+
+    def setLengths(self, d:dict, crs:QgsCoordinateReferenceSystem, conversionIndex:int, entryCost:float, costOnGraph:float, exitCost:float) -> None:
+        ''' Sets the lengths of a results dictionary in meters and in the result units. The costs are in the units of the graph '''
+        for key, cost in [("entryCost", entryCost), ("costOnGraph", costOnGraph), ("exitCost", exitCost)]:
+            # From 1.2.1, the lengths are also stored in meters, for the fiber loss where the attenuation is given as db/Km
+            d[key + "Meters"] = cost if conversionIndex >= 0 else self.geom.lengthInMeters(cost, crs)
+            # Convert distances in the configuration selected units if the original unit is in meters, otherwise leave as is   
+            d[key] = self.geom.convertDistanceUnits(cost, conversionIndex)
+        d["totalCostMeters"] = d["entryCostMeters"] + d["costOnGraphMeters"] + d["exitCostMeters"]
+        d["totalCost"] = d["entryCost"] + d["costOnGraph"] + d["exitCost"]
+        return
+
+
+    def setSplices(self, d:dict, networkGraph:NetworkGraph, featureIds:list) -> None:
+        ''' Sets the splices and the bridge crossings counted on the path, if available '''
+        if networkGraph.featureCriterion >= 0 and self.config["countSplices"] == 1:
+            (d["spliceCount"], d["bridgeCrossings"]) = networkGraph.featureSources.countSplices(featureIds)
+        else:
+            d["spliceCount"] = None
+            d["bridgeCrossings"] = None
+        return
+
+
+    def alternativeRouteResults(self, networkGraph:NetworkGraph, conversionIndex:int, lengthUnits:str, routeData:dict) -> dict:
+        ''' Returns a results dictionary, with the route, the lengths and the fiber loss, of a route other than the main route '''
+        d = {"route": routeData["route"], "lengthUnits": lengthUnits, "cableLossOnGraph": routeData["lossOnGraph"]}
+        self.setLengths(d, networkGraph.crs, conversionIndex, routeData["entryCost"], routeData["costOnGraph"], routeData["exitCost"])
+        self.setSplices(d, networkGraph, routeData["featureIds"])
+        self.calculateFiberLoss(d)
+        return d
+
+
+    def traversedFeatures(self, d:dict, featureSources:FeatureSources, featureIds:list, featureLengths:list, conversionIndex:int) -> list:
+        ''' 
+        Returns the rows of the table of the traversed features, as [layer name, feature id, length, values of the report fields],
+        where the length is in the result units. The report fields are also stored in the results dictionary 
+        '''
+        reportFields = [name.strip() for name in self.config["reportFields"].split(",") if name.strip() != ""]
+        d["reportFields"] = reportFields
+        
+        items = featureSources.traversedFeatures(featureIds, featureLengths)
+        values = {}
+        if len(reportFields) > 0:
+            values = featureSources.attributeValues(reportFields, [item[0] for item in items if item[1] is not None])
+            
+        rows = []
+        for (fid, layerno, sourceId, length) in items:
+            layerName = featureSources.layers[layerno].name() if layerno is not None else "bridge"
+            rows.append([layerName, sourceId, self.geom.convertDistanceUnits(length, conversionIndex), values.get(fid, [None] * len(reportFields))])
+        return rows
+
+
+    def calculateFiberLoss(self, d:dict) -> None:
+        ''' Sets the fiber loss of a results dictionary, which has been populated with the lengths in meters '''
+        FiberLoss(self.config, self.addFixedLoss).calculate(d, self.config["spliceFlagField"] != "")
+        return
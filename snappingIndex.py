@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    snappingIndex.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+from qgis.core import ( QgsApplication,
+                        QgsCoordinateReferenceSystem,
+                        QgsCoordinateTransform,
+                        QgsCoordinateTransformContext,
+                        QgsFeature,
+                        QgsFeatureRequest,
+                        QgsGeometry,
+                        QgsPointXY,
+                        QgsRectangle,
+                        QgsSpatialIndex,
+                        QgsTask,
+                        QgsVectorLayer,
+                        QgsVectorLayerFeatureSource,
+                        QgsWkbTypes
+                      )
+
+'''
+A single spatial index over the vertices and segments of several layers, used by the snapping tools.
+One query returns the nearest vertex or segment point together with every layer that touches it,
+instead of querying one QgsPointLocator per layer.
+'''
+
+class SnappingIndex:
+
+    # Same values as MapToolSnapToLayers.MARKER_SNAPS_TO_VERTICES and MARKER_SNAPS_TO_SEGMENT_EDGES
+    SNAP_TO_VERTICES = 1
+    SNAP_TO_SEGMENT_EDGES = 2
+
+    def __init__(self, layers, destinationCrs:QgsCoordinateReferenceSystem, transformContext:QgsCoordinateTransformContext, extent:QgsRectangle = None):
+        '''
+        Must be created in the main thread, because it takes a snapshot of the feature source of each layer.
+        The extent, if given, is in the destination CRS.
+        '''
+        self.layers = []
+        self.sources = []
+        self.extent = extent
+        for layer in layers:
+            if not isinstance(layer, QgsVectorLayer):
+                continue
+            try:
+                xform = QgsCoordinateTransform(layer.crs(), destinationCrs, transformContext)
+            except:
+                # Do not let a layer which cannot be transformed stop the snapping to the rest of the layers
+                continue
+            request = QgsFeatureRequest().setNoAttributes()
+            if extent is not None:
+                try:
+                    request.setFilterRect(xform.transformBoundingBox(extent, QgsCoordinateTransform.ReverseTransform))
+                except:
+                    pass
+            self.layers.append(layer)
+            self.sources.append((QgsVectorLayerFeatureSource(layer), request, xform, layer.geometryType() == QgsWkbTypes.LineGeometry))
+
+        self.vertexIndex = QgsSpatialIndex()
+        # id -> QgsPointXY and id -> set of layer numbers. Vertices with identical coordinates share one id.
+        # A vertex whose set of layers is empty has been removed from the spatial index, see replaceLayer()
+        self.vertexPoints = []
+        self.vertexLayers = []
+        # (x, y) -> id
+        self.vertexIds = {}
+
+        self.segmentIndex = QgsSpatialIndex()
+        # id -> (QgsPointXY, QgsPointXY, layer number), or None for a segment removed by replaceLayer()
+        self.segments = []
+
+        self.isReady = False
+        # Incremented by every change after the build, so that the candidates kept by a tool can be checked, see candidates()
+        self.version = 0
+        return
+
+
+    def build(self, task:QgsTask = None) -> bool:
+        ''' Reads the features of all layers and fills the indexes. Can run in a background task. '''
+        for layerNo, (source, request, xform, isLine) in enumerate(self.sources):
+            for feature in source.getFeatures(request):
+                if task is not None and task.isCanceled():
+                    return False
+                geometry = feature.geometry()
+                if geometry.isEmpty():
+                    continue
+                if not xform.isShortCircuited():
+                    try:
+                        geometry.transform(xform)
+                    except:
+                        continue
+
+                for part in geometry.constParts():
+                    previousPoint = None
+                    for vertex in part.vertices():
+                        point = QgsPointXY(vertex.x(), vertex.y())
+                        self.addVertex(point, layerNo)
+                        if isLine and previousPoint is not None:
+                            self.addSegment(previousPoint, point, layerNo)
+                        previousPoint = point
+
+        # The feature sources are not needed any more
+        self.sources.clear()
+        self.isReady = True
+        return True
+
+
+    def addVertex(self, point:QgsPointXY, layerNo:int) -> None:
+        key = (point.x(), point.y())
+        vertexId = self.vertexIds.get(key)
+        if vertexId is None:
+            vertexId = len(self.vertexPoints)
+            self.vertexIds[key] = vertexId
+            self.vertexPoints.append(point)
+            self.vertexLayers.append(set())
+        if len(self.vertexLayers[vertexId]) == 0:
+            self.vertexIndex.addFeature(vertexId, QgsRectangle(point, point))
+        self.vertexLayers[vertexId].add(layerNo)
+        return
+
+
+    def addSegment(self, p1:QgsPointXY, p2:QgsPointXY, layerNo:int) -> None:
+        segmentId = len(self.segments)
+        self.segments.append((p1, p2, layerNo))
+        self.segmentIndex.addFeature(segmentId, QgsRectangle(p1, p2))
+        return
+
+
+    def replaceLayer(self, layer:QgsVectorLayer, layerIndex:'SnappingIndex') -> None:
+        ''' 
+        Replaces the vertices and segments of one of the layers with those of layerIndex, an index built over this layer only.
+        Must run in the main thread, where the index is queried
+        '''
+        layerIds = [l.id() for l in self.layers]
+        if layer.id() not in layerIds:
+            return
+        layerNo = layerIds.index(layer.id())
+        self.version += 1
+
+        # QgsSpatialIndex.deleteFeature() finds the entry by the id and the bounding box of the geometry
+        for vertexId, layerNumbers in enumerate(self.vertexLayers):
+            if layerNo in layerNumbers:
+                layerNumbers.discard(layerNo)
+                if len(layerNumbers) == 0:
+                    feature = QgsFeature(vertexId)
+                    feature.setGeometry(QgsGeometry.fromPointXY(self.vertexPoints[vertexId]))
+                    self.vertexIndex.deleteFeature(feature)
+        for segmentId, segment in enumerate(self.segments):
+            if segment is not None and segment[2] == layerNo:
+                feature = QgsFeature(segmentId)
+                feature.setGeometry(QgsGeometry.fromPolylineXY([segment[0], segment[1]]))
+                self.segmentIndex.deleteFeature(feature)
+                self.segments[segmentId] = None
+
+        for vertexId, point in enumerate(layerIndex.vertexPoints):
+            if len(layerIndex.vertexLayers[vertexId]) > 0:
+                self.addVertex(point, layerNo)
+        for segment in layerIndex.segments:
+            if segment is not None:
+                self.addSegment(segment[0], segment[1], layerNo)
+        return
+
+
+    def nearest(self, point:QgsPointXY, tolerance:float, snappingMethod:int = SNAP_TO_VERTICES):
+        '''
+        Returns a tuple (matched point, list of layers) for the nearest vertex or segment within tolerance,
+        where the list contains every layer touching the matched point. Returns (None, []) if there is no match.
+        '''
+        return self.nearestCandidate(self.candidates(point, tolerance, snappingMethod), point, tolerance, snappingMethod)
+
+
+    def candidates(self, point:QgsPointXY, radius:float, snappingMethod:int = SNAP_TO_VERTICES) -> list:
+        ''' 
+        Returns the vertices, as (point, layer numbers), or the segments, as (point, point, layer number), whose bounding box is within 
+        radius of the point. Every match of nearest() for a position within d of the point, with a tolerance up to radius - d, is among them, 
+        so that a tool can answer the positions of the cursor near the point from the candidates with nearestCandidate()
+        '''
+        if self.isReady == False:
+            return []
+        searchRect = QgsRectangle(point.x() - radius, point.y() - radius, point.x() + radius, point.y() + radius)
+        if snappingMethod == self.SNAP_TO_SEGMENT_EDGES:
+            return [self.segments[segmentId] for segmentId in self.segmentIndex.intersects(searchRect)]
+        return [(self.vertexPoints[vertexId], sorted(self.vertexLayers[vertexId])) for vertexId in self.vertexIndex.intersects(searchRect)]
+
+
+    def nearestCandidate(self, candidates:list, point:QgsPointXY, tolerance:float, snappingMethod:int = SNAP_TO_VERTICES):
+        ''' Same as nearest(), among candidates returned by candidates() '''
+        if snappingMethod == self.SNAP_TO_SEGMENT_EDGES:
+            return self.nearestEdge(candidates, point, tolerance)
+        return self.nearestVertex(candidates, point, tolerance)
+
+
+    def nearestVertex(self, candidates:list, point:QgsPointXY, tolerance:float):
+        matches = [(vertexPoint.sqrDist(point), vertexPoint, layerNumbers) for (vertexPoint, layerNumbers) in candidates]
+        matches = [m for m in matches if m[0] <= tolerance * tolerance]
+        if len(matches) == 0:
+            return (None, [])
+        (sqrDist, vertexPoint, layerNumbers) = min(matches, key = lambda m: m[0])
+        return (vertexPoint, [self.layers[layerNo] for layerNo in layerNumbers])
+
+
+    def nearestEdge(self, segments:list, point:QgsPointXY, tolerance:float):
+        candidates = []
+        for p1, p2, layerNo in segments:
+            closestPoint = self.closestPointOnSegment(point, p1, p2)
+            candidates.append((closestPoint.sqrDist(point), closestPoint, layerNo))
+
+        candidates = [c for c in candidates if c[0] <= tolerance * tolerance]
+        if len(candidates) == 0:
+            return (None, [])
+        candidates.sort(key = lambda c: c[0])
+        matchedPoint = candidates[0][1]
+
+        # Every layer whose segments pass through the matched point
+        epsilon = (tolerance * 1e-6) ** 2
+        layerNumbers = set()
+        for sqrDist, closestPoint, layerNo in candidates:
+            if closestPoint.sqrDist(matchedPoint) <= epsilon:
+                layerNumbers.add(layerNo)
+        return (matchedPoint, [self.layers[layerNo] for layerNo in sorted(layerNumbers)])
+
+
+    def closestPointOnSegment(self, point:QgsPointXY, p1:QgsPointXY, p2:QgsPointXY) -> QgsPointXY:
+        dx = p2.x() - p1.x()
+        dy = p2.y() - p1.y()
+        length2 = dx * dx + dy * dy
+        if length2 == 0:
+            return p1
+        t = ((point.x() - p1.x()) * dx + (point.y() - p1.y()) * dy) / length2
+        t = max(0.0, min(1.0, t))
+        return QgsPointXY(p1.x() + t * dx, p1.y() + t * dy)
+
+
+
+class SnappingIndexTask(QgsTask):
+    ''' Builds a SnappingIndex in the QGIS task manager and hands it over to a callback in the main thread '''
+
+    def __init__(self, description:str, index:SnappingIndex, onFinished):
+        super().__init__(description, QgsTask.CanCancel)
+        self.index = index
+        self.onFinished = onFinished
+        return
+
+
+    def run(self) -> bool:
+        return self.index.build(self)
+
+
+    def finished(self, result:bool) -> None:
+        # Runs in the main thread
+        if result == True and not self.isCanceled():
+            self.onFinished(self.index)
+        return
+
+
+
+class SharedSnappingIndex:
+    '''
+    A snapping index shared by all the snapping tools which snap to the same layers, see SnappingIndexCache.
+    The index is built in the background, first for the given extent and then for the entire layers.
+    When the features of one of the layers change, only that layer is read again
+    '''
+
+    def __init__(self, layers:list, destinationCrs:QgsCoordinateReferenceSystem, transformContext:QgsCoordinateTransformContext):
+        self.layers = layers
+        self.destinationCrs = destinationCrs
+        self.transformContext = transformContext
+        # The index used by the queries. None until the first build has finished
+        self.index = None
+        # The QgsTask building the index of all the layers, and layer id -> QgsTask reading one layer again.
+        # A reference must be kept, otherwise the task is garbage collected
+        self.task = None
+        self.layerTasks = {}
+        # The tools using the index
+        self.users = []
+        # (signal, slot) of every connection to the layers, to disconnect them in close()
+        self.connections = []
+        for layer in self.layers:
+            # geometryChanged passes the feature id and the geometry, which are not needed
+            slot = lambda *args, layer = layer: self.layerChanged(layer)
+            for signal in [layer.dataChanged, layer.geometryChanged]:
+                signal.connect(slot)
+                self.connections.append((signal, slot))
+        return
+
+
+    def close(self) -> None:
+        ''' Stops the builds and the tracking of the layers, when no tool uses the index any more '''
+        self.cancelTasks()
+        for signal, slot in self.connections:
+            try:
+                signal.disconnect(slot)
+            except (RuntimeError, TypeError):
+                # The layer has been deleted
+                pass
+        self.connections.clear()
+        self.users.clear()
+        return
+
+
+    def startIndexing(self, extent:QgsRectangle = None) -> None:
+        ''' Builds the index of all the layers in a QgsTask. With an extent, only the features within the extent are indexed '''
+        self.cancelTasks()
+        index = SnappingIndex(self.layers, self.destinationCrs, self.transformContext, extent)
+        self.task = SnappingIndexTask("Snapping index", index, lambda index, widen = (extent is not None): self.indexReady(index, widen))
+        QgsApplication.taskManager().addTask(self.task)
+        return
+
+
+    def indexReady(self, index:SnappingIndex, widen:bool) -> None:
+        ''' 
+        Runs in the main thread when an index has been built. The index of the visible extent is used 
+        until the index of the entire layers is ready 
+        '''
+        self.index = index
+        self.task = None
+        if widen == True:
+            self.startIndexing(None)
+        return
+
+
+    def layerChanged(self, layer:QgsVectorLayer) -> None:
+        ''' 
+        Reads again the layer whose features have changed, replacing any pending read of the same layer.
+        While the index of all the layers is being built, the build is restarted instead
+        '''
+        if self.task is not None or self.index is None:
+            self.startIndexing(None)
+            return
+        previousTask = self.layerTasks.pop(layer.id(), None)
+        if previousTask is not None:
+            try:
+                previousTask.cancel()
+            except RuntimeError:
+                pass
+        layerIndex = SnappingIndex([layer], self.destinationCrs, self.transformContext)
+        task = SnappingIndexTask("Snapping index of " + layer.name(), layerIndex, lambda layerIndex, layer = layer: self.layerReady(layer, layerIndex))
+        self.layerTasks[layer.id()] = task
+        QgsApplication.taskManager().addTask(task)
+        return
+
+
+    def layerReady(self, layer:QgsVectorLayer, layerIndex:SnappingIndex) -> None:
+        ''' Runs in the main thread when a changed layer has been read again '''
+        self.layerTasks.pop(layer.id(), None)
+        try:
+            self.index.replaceLayer(layer, layerIndex)
+        except RuntimeError:
+            # The layer has been deleted
+            return
+        return
+
+
+    def isIndexing(self) -> bool:
+        return self.index is None and self.task is not None
+
+
+    def cancelTasks(self) -> None:
+        for task in [self.task] + list(self.layerTasks.values()):
+            if task is None:
+                continue
+            try:
+                task.cancel()
+            except RuntimeError:
+                # The task has already finished and the C++ object is deleted
+                pass
+        self.task = None
+        self.layerTasks.clear()
+        return
+
+
+
+class SnappingIndexCache:
+    '''
+    The snapping indexes of the snapping tools, keyed on the CRS and the ids of the layers to snap. 
+    The tools snapping to the same layers share one index, which is not rebuilt when the same layers are set again
+    '''
+
+    def __init__(self):
+        # key -> SharedSnappingIndex
+        self.indexes = {}
+        return
+
+
+    def key(self, layers:list, destinationCrs:QgsCoordinateReferenceSystem) -> tuple:
+        return (destinationCrs.authid(), tuple(layer.id() for layer in layers))
+
+
+    def acquire(self, user, layers:list, destinationCrs:QgsCoordinateReferenceSystem, transformContext:QgsCoordinateTransformContext, 
+                extent:QgsRectangle = None) -> SharedSnappingIndex:
+        ''' 
+        Returns the shared index of the layers, building it if no tool uses it yet, and registers the user, e.g. a tool, with it.
+        The user is released from the index it used before. The extent is in the destination CRS
+        '''
+        key = self.key(layers, destinationCrs)
+        sharedIndex = self.indexes.get(key)
+        if sharedIndex is not None and user in sharedIndex.users:
+            return sharedIndex
+        self.release(user)
+        if sharedIndex is None:
+            sharedIndex = SharedSnappingIndex(layers, destinationCrs, transformContext)
+            self.indexes[key] = sharedIndex
+            sharedIndex.startIndexing(extent)
+        sharedIndex.users.append(user)
+        return sharedIndex
+
+
+    def release(self, user) -> None:
+        ''' Unregisters the user and closes the indexes which have no users left '''
+        for key, sharedIndex in list(self.indexes.items()):
+            if user in sharedIndex.users:
+                sharedIndex.users.remove(user)
+            if len(sharedIndex.users) == 0:
+                sharedIndex.close()
+                del self.indexes[key]
+        return
+
+
+    def clear(self) -> None:
+        for sharedIndex in self.indexes.values():
+            sharedIndex.close()
+        self.indexes.clear()
+        return
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    stageTimer.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak memory is not reported
+    resource = None
+
+'''
+The time spent in each stage of a calculation, e.g. the merge of the layers, the build of the graph and the searches,
+together with the size of the input, i.e. the number of features, graph vertices and edges. A stage that runs more than once
+in a calculation, e.g. the search of each leg, is accumulated. Used by the Performance section of the results dialog, 
+the QGIS message log and the JSON export. The benchmark also records the peak memory of the process after each stage.
+'''
+
+class StageTimer:
+
+    def __init__(self, trackMemory:bool = False):
+        self.trackMemory = trackMemory and resource is not None
+        # The local time the calculation started, for the log and the export
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.startCounter = time.perf_counter()
+        # Set by stop(), at the end of the calculation
+        self.stopCounter = None
+        # Stage name -> [seconds, number of runs, peak memory of the process in bytes or None], in the order the stages first ran
+        self.stages = {}
+        # Name -> value, e.g. the number of graph vertices
+        self.counts = {}
+        return
+
+
+    @contextmanager
+    def stage(self, name:str):
+        ''' Times the code in the with block as a run of the stage, even if it raises an exception '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+
+
+    def addTime(self, name:str, seconds:float) -> None:
+        if self.stopCounter is not None:
+            return
+        item= self.stages.setdefault(name, [0.0, 0, None])
+        item[0] += seconds
+        item[1] += 1
+        if self.trackMemory:
+            item[2] = self.peakMemory()
+        return
+
+
+    def peakMemory(self) -> int:
+        ''' Returns the maximum resident memory of the process so far, in bytes '''
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes, except on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+    def setCount(self, name:str, value) -> None:
+        self.counts[name] = value
+        return
+
+
+    def stop(self) -> None:
+        ''' Ends the calculation. The total time is frozen and the stages that run afterwards are not recorded '''
+        if self.stopCounter is None:
+            self.stopCounter = time.perf_counter()
+        return
+
+
+    def elapsed(self) -> float:
+        ''' Seconds from the creation of the timer to stop(), or to now if the timer has not been stopped '''
+        end = self.stopCounter if self.stopCounter is not None else time.perf_counter()
+        return end - self.startCounter
+
+
+    def report(self) -> str:
+        ''' Returns the stages and the counts as text, one item per line, with the times in milliseconds '''
+        width = max([len(name) for name in list(self.stages) + list(self.counts)] + [len("Total")])
+        lines = []
+        for name, (seconds, runs, peak) in self.stages.items():
+            line = "{:<{}}  {:>10.1f} ms".format(name, width, seconds * 1000)
+            if peak is not None:
+                line += "  {:>8.1f} MB".format(peak / 1048576)
+            if runs > 1:
+                line += "  ({} runs)".format(runs)
+            lines.append(line)
+        lines.append("{:<{}}  {:>10.1f} ms".format("Total", width, self.elapsed() * 1000))
+        for name, value in self.counts.items():
+            lines.append("{:<{}}  {:>10}".format(name, width, value))
+        return "\n".join(lines)
+
+
+    def toDict(self) -> dict:
+        return {
+            "started": self.started,
+            "totalSeconds": self.elapsed(),
+            "stages": [{"name": name, "seconds": seconds, "runs": runs, "peakMemory": peak} for name, (seconds, runs, peak) in self.stages.items()],
+            "counts": dict(self.counts),
+        }
+
+
+    def toJson(self) -> str:
+        return json.dumps(self.toDict(), indent = 2)
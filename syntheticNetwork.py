@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    syntheticNetwork.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import heapq
+import math
+import random
+
+from qgis.core import ( QgsCoordinateReferenceSystem,
+                        QgsCoordinateTransform,
+                        QgsFeature,
+                        QgsFields,
+                        QgsGeometry,
+                        QgsMemoryProviderUtils,
+                        QgsPointXY,
+                        QgsProject,
+                        QgsUnitTypes,
+                        QgsVectorLayer,
+                        QgsWkbTypes
+                      )
+
+from .bridge import BridgeLayer
+from .geometry import OtFSP_Geometry
+
+'''
+Line networks of a given number of segments, with a known topology, for the benchmark: square grids, trees 
+and FTTH-like stars, where a central office feeds cabinets, each of which feeds its drops. 
+The networks are lists of lines, each given as ((x1, y1), (x2, y2)) in units of the CRS, and every line is one feature 
+of the layer. The first point of the first line and the last point of the last line are far apart on the network, 
+so that they make a long route.
+The networks can be laid out in a projected CRS and transformed to any CRS, split into overlapping layers and opened 
+at near-miss gaps, with the bridge points that close the gaps. The reference lengths of the shortest paths are computed
+here, independently of the graph of QGIS, so that the results of the routing can be checked against them.
+'''
+
+class SyntheticNetwork:
+
+    # Number of features added to a memory layer at a time
+    batchSize = 10000
+
+    def __init__(self, crs:QgsCoordinateReferenceSystem, spacing:float = 100, origin:tuple = (0, 0), sourceCrs:QgsCoordinateReferenceSystem = None):
+        ''' 
+        The networks are laid out in the source CRS, if given, with the spacing and the origin in its units, and transformed to the CRS. 
+        Otherwise, they are laid out in the CRS 
+        '''
+        self.crs = crs
+        # The length of the segments, in units of the CRS of the layout
+        self.spacing = spacing
+        self.origin = origin
+        self.transform = None
+        if sourceCrs is not None and sourceCrs != crs:
+            self.transform = QgsCoordinateTransform(sourceCrs, crs, QgsProject.instance().transformContext())
+        return
+
+
+    def point(self, i:float, j:float) -> tuple:
+        ''' Returns the coordinates of the point i, j spacings from the origin '''
+        return (self.origin[0] + i * self.spacing, self.origin[1] + j * self.spacing)
+
+
+    def grid(self, segments:int) -> list:
+        ''' Returns the lines of a square grid with about the number of segments. The route from the first to the last point crosses the grid '''
+        # A grid of n x n nodes has 2n(n - 1) segments
+        n = max(2, int(round((1 + math.sqrt(1 + 2 * segments)) / 2)))
+        lines = []
+        for j in range(n):
+            for i in range(n):
+                if i + 1 < n:
+                    lines.append((self.point(i, j), self.point(i + 1, j)))
+                if j + 1 < n:
+                    lines.append((self.point(i, j), self.point(i, j + 1)))
+        # End the last line at the far corner
+        lines.append(lines.pop(lines.index((self.point(n - 2, n - 1), self.point(n - 1, n - 1)))))
+        return self.transformed(lines)
+
+
+    def tree(self, segments:int, branching:int = 3) -> list:
+        ''' Returns the lines of a tree with the number of segments. Each node has the given number of children, laid out by level '''
+        # The position of the nodes of a level, from the left, and the parent of each node
+        lines = []
+        level = [(0.0, None)]
+        depth = 0
+        while len(lines) < segments:
+            depth += 1
+            children = []
+            width = len(level) * branching
+            for k, (x, parent) in enumerate(level):
+                for b in range(branching):
+                    if len(lines) >= segments:
+                        break
+                    childX = len(children) - (width - 1) / 2.0
+                    lines.append((self.point(x, 1 - depth), self.point(childX, -depth)))
+                    children.append((childX, k))
+            level = children
+        return self.transformed(lines)
+
+
+    def star(self, segments:int) -> list:
+        ''' 
+        Returns the lines of an FTTH-like network with the number of segments: feeder cables from a central office at the origin 
+        to the cabinets on a circle, and from each cabinet drop cables to the premises around it 
+        '''
+        cabinets = max(1, int(math.sqrt(segments)))
+        drops = max(0, segments - cabinets)
+        radius = cabinets * 4.0
+        lines = []
+        for c in range(cabinets):
+            angle = 2 * math.pi * c / cabinets
+            cabinet = self.point(radius * math.cos(angle), radius * math.sin(angle))
+            lines.append((self.point(0, 0), cabinet))
+            count = drops // cabinets + (1 if c < drops % cabinets else 0)
+            for d in range(count):
+                dropAngle = angle + 2 * math.pi * d / max(count, 1)
+                lines.append((cabinet, (cabinet[0] + self.spacing * math.cos(dropAngle), cabinet[1] + self.spacing * math.sin(dropAngle))))
+        return self.transformed(lines)
+
+
+    def transformed(self, lines:list) -> list:
+        ''' Returns the lines transformed from the source CRS to the CRS. Each point is transformed once, so that the lines still meet '''
+        if self.transform is None:
+            return lines
+        points = {}
+        for line in lines:
+            for p in line:
+                if p not in points:
+                    q = self.transform.transform(QgsPointXY(*p))
+                    points[p] = (q.x(), q.y())
+        return [(points[p1], points[p2]) for (p1, p2) in lines]
+
+
+    def withGaps(self, lines:list, fraction:float, gap:float, seed:int = 0):
+        '''
+        Returns a tuple (lines, bridge points, bridge lines), where a fraction of the lines, chosen at random, start a near-miss gap 
+        after their first point, i.e. their first point is moved along the line by the gap, in units of the CRS. The lines are 
+        disconnected at the gaps, unless the topology tolerance is larger than the gap. A bridge point is at the original first point 
+        of each moved line and the bridge line goes from the bridge point to the moved point, as the bridges of the plugin do.
+        The first and the last line, and the lines that start at a junction of more lines than a bridge point connects, are not moved
+        '''
+        rng = random.Random(seed)
+        degrees = {}
+        for line in lines:
+            for p in line:
+                degrees[p] = degrees.get(p, 0) + 1
+        lines = list(lines)
+        bridgePoints = []
+        bridgeLines = []
+        bridged = set()
+        for i in range(1, len(lines) - 1):
+            if rng.random() >= fraction:
+                continue
+            (p1, p2) = lines[i]
+            length = math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+            if length <= 2 * gap or degrees[p1] >= BridgeLayer.maximumNumberOfNeighbors:
+                continue
+            moved = (p1[0] + (p2[0] - p1[0]) * gap / length, p1[1] + (p2[1] - p1[1]) * gap / length)
+            lines[i] = (moved, p2)
+            # One bridge point connects all the lines moved away from a junction
+            if p1 not in bridged:
+                bridged.add(p1)
+                bridgePoints.append(p1)
+            bridgeLines.append((p1, moved))
+        return (lines, bridgePoints, bridgeLines)
+
+
+    def overlappingLayers(self, lines:list, overlap:float, seed:int = 0):
+        ''' 
+        Returns the lines of two layers, which split the lines alternately, where a fraction of the lines of the first layer, chosen at random, 
+        are also in the second layer. The duplicate lines add parallel edges of the same length, so the shortest paths do not change 
+        '''
+        rng = random.Random(seed)
+        first = lines[0::2]
+        second = lines[1::2] + [line for line in first if rng.random() < overlap]
+        return (first, second)
+
+
+    def referenceLengths(self, lines:list, source:tuple, targets:list) -> list:
+        '''
+        Returns the length of the shortest path from the source point to each target point, in meters, or None if there is no path. 
+        The lines meet where their points are equal. The search is a Dijkstra of its own, on the lengths measured as the graph builder 
+        of QGIS measures the edges, i.e. on the ellipsoid of the CRS. The lengths are converted to meters as the routing engine does
+        '''
+        distanceArea = OtFSP_Geometry.distanceArea(self.crs)
+        adjacency = {}
+        for (p1, p2) in lines:
+            length = distanceArea.measureLine(QgsPointXY(*p1), QgsPointXY(*p2))
+            adjacency.setdefault(p1, []).append((p2, length))
+            adjacency.setdefault(p2, []).append((p1, length))
+
+        costs = {source: 0.0}
+        remaining = set(targets)
+        queue = [(0.0, source)]
+        while len(queue) > 0 and len(remaining) > 0:
+            (cost, p) = heapq.heappop(queue)
+            if cost > costs[p]:
+                continue
+            remaining.discard(p)
+            for (q, length) in adjacency.get(p, []):
+                if cost + length < costs.get(q, math.inf):
+                    costs[q] = cost + length
+                    heapq.heappush(queue, (cost + length, q))
+
+        geom = OtFSP_Geometry()
+        inMeters = QgsUnitTypes.toString(distanceArea.lengthUnits()) == "meters"
+        lengths = []
+        for target in targets:
+            cost = costs.get(target)
+            if cost is not None and not inMeters:
+                cost = geom.lengthInMeters(cost, self.crs)
+            lengths.append(cost)
+        return lengths
+
+
+    def lineLayer(self, name:str, lines:list) -> QgsVectorLayer:
+        ''' Returns a memory layer in the CRS of the network with one feature per line '''
+        layer = QgsMemoryProviderUtils.createMemoryLayer(name, QgsFields(), QgsWkbTypes.LineString, self.crs)
+        layer.setCustomProperty("skipMemoryLayersCheck", 1)
+        provider = layer.dataProvider()
+        for start in range(0, len(lines), self.batchSize):
+            features = []
+            for (p1, p2) in lines[start : start + self.batchSize]:
+                feature = QgsFeature()
+                feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(*p1), QgsPointXY(*p2)]))
+                features.append(feature)
+            provider.addFeatures(features)
+        layer.updateExtents()
+        return layer
+
+
+    def pointLayer(self, name:str, points:list) -> QgsVectorLayer:
+        ''' Returns a memory layer in the CRS of the network with one feature per (x, y) point '''
+        layer = QgsMemoryProviderUtils.createMemoryLayer(name, QgsFields(), QgsWkbTypes.Point, self.crs)
+        layer.setCustomProperty("skipMemoryLayersCheck", 1)
+        features = []
+        for p in points:
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*p)))
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        return layer
@@ -6,6 +6,7 @@ from .ui_DlgResults import Ui_resultDialog
 from .ui_DlgResultsNoFiber import Ui_resultDialogNoFiber
 from .ui_DlgLayerSelection import Ui_layersDialog
 from .ui_DlgMarkerCoordinates import Ui_coordinatesDialog
+from .ui_DlgAlternativeRoutes import Ui_routesDialog
 
 
 '''
@@ -39,4 +40,10 @@ class LayerSelectionDialog(QDialog, Ui_layersDialog):
 class MarkerCoordinatesDialog(QDialog, Ui_coordinatesDialog):
     def __init__(self):
         super().__init__()
-        self.setupUi(self)           
\ No newline at end of file
+        self.setupUi(self)           
+
+
+class AlternativeRoutesDialog(QDialog, Ui_routesDialog):
+    def __init__(self):
+        super().__init__()
+        self.setupUi(self)
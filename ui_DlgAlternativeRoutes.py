@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'DlgAlternativeRoutes.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.6
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+#from PyQt5 import QtCore, QtGui, QtWidgets
+from qgis.PyQt import QtCore, QtGui, QtWidgets
+
+
+class Ui_routesDialog(object):
+    def setupUi(self, routesDialog):
+        routesDialog.setObjectName("routesDialog")
+        routesDialog.resize(360, 260)
+        routesDialog.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.gridLayout = QtWidgets.QGridLayout(routesDialog)
+        self.gridLayout.setObjectName("gridLayout")
+        self.label = QtWidgets.QLabel(routesDialog)
+        self.label.setObjectName("label")
+        self.gridLayout.addWidget(self.label, 0, 0, 1, 2)
+        self.routesTable = QtWidgets.QTableWidget(routesDialog)
+        self.routesTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.routesTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.routesTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.routesTable.setColumnCount(3)
+        self.routesTable.setObjectName("routesTable")
+        self.routesTable.setRowCount(0)
+        item = QtWidgets.QTableWidgetItem()
+        self.routesTable.setHorizontalHeaderItem(0, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.routesTable.setHorizontalHeaderItem(1, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.routesTable.setHorizontalHeaderItem(2, item)
+        self.routesTable.horizontalHeader().setStretchLastSection(True)
+        self.routesTable.verticalHeader().setVisible(False)
+        self.gridLayout.addWidget(self.routesTable, 1, 0, 1, 2)
+        self.showAllRoutes = QtWidgets.QCheckBox(routesDialog)
+        self.showAllRoutes.setObjectName("showAllRoutes")
+        self.gridLayout.addWidget(self.showAllRoutes, 2, 0, 1, 1)
+        self.closeButton = QtWidgets.QPushButton(routesDialog)
+        self.closeButton.setObjectName("closeButton")
+        self.gridLayout.addWidget(self.closeButton, 2, 1, 1, 1)
+
+        self.retranslateUi(routesDialog)
+        QtCore.QMetaObject.connectSlotsByName(routesDialog)
+        routesDialog.setTabOrder(self.routesTable, self.showAllRoutes)
+        routesDialog.setTabOrder(self.showAllRoutes, self.closeButton)
+
+    def retranslateUi(self, routesDialog):
+        _translate = QtCore.QCoreApplication.translate
+        routesDialog.setWindowTitle(_translate("routesDialog", "Alternative routes"))
+        self.label.setText(_translate("routesDialog", "Select a route to show it on the map"))
+        item = self.routesTable.horizontalHeaderItem(0)
+        item.setText(_translate("routesDialog", "Route"))
+        item = self.routesTable.horizontalHeaderItem(1)
+        item.setText(_translate("routesDialog", "Length"))
+        item = self.routesTable.horizontalHeaderItem(2)
+        item.setText(_translate("routesDialog", "Fiber loss"))
+        self.showAllRoutes.setText(_translate("routesDialog", "Show all routes"))
+        self.closeButton.setText(_translate("routesDialog", "Close"))
+
+
+if __name__ == "__main__":
+    import sys
+    app = QtWidgets.QApplication(sys.argv)
+    routesDialog = QtWidgets.QDialog()
+    ui = Ui_routesDialog()
+    ui.setupUi(routesDialog)
+    routesDialog.show()
+    sys.exit(app.exec_())
@@ -147,6 +147,9 @@ class Ui_configuration_form(object):
         self.flexjLineToolAngleCorrection = QtWidgets.QCheckBox(self.groupBox_9)
         self.flexjLineToolAngleCorrection.setObjectName("flexjLineToolAngleCorrection")
         self.gridLayout_2.addWidget(self.flexjLineToolAngleCorrection, 7, 1, 1, 1)
+        self.flexjLineToolShowNetworkDistance = QtWidgets.QCheckBox(self.groupBox_9)
+        self.flexjLineToolShowNetworkDistance.setObjectName("flexjLineToolShowNetworkDistance")
+        self.gridLayout_2.addWidget(self.flexjLineToolShowNetworkDistance, 5, 0, 1, 2)
         self.gridLayout_11.addWidget(self.groupBox_9, 2, 0, 2, 1)
         spacerItem2 = QtWidgets.QSpacerItem(20, 10, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.gridLayout_11.addItem(spacerItem2, 4, 0, 1, 1)
@@ -378,6 +381,68 @@ class Ui_configuration_form(object):
         self.entryExitLengthLimit.setObjectName("entryExitLengthLimit")
         self.gridLayout_16.addWidget(self.entryExitLengthLimit, 1, 1, 1, 1)
         self.gridLayout_4.addWidget(self.groupBox_15, 3, 0, 1, 1)
+        self.groupBox_16 = QtWidgets.QGroupBox(self.groupBox_2)
+        self.groupBox_16.setObjectName("groupBox_16")
+        self.gridLayout_17 = QtWidgets.QGridLayout(self.groupBox_16)
+        self.gridLayout_17.setObjectName("gridLayout_17")
+        self.waypointsFromSelectedPoints = QtWidgets.QCheckBox(self.groupBox_16)
+        self.waypointsFromSelectedPoints.setObjectName("waypointsFromSelectedPoints")
+        self.gridLayout_17.addWidget(self.waypointsFromSelectedPoints, 0, 0, 1, 1)
+        self.optimizeWaypointOrder = QtWidgets.QCheckBox(self.groupBox_16)
+        self.optimizeWaypointOrder.setObjectName("optimizeWaypointOrder")
+        self.gridLayout_17.addWidget(self.optimizeWaypointOrder, 1, 0, 1, 1)
+        self.gridLayout_4.addWidget(self.groupBox_16, 4, 0, 1, 1)
+        self.groupBox_17 = QtWidgets.QGroupBox(self.groupBox_2)
+        self.groupBox_17.setObjectName("groupBox_17")
+        self.gridLayout_18 = QtWidgets.QGridLayout(self.groupBox_17)
+        self.gridLayout_18.setObjectName("gridLayout_18")
+        self.label_54 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_54.setObjectName("label_54")
+        self.gridLayout_18.addWidget(self.label_54, 0, 0, 1, 1)
+        self.calculationMode = QtWidgets.QComboBox(self.groupBox_17)
+        self.calculationMode.setMinimumSize(QtCore.QSize(0, 20))
+        self.calculationMode.setObjectName("calculationMode")
+        self.gridLayout_18.addWidget(self.calculationMode, 0, 1, 1, 1)
+        self.diversePairNodeDisjoint = QtWidgets.QCheckBox(self.groupBox_17)
+        self.diversePairNodeDisjoint.setObjectName("diversePairNodeDisjoint")
+        self.gridLayout_18.addWidget(self.diversePairNodeDisjoint, 1, 0, 1, 2)
+        self.label_55 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_55.setObjectName("label_55")
+        self.gridLayout_18.addWidget(self.label_55, 2, 0, 1, 1)
+        self.numberOfRoutes = QtWidgets.QSpinBox(self.groupBox_17)
+        self.numberOfRoutes.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.numberOfRoutes.setMinimum(2)
+        self.numberOfRoutes.setMaximum(20)
+        self.numberOfRoutes.setObjectName("numberOfRoutes")
+        self.gridLayout_18.addWidget(self.numberOfRoutes, 2, 1, 1, 1)
+        self.label_56 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_56.setObjectName("label_56")
+        self.gridLayout_18.addWidget(self.label_56, 3, 0, 1, 1)
+        self.serviceAreaLimitType = QtWidgets.QComboBox(self.groupBox_17)
+        self.serviceAreaLimitType.setMinimumSize(QtCore.QSize(0, 20))
+        self.serviceAreaLimitType.setObjectName("serviceAreaLimitType")
+        self.gridLayout_18.addWidget(self.serviceAreaLimitType, 3, 1, 1, 1)
+        self.label_57 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_57.setObjectName("label_57")
+        self.gridLayout_18.addWidget(self.label_57, 4, 0, 1, 1)
+        self.serviceAreaLimit = QtWidgets.QDoubleSpinBox(self.groupBox_17)
+        self.serviceAreaLimit.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.serviceAreaLimit.setMaximum(1000000.0)
+        self.serviceAreaLimit.setObjectName("serviceAreaLimit")
+        self.gridLayout_18.addWidget(self.serviceAreaLimit, 4, 1, 1, 1)
+        self.label_58 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_58.setObjectName("label_58")
+        self.gridLayout_18.addWidget(self.label_58, 5, 0, 1, 1)
+        self.facilityLayer = QtWidgets.QLineEdit(self.groupBox_17)
+        self.facilityLayer.setObjectName("facilityLayer")
+        self.gridLayout_18.addWidget(self.facilityLayer, 5, 1, 1, 1)
+        self.label_59 = QtWidgets.QLabel(self.groupBox_17)
+        self.label_59.setObjectName("label_59")
+        self.gridLayout_18.addWidget(self.label_59, 6, 0, 1, 1)
+        self.batchOutputFile = QtWidgets.QLineEdit(self.groupBox_17)
+        self.batchOutputFile.setObjectName("batchOutputFile")
+        self.gridLayout_18.addWidget(self.batchOutputFile, 6, 1, 1, 1)
+        self.gridLayout_4.addWidget(self.groupBox_17, 4, 1, 1, 1)
         spacerItem5 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
         self.gridLayout_4.addItem(spacerItem5, 5, 0, 1, 1)
         self.groupBox_6 = QtWidgets.QGroupBox(self.groupBox_2)
@@ -508,6 +573,21 @@ class Ui_configuration_form(object):
         self.addMergedLayer = QtWidgets.QCheckBox(self.groupBox_4)
         self.addMergedLayer.setObjectName("addMergedLayer")
         self.gridLayout_10.addWidget(self.addMergedLayer, 4, 0, 1, 2)
+        self.addFeatureReport = QtWidgets.QCheckBox(self.groupBox_4)
+        self.addFeatureReport.setObjectName("addFeatureReport")
+        self.gridLayout_10.addWidget(self.addFeatureReport, 5, 0, 1, 3)
+        self.label_53 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_53.setObjectName("label_53")
+        self.gridLayout_10.addWidget(self.label_53, 6, 0, 1, 1)
+        self.reportFields = QtWidgets.QLineEdit(self.groupBox_4)
+        self.reportFields.setObjectName("reportFields")
+        self.gridLayout_10.addWidget(self.reportFields, 6, 1, 1, 2)
+        self.label_60 = QtWidgets.QLabel(self.groupBox_4)
+        self.label_60.setObjectName("label_60")
+        self.gridLayout_10.addWidget(self.label_60, 7, 0, 1, 1)
+        self.resultLayerFile = QtWidgets.QLineEdit(self.groupBox_4)
+        self.resultLayerFile.setObjectName("resultLayerFile")
+        self.gridLayout_10.addWidget(self.resultLayerFile, 7, 1, 1, 2)
         self.gridLayout_4.addWidget(self.groupBox_4, 2, 0, 1, 1)
         self.horizontalLayout.addWidget(self.groupBox_2)
         self.tabWidget.addTab(self.networkTab, "")
@@ -603,6 +683,24 @@ class Ui_configuration_form(object):
         self.label_19 = QtWidgets.QLabel(self.groupBox_10)
         self.label_19.setObjectName("label_19")
         self.gridLayout_7.addWidget(self.label_19, 6, 2, 1, 1)
+        self.minimumLossRouting = QtWidgets.QCheckBox(self.groupBox_10)
+        self.minimumLossRouting.setObjectName("minimumLossRouting")
+        self.gridLayout_7.addWidget(self.minimumLossRouting, 7, 0, 1, 3)
+        self.label_51 = QtWidgets.QLabel(self.groupBox_10)
+        self.label_51.setObjectName("label_51")
+        self.gridLayout_7.addWidget(self.label_51, 8, 0, 1, 1)
+        self.attenuationField = QtWidgets.QLineEdit(self.groupBox_10)
+        self.attenuationField.setObjectName("attenuationField")
+        self.gridLayout_7.addWidget(self.attenuationField, 8, 1, 1, 2)
+        self.label_52 = QtWidgets.QLabel(self.groupBox_10)
+        self.label_52.setObjectName("label_52")
+        self.gridLayout_7.addWidget(self.label_52, 9, 0, 1, 1)
+        self.spliceFlagField = QtWidgets.QLineEdit(self.groupBox_10)
+        self.spliceFlagField.setObjectName("spliceFlagField")
+        self.gridLayout_7.addWidget(self.spliceFlagField, 9, 1, 1, 2)
+        self.countSplices = QtWidgets.QCheckBox(self.groupBox_10)
+        self.countSplices.setObjectName("countSplices")
+        self.gridLayout_7.addWidget(self.countSplices, 10, 0, 1, 3)
         self.gridLayout_12.addWidget(self.groupBox_10, 0, 0, 1, 1)
         spacerItem9 = QtWidgets.QSpacerItem(442, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.gridLayout_12.addItem(spacerItem9, 0, 1, 1, 1)
@@ -671,7 +769,8 @@ class Ui_configuration_form(object):
         configuration_form.setTabOrder(self.flexjLineToolMarkerSize, self.flexjLineToolLineWidth)
         configuration_form.setTabOrder(self.flexjLineToolLineWidth, self.flexjLineToolLineStyle)
         configuration_form.setTabOrder(self.flexjLineToolLineStyle, self.flexjLineToolShowDistance)
-        configuration_form.setTabOrder(self.flexjLineToolShowDistance, self.flexjLineToolSlopingDistance)
+        configuration_form.setTabOrder(self.flexjLineToolShowDistance, self.flexjLineToolShowNetworkDistance)
+        configuration_form.setTabOrder(self.flexjLineToolShowNetworkDistance, self.flexjLineToolSlopingDistance)
         configuration_form.setTabOrder(self.flexjLineToolSlopingDistance, self.flexjLineToolAngleCorrection)
         configuration_form.setTabOrder(self.flexjLineToolAngleCorrection, self.flexjLineToolShowTotalDistance)
         configuration_form.setTabOrder(self.flexjLineToolShowTotalDistance, self.flexjLineToolDistanceDecimalDigits)
@@ -693,9 +792,21 @@ class Ui_configuration_form(object):
         configuration_form.setTabOrder(self.distanceUnits, self.decimalDigits)
         configuration_form.setTabOrder(self.decimalDigits, self.addResultLayer)
         configuration_form.setTabOrder(self.addResultLayer, self.addMergedLayer)
-        configuration_form.setTabOrder(self.addMergedLayer, self.includeStartStop)
+        configuration_form.setTabOrder(self.addMergedLayer, self.addFeatureReport)
+        configuration_form.setTabOrder(self.addFeatureReport, self.reportFields)
+        configuration_form.setTabOrder(self.reportFields, self.resultLayerFile)
+        configuration_form.setTabOrder(self.resultLayerFile, self.includeStartStop)
         configuration_form.setTabOrder(self.includeStartStop, self.entryExitLengthLimit)
-        configuration_form.setTabOrder(self.entryExitLengthLimit, self.topologyTolerance)
+        configuration_form.setTabOrder(self.entryExitLengthLimit, self.waypointsFromSelectedPoints)
+        configuration_form.setTabOrder(self.waypointsFromSelectedPoints, self.optimizeWaypointOrder)
+        configuration_form.setTabOrder(self.optimizeWaypointOrder, self.calculationMode)
+        configuration_form.setTabOrder(self.calculationMode, self.diversePairNodeDisjoint)
+        configuration_form.setTabOrder(self.diversePairNodeDisjoint, self.numberOfRoutes)
+        configuration_form.setTabOrder(self.numberOfRoutes, self.serviceAreaLimitType)
+        configuration_form.setTabOrder(self.serviceAreaLimitType, self.serviceAreaLimit)
+        configuration_form.setTabOrder(self.serviceAreaLimit, self.facilityLayer)
+        configuration_form.setTabOrder(self.facilityLayer, self.batchOutputFile)
+        configuration_form.setTabOrder(self.batchOutputFile, self.topologyTolerance)
         configuration_form.setTabOrder(self.topologyTolerance, self.toleranceUnits)
         configuration_form.setTabOrder(self.toleranceUnits, self.bridgingPointToolColor)
         configuration_form.setTabOrder(self.bridgingPointToolColor, self.bridgingPointToolSize)
@@ -717,7 +828,11 @@ class Ui_configuration_form(object):
         configuration_form.setTabOrder(self.spliceLoss, self.spliceFrequency)
         configuration_form.setTabOrder(self.spliceFrequency, self.cableLoss)
         configuration_form.setTabOrder(self.cableLoss, self.fixedLoss)
-        configuration_form.setTabOrder(self.fixedLoss, self.featureLimitExtent)
+        configuration_form.setTabOrder(self.fixedLoss, self.minimumLossRouting)
+        configuration_form.setTabOrder(self.minimumLossRouting, self.attenuationField)
+        configuration_form.setTabOrder(self.attenuationField, self.spliceFlagField)
+        configuration_form.setTabOrder(self.spliceFlagField, self.countSplices)
+        configuration_form.setTabOrder(self.countSplices, self.featureLimitExtent)
         configuration_form.setTabOrder(self.featureLimitExtent, self.maxNumFeaturesPerLayer)
         configuration_form.setTabOrder(self.maxNumFeaturesPerLayer, self.defaultsButton)
         configuration_form.setTabOrder(self.defaultsButton, self.tabWidget)
@@ -740,6 +855,7 @@ class Ui_configuration_form(object):
         self.label_39.setText(_translate("configuration_form", "Line width"))
         self.label_38.setText(_translate("configuration_form", "Line style"))
         self.flexjLineToolShowTotalDistance.setText(_translate("configuration_form", "Show total distance"))
+        self.flexjLineToolShowNetworkDistance.setText(_translate("configuration_form", "Show network distance"))
         self.flexjLineToolShowDistance.setText(_translate("configuration_form", "Show distance"))
         self.flexjLineToolAngleCorrection.setText(_translate("configuration_form", "Angle correction"))
         self.groupBox_12.setTitle(_translate("configuration_form", "Snapping"))
@@ -771,6 +887,17 @@ class Ui_configuration_form(object):
         self.bridgingPointToolAskBeforeDelete.setText(_translate("configuration_form", "Ask before deleting on-the-fly bridging points"))
         self.groupBox_15.setTitle(_translate("configuration_form", "Entry and Exit"))
         self.includeStartStop.setText(_translate("configuration_form", "Include entry/exit lengths"))
+        self.groupBox_16.setTitle(_translate("configuration_form", "Waypoints"))
+        self.groupBox_17.setTitle(_translate("configuration_form", "Calculation"))
+        self.label_54.setText(_translate("configuration_form", "Mode"))
+        self.diversePairNodeDisjoint.setText(_translate("configuration_form", "Diverse pair without common junctions"))
+        self.label_55.setText(_translate("configuration_form", "Number of alternative routes"))
+        self.label_56.setText(_translate("configuration_form", "Service area limit"))
+        self.label_57.setText(_translate("configuration_form", "Limit (distance units or db)"))
+        self.label_58.setText(_translate("configuration_form", "Facility layer"))
+        self.label_59.setText(_translate("configuration_form", "Batch output file (.gpkg or .csv)"))
+        self.waypointsFromSelectedPoints.setText(_translate("configuration_form", "Use the selected points of the active layer"))
+        self.optimizeWaypointOrder.setText(_translate("configuration_form", "Optimize the order of the middle waypoints"))
         self.label_50.setText(_translate("configuration_form", "Length limit warning (meters)"))
         self.groupBox_6.setTitle(_translate("configuration_form", "Ellipsoid"))
         self.selectProjectCrs.setText(_translate("configuration_form", "Project CRS"))
@@ -794,6 +921,11 @@ class Ui_configuration_form(object):
         self.label_5.setText(_translate("configuration_form", "Length decimal digits"))
         self.addResultLayer.setText(_translate("configuration_form", "Add result layer to map"))
         self.addMergedLayer.setText(_translate("configuration_form", "Add analysis layer to map"))
+        self.addFeatureReport.setText(_translate("configuration_form", "Add a table of the traversed features to the result layer"))
+        self.label_53.setText(_translate("configuration_form", "Report fields"))
+        self.label_60.setText(_translate("configuration_form", "Result layer file (.gpkg)"))
+        self.resultLayerFile.setToolTip(_translate("configuration_form", "GeoPackage to which the measurements are appended. Empty for a temporary layer"))
+        self.reportFields.setToolTip(_translate("configuration_form", "Fields of the line layers copied to the table of the traversed features, separated by commas"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.networkTab), _translate("configuration_form", "Network analysis"))
         self.label_8.setText(_translate("configuration_form", "Connector loss"))
         self.label_9.setText(_translate("configuration_form", "db"))
@@ -807,6 +939,10 @@ class Ui_configuration_form(object):
         self.label_16.setText(_translate("configuration_form", "db/Km"))
         self.label_18.setText(_translate("configuration_form", "Fixed loss"))
         self.label_19.setText(_translate("configuration_form", "db"))
+        self.minimumLossRouting.setText(_translate("configuration_form", "Route by minimum fiber loss"))
+        self.label_51.setText(_translate("configuration_form", "Attenuation field (db/Km)"))
+        self.label_52.setText(_translate("configuration_form", "Splice flag field"))
+        self.countSplices.setText(_translate("configuration_form", "Count a splice at every change of feature along the path"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.fiberTab), _translate("configuration_form", "Fiber loss budget"))
         self.label_46.setText(_translate("configuration_form", "Maximum number of features per layer"))
         self.label_47.setText(_translate("configuration_form", "Limit geographical extent"))
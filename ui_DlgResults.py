@@ -16,14 +16,14 @@ class Ui_resultDialog(object):
     def setupUi(self, resultDialog):
         resultDialog.setObjectName("resultDialog")
         resultDialog.setWindowModality(QtCore.Qt.ApplicationModal)
-        resultDialog.resize(300, 170)
+        resultDialog.resize(300, 190)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
         sizePolicy.setHeightForWidth(resultDialog.sizePolicy().hasHeightForWidth())
         resultDialog.setSizePolicy(sizePolicy)
-        resultDialog.setMinimumSize(QtCore.QSize(300, 170))
-        resultDialog.setMaximumSize(QtCore.QSize(300, 170))
+        resultDialog.setMinimumSize(QtCore.QSize(300, 190))
+        resultDialog.setMaximumSize(QtCore.QSize(300, 190))
         resultDialog.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
         resultDialog.setModal(True)
         self.OkButton = QtWidgets.QPushButton(resultDialog)
@@ -152,6 +152,28 @@ class Ui_resultDialog(object):
         self.fiberLossUnitsExit.setGeometry(QtCore.QRect(270, 47, 16, 16))
         self.fiberLossUnitsExit.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
         self.fiberLossUnitsExit.setObjectName("fiberLossUnitsExit")
+        self.performanceButton = QtWidgets.QToolButton(resultDialog)
+        self.performanceButton.setGeometry(QtCore.QRect(4, 164, 100, 20))
+        self.performanceButton.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.performanceButton.setCheckable(True)
+        self.performanceButton.setToolButtonStyle(QtCore.Qt.ToolButtonTextBesideIcon)
+        self.performanceButton.setAutoRaise(True)
+        self.performanceButton.setArrowType(QtCore.Qt.RightArrow)
+        self.performanceButton.setObjectName("performanceButton")
+        self.performanceTxt = QtWidgets.QPlainTextEdit(resultDialog)
+        self.performanceTxt.setGeometry(QtCore.QRect(4, 188, 292, 120))
+        font = QtGui.QFont()
+        font.setFamily("Courier New")
+        font.setPointSize(8)
+        self.performanceTxt.setFont(font)
+        self.performanceTxt.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.performanceTxt.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.performanceTxt.setReadOnly(True)
+        self.performanceTxt.setObjectName("performanceTxt")
+        self.exportPerformanceButton = QtWidgets.QPushButton(resultDialog)
+        self.exportPerformanceButton.setGeometry(QtCore.QRect(216, 312, 80, 23))
+        self.exportPerformanceButton.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.exportPerformanceButton.setObjectName("exportPerformanceButton")
 
         self.retranslateUi(resultDialog)
         QtCore.QMetaObject.connectSlotsByName(resultDialog)
@@ -163,6 +185,9 @@ class Ui_resultDialog(object):
         resultDialog.setTabOrder(self.lossEntryTxt, self.lossOnGraphTxt)
         resultDialog.setTabOrder(self.lossOnGraphTxt, self.lossExitTxt)
         resultDialog.setTabOrder(self.lossExitTxt, self.lossTotalTxt)
+        resultDialog.setTabOrder(self.lossTotalTxt, self.performanceButton)
+        resultDialog.setTabOrder(self.performanceButton, self.performanceTxt)
+        resultDialog.setTabOrder(self.performanceTxt, self.exportPerformanceButton)
 
     def retranslateUi(self, resultDialog):
         _translate = QtCore.QCoreApplication.translate
@@ -182,6 +207,8 @@ class Ui_resultDialog(object):
         self.label_6.setText(_translate("resultDialog", "CRS:"))
         self.crsTxt.setText(_translate("resultDialog", "TextLabel"))
         self.errorTxt.setText(_translate("resultDialog", "Message"))
+        self.performanceButton.setText(_translate("resultDialog", "Performance"))
+        self.exportPerformanceButton.setText(_translate("resultDialog", "Export JSON"))
         self.fiberLossUnitsEntry.setText(_translate("resultDialog", "db"))
         self.fiberLossUnitsOnGraph.setText(_translate("resultDialog", "db"))
         self.fiberLossUnitsExit.setText(_translate("resultDialog", "db"))
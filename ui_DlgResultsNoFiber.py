@@ -16,14 +16,14 @@ class Ui_resultDialogNoFiber(object):
     def setupUi(self, resultDialog):
         resultDialog.setObjectName("resultDialog")
         resultDialog.setWindowModality(QtCore.Qt.ApplicationModal)
-        resultDialog.resize(230, 170)
+        resultDialog.resize(230, 190)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
         sizePolicy.setHeightForWidth(resultDialog.sizePolicy().hasHeightForWidth())
         resultDialog.setSizePolicy(sizePolicy)
-        resultDialog.setMinimumSize(QtCore.QSize(230, 170))
-        resultDialog.setMaximumSize(QtCore.QSize(230, 170))
+        resultDialog.setMinimumSize(QtCore.QSize(230, 190))
+        resultDialog.setMaximumSize(QtCore.QSize(230, 190))
         resultDialog.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
         resultDialog.setModal(True)
         self.OkButton = QtWidgets.QPushButton(resultDialog)
@@ -112,6 +112,28 @@ class Ui_resultDialogNoFiber(object):
         self.errorTxt.setGeometry(QtCore.QRect(114, 120, 109, 39))
         self.errorTxt.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
         self.errorTxt.setObjectName("errorTxt")
+        self.performanceButton = QtWidgets.QToolButton(resultDialog)
+        self.performanceButton.setGeometry(QtCore.QRect(4, 164, 100, 20))
+        self.performanceButton.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.performanceButton.setCheckable(True)
+        self.performanceButton.setToolButtonStyle(QtCore.Qt.ToolButtonTextBesideIcon)
+        self.performanceButton.setAutoRaise(True)
+        self.performanceButton.setArrowType(QtCore.Qt.RightArrow)
+        self.performanceButton.setObjectName("performanceButton")
+        self.performanceTxt = QtWidgets.QPlainTextEdit(resultDialog)
+        self.performanceTxt.setGeometry(QtCore.QRect(4, 188, 222, 120))
+        font = QtGui.QFont()
+        font.setFamily("Courier New")
+        font.setPointSize(8)
+        self.performanceTxt.setFont(font)
+        self.performanceTxt.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.performanceTxt.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.performanceTxt.setReadOnly(True)
+        self.performanceTxt.setObjectName("performanceTxt")
+        self.exportPerformanceButton = QtWidgets.QPushButton(resultDialog)
+        self.exportPerformanceButton.setGeometry(QtCore.QRect(146, 312, 80, 23))
+        self.exportPerformanceButton.setLocale(QtCore.QLocale(QtCore.QLocale.C, QtCore.QLocale.AnyCountry))
+        self.exportPerformanceButton.setObjectName("exportPerformanceButton")
 
         self.retranslateUi(resultDialog)
         QtCore.QMetaObject.connectSlotsByName(resultDialog)
@@ -119,6 +141,9 @@ class Ui_resultDialogNoFiber(object):
         resultDialog.setTabOrder(self.entryCostTxt, self.costOnGraphTxt)
         resultDialog.setTabOrder(self.costOnGraphTxt, self.exitCostTxt)
         resultDialog.setTabOrder(self.exitCostTxt, self.totalCostTxt)
+        resultDialog.setTabOrder(self.totalCostTxt, self.performanceButton)
+        resultDialog.setTabOrder(self.performanceButton, self.performanceTxt)
+        resultDialog.setTabOrder(self.performanceTxt, self.exportPerformanceButton)
 
     def retranslateUi(self, resultDialog):
         _translate = QtCore.QCoreApplication.translate
@@ -137,6 +162,8 @@ class Ui_resultDialogNoFiber(object):
         self.label_6.setText(_translate("resultDialog", "CRS:"))
         self.crsTxt.setText(_translate("resultDialog", "TextLabel"))
         self.errorTxt.setText(_translate("resultDialog", "Message"))
+        self.performanceButton.setText(_translate("resultDialog", "Performance"))
+        self.exportPerformanceButton.setText(_translate("resultDialog", "Export JSON"))
 
 
 if __name__ == "__main__":
@@ -21,8 +21,11 @@ __date__ = 'March 2024'
 __copyright__ = '(C) 2024, Ilias Iliopoulos'
 
 from qgis.gui import QgsMapToolEmitPoint, QgsVertexMarker, QgsSnapIndicator
-from qgis.core import QgsPointXY, QgsPointLocator, QgsProject, QgsTolerance, QgsVectorLayer
+from qgis.core import QgsPointLocator, QgsPointXY, QgsProject, QgsVectorLayer
 from qgis.PyQt.QtGui import QColor
+from qgis.PyQt.QtCore import QTimer
+from qgis.PyQt.QtWidgets import QToolTip
+from .snappingIndex import SnappingIndexCache
 
 ''' 
 Provides snapping functionality to QgsMapToolEmitPoint.
@@ -36,7 +39,7 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
     # For snapping, option to use the QGIS snapping tool or own snapping tool or both
     SNAPPING_PROVIDER_OWN = 0
     SNAPPING_PROVIDER_QGIS = 1
-    SNAPPING_PROVIDER_BOTH = 2 # In both case, show only the tooltip of the QGIS snapper
+    SNAPPING_PROVIDER_BOTH = 2 # In both case, the QGIS snapper runs only where the own snapper finds no match
     defaultSnappingProvider = SNAPPING_PROVIDER_BOTH    
 
     # snapping behaviour
@@ -51,6 +54,7 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
     MARKER_DOES_NOT_SNAP = 0
     MARKER_SNAPS_TO_VERTICES = 1
     MARKER_SNAPS_TO_SEGMENT_EDGES = 2
+    MARKER_SNAPS_TO_NETWORK_JUNCTIONS = 3 # vertices of the graph of the network analysis, see setJunctionIndex()
 
     defaultSnappingMethod = MARKER_SNAPS_TO_VERTICES = 1
     
@@ -67,10 +71,18 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
     markerFillColor = QColor(255, 255, 255, 0) # Not user modifiable
     markerPenWidth = 2 # Not user modifiable
     
-    # A list containing tuples (layer, locator)
-    layersLocators = []
+    # Minimum interval in milliseconds between two snapping queries. Mouse move events arriving in between are coalesced
+    moveEventInterval = 16 # about one frame at 60 Hz
+
+    # Text of the tooltip shown while the snapping index is built in the background
+    indexingToolTip = "indexing\u2026"
+    # Text of the tooltip of a match on a network junction
+    junctionToolTip = "Network junction"
          
     activeLayer = None    
+
+    # The snapping indexes of all the tools. Tools snapping to the same layers share one index
+    snappingIndexes = SnappingIndexCache()
      
     def __init__(self, canvas, iface, 
                  snappingBehaviour = defaultSnappingBehaviour,
@@ -88,6 +100,8 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
         self.marker = self.createMarker()        
         if snappingMethod == self.MARKER_SNAPS_TO_SEGMENT_EDGES:
             self.marker.setIconType(QgsVertexMarker.ICON_CIRCLE)    
+        elif snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+            self.marker.setIconType(QgsVertexMarker.ICON_X)
         self.snapToMatchedPoint = snapToMatchedPoint
         self.snappingMethod = snappingMethod
         self.proximityTolerancePixels = tolerancePixels
@@ -100,10 +114,27 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
         self.markerIsVisible = False
         self.snappedPoint = None
         self.snappedLayers = []
+        # The SharedSnappingIndex over all the layers to snap, from snappingIndexes
+        self.sharedIndex = None
+        # The index of the network junctions, used instead of sharedIndex when snapping to network junctions
+        self.junctionIndex = None
+        # (index, index version, position, candidates) of the last query of the own snapping index, see snappingCandidates()
+        self.snappingArea = None
+        self.indexingToolTipIsVisible = False
+        # Snapping tolerance in project units. Computed once per canvas scale change, see updateTolerance()
+        self.tolerance = None
+        # Coalescing of mouse move events
+        self.pendingMovePos = None
+        self.moveTimer = QTimer()
+        self.moveTimer.setSingleShot(True)
+        self.moveTimer.setInterval(self.moveEventInterval)
+        self.moveTimer.timeout.connect(self.processPendingMove)
         # To handle snap to all map layers upon initiation
         
         self.updateLayersLocators()
         self.setToolName(self.mapToolName)
+        self.canvas.scaleChanged.connect(self.invalidateTolerance)
+        self.canvas.destinationCrsChanged.connect(self.invalidateTolerance)
         
         self.snapIndicator = QgsSnapIndicator(canvas)
         # Reads the current settings of the snapping parameters
@@ -126,12 +157,15 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
         self.snappingMethod = snappingMethod
         if self.snappingMethod == self.MARKER_SNAPS_TO_SEGMENT_EDGES:
             self.marker.setIconType(QgsVertexMarker.ICON_CIRCLE)
+        elif self.snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+            self.marker.setIconType(QgsVertexMarker.ICON_X)
         else:
             self.marker.setIconType(QgsVertexMarker.ICON_BOX)
         self.proximityTolerancePixels = tolerancePixels
         self.showToolTip = showToolTip
         self.snappingBehaviour = snappingBehaviour
         self.snappingProvider = snappingProvider
+        self.invalidateTolerance()
         
         self.updateLayersLocators()       
         return
@@ -153,10 +187,13 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
     def updateLayersLocators(self) -> None:
         ''' 
         Updates the list of  layers at the current moment and 
-        assigns a locator to each layer
+        uses the snapping index over all of them, shared with the other tools snapping to the same layers.
+        A new index is built in the background, first for the visible extent of the map canvas 
+        and then for the entire layers, so that the first mouse move does not block the canvas
         ''' 
-        # No need to create locators if snapping is not wanted
-        if self.snappingMethod == self.MARKER_DOES_NOT_SNAP:
+        # No need for an index if snapping is not wanted, or if the index of the network junctions is used
+        if self.snappingMethod == self.MARKER_DOES_NOT_SNAP or self.snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+            self.releaseSnappingIndex()
             return
 
         if self.snappingBehaviour == self.BEHAVIOUR_SHOW_VERTICES_OF_ACTIVE_LAYER:        
@@ -172,71 +209,149 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
             layers = QgsProject.instance().mapLayers().values()            
 
         #print ("updateLayersLocators", layers)
-        self.layersLocators.clear()
-        for layer in layers:
-            if isinstance(layer, QgsVectorLayer):
-                # CRS MUST be the projects CRS to work with all behaviours
-                locator = QgsPointLocator(layer, QgsProject.instance().crs(), QgsProject.instance().transformContext())
-                self.layersLocators.append((layer, locator))
-
+        layers = [layer for layer in layers if isinstance(layer, QgsVectorLayer)]
+        if len(layers) == 0:
+            self.releaseSnappingIndex()
+            return
+        # The extent is in the destination CRS, i.e. the project CRS
+        self.sharedIndex = self.snappingIndexes.acquire(self, layers, QgsProject.instance().crs(), 
+                                                        QgsProject.instance().transformContext(), self.canvas.extent())
         return            
 
+
+    def releaseSnappingIndex(self) -> None:
+        self.snappingIndexes.release(self)
+        self.sharedIndex = None
+        return
+
+
+    def isIndexing(self) -> bool:
+        ''' Returns True while there is no index ready for the current layers '''
+        if self.snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+            return False
+        return self.sharedIndex is not None and self.sharedIndex.isIndexing()
+
+
+    def setJunctionIndex(self, junctionIndex) -> None:
+        ''' 
+        Sets the index of the network junctions, an object with the same nearest() method as SnappingIndex,
+        e.g. a NetworkGraph. Set to None when the graph is not valid any more
+        '''
+        self.junctionIndex = junctionIndex
+        return
+
+
+    def activeSnappingIndex(self):
+        if self.snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+            return self.junctionIndex
+        if self.sharedIndex is None:
+            return None
+        return self.sharedIndex.index
+
+
+    def invalidateTolerance(self) -> None:
+        self.tolerance = None
+        self.snappingArea = None
+        return
+
+
+    def updateTolerance(self) -> float:
+        ''' Converts the tolerance from pixels to project units. The value changes only with the canvas scale or CRS '''
+        self.tolerance = self.proximityTolerancePixels * self.canvas.mapSettings().mapUnitsPerPixel()
+        return self.tolerance
+
+
+    def showIndexingToolTip(self, pos, isIndexing:bool) -> None:
+        ''' Shows a tooltip at the cursor while the indexes are being built, so that missing matches are not silent '''
+        if isIndexing == True:
+            QToolTip.showText(self.canvas.mapToGlobal(pos), self.indexingToolTip, self.canvas)
+            self.indexingToolTipIsVisible = True
+        elif self.indexingToolTipIsVisible == True:
+            QToolTip.hideText()
+            self.indexingToolTipIsVisible = False
+        return
+
     
     def canvasMoveEvent(self, event):
+        ''' 
+        Coalesces the mouse move events. The first event of a frame is handled immediately. The events arriving
+        during the rest of the frame only update the pending cursor position, which is snapped when the frame ends
+        '''
+        self.pendingMovePos = event.pos()
+        if not self.moveTimer.isActive():
+            self.processPendingMove()
+        return
+
+
+    def canvasPressEvent(self, event):
+        ''' Snaps the pending cursor position first, so that a click right after a move does not use the point of the previous frame '''
+        self.processPendingMove()
+        super().canvasPressEvent(event)
+        return
+
+
+    def canvasReleaseEvent(self, event):
+        self.processPendingMove()
+        super().canvasReleaseEvent(event)
+        return
+
+
+    def processPendingMove(self) -> None:
+        if self.pendingMovePos is None:
+            return
+        pos = self.pendingMovePos
+        self.pendingMovePos = None
+        self.snapAtPosition(pos)
+        self.snappedMoveEvent(pos)
+        # Throttle: another position will not be snapped before the end of this frame
+        self.moveTimer.start()
+        return
+
+
+    def snappedMoveEvent(self, pos) -> None:
+        ''' Called after the latest cursor position has been snapped. Subclasses override this instead of canvasMoveEvent() '''
+        return
+
+
+    def snapAtPosition(self, pos) -> None:
     
         QGIS_snappedPoint = None
         OWN_snappedPoint = None
-    
-        if self.snappingProvider == self.SNAPPING_PROVIDER_BOTH or self.snappingProvider == self.SNAPPING_PROVIDER_QGIS:   
-        # Using the QGIS snapping tool. 
-            snapMatch = self.snapper.snapToMap(event.pos())
-            self.snapIndicator.setMatch(snapMatch) 
-            if self.snapIndicator.match().type():
-                QGIS_snappedPoint = self.snapIndicator.match().point()
-            else:
-                QGIS_snappedPoint = None
-                       
-        if self.snappingProvider == self.SNAPPING_PROVIDER_BOTH or self.snappingProvider == self.SNAPPING_PROVIDER_OWN:        
-        
+
+        if self.snappingProvider == self.SNAPPING_PROVIDER_OWN and self.snappingMethod == self.MARKER_DOES_NOT_SNAP:
             # No need to do anything if snapping is not wanted
-            if self.snappingMethod == 0:
-                return  
+            return
+                       
+        if (self.snappingProvider == self.SNAPPING_PROVIDER_BOTH or self.snappingProvider == self.SNAPPING_PROVIDER_OWN) and self.snappingMethod != self.MARKER_DOES_NOT_SNAP:        
           
-            mouse_point = self.toMapCoordinates(event.pos())       
+            mouse_point = self.toMapCoordinates(pos)       
             layerNamesList = []  
             matchFound = False        
-            # Search layer by layer using the layer locator
-            # Get the coordinates of the first match and continue for the rest of the layers, only to get the layers name to show in the tooltip
-            for layer_locator in self.layersLocators: 
-                
-                self.activeLayer = layer_locator[0]
-                # set tolerance in pixels
-                tolerance =  QgsTolerance.toleranceInProjectUnits(self.proximityTolerancePixels, self.activeLayer, self.iface.mapCanvas().mapSettings(), QgsTolerance.Pixels)
-        
-                # Takes a lot of time (2-3 seconds) to check for a match when it runs for the first time in heavy projects and layers.
-                # It is quicker at next iteration but to make things feel better the first time, I used the relaxed=True
-                if self.snappingMethod == self.MARKER_SNAPS_TO_VERTICES:
-                    match = layer_locator[1].nearestVertex(mouse_point, tolerance, relaxed = True)
-                elif self.snappingMethod == self.MARKER_SNAPS_TO_SEGMENT_EDGES: 
-                    match = layer_locator[1].nearestEdge(mouse_point, tolerance, relaxed = True)
-                else: 
-                    match = layer_locator[1].nearestVertex(mouse_point, tolerance, relaxed = True)
-        
-                if match.isValid():             
-                    if matchFound == False:
-                        # for the first valid match
-                        matchFound = True
-                        edgePoint = match.point()
-                        self.marker.setCenter(edgePoint)
-                        #print(f"Nearest matched point in layer {self.activeLayer.name()} within tolerance {tolerance}: {edgePoint.x()}, {edgePoint.y()}")
-                        
-                    # for all layer matches                    
-                    layerNamesList.append(self.activeLayer.name())        
-                
+            self.showIndexingToolTip(pos, self.isIndexing())
+            if self.tolerance is None:
+                self.updateTolerance()
+
+            # One query for all layers. It returns the matched point and all the layers touching it, for the tooltip
+            index = self.activeSnappingIndex()
+            if index is not None:
+                if self.snappingMethod == self.MARKER_SNAPS_TO_NETWORK_JUNCTIONS:
+                    (edgePoint, matchedLayers) = index.nearest(mouse_point, self.tolerance, self.snappingMethod)
+                else:
+                    candidates = self.snappingCandidates(index, mouse_point)
+                    (edgePoint, matchedLayers) = index.nearestCandidate(candidates, mouse_point, self.tolerance, self.snappingMethod)
+                if edgePoint is not None:
+                    matchFound = True
+                    self.marker.setCenter(edgePoint)
+                    if len(matchedLayers) > 0:
+                        self.activeLayer = matchedLayers[0]
+                        layerNamesList = [layer.name() for layer in matchedLayers]
+                    else:
+                        layerNamesList = [self.junctionToolTip]
         
             if matchFound == True:
                 OWN_snappedPoint = edgePoint
-                if self.showToolTip == True and self.snappingProvider == self.SNAPPING_PROVIDER_OWN: # Is there a way to disable the tooltip of the QGIS snapping tool in BOTH case? QgsSnappingConfig does not provide such option!
+                # In the BOTH case, the QGIS snapper does not run and does not show its tooltip where the own snapper finds a match
+                if self.showToolTip == True:
                     self.marker.setToolTip(",".join(layerNamesList))
                 self.marker.show()
                 self.markerIsVisible = True 
@@ -246,6 +361,18 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
                     self.markerIsVisible = False
                     OWN_snappedPoint = None                
 
+        if self.snappingProvider == self.SNAPPING_PROVIDER_QGIS or (self.snappingProvider == self.SNAPPING_PROVIDER_BOTH and OWN_snappedPoint is None):   
+        # Using the QGIS snapping tool. In the BOTH case, only when the own tool has not found a match, since the own point is preferred
+            snapMatch = self.snapper.snapToMap(pos)
+            self.snapIndicator.setMatch(snapMatch) 
+            if self.snapIndicator.match().type():
+                QGIS_snappedPoint = self.snapIndicator.match().point()
+            else:
+                QGIS_snappedPoint = None
+        elif self.snappingProvider == self.SNAPPING_PROVIDER_BOTH:
+            # Remove any previous indicator of the QGIS snapping tool
+            self.snapIndicator.setMatch(QgsPointLocator.Match())
+
         # External code can make use of self.whatevertool.snappedPoint
         # If it is None, snapping has not taken place, else it contains the coordinates of the snapped point
         # The method conditionalOffsetToSnappedPoint() keeps this internally.
@@ -279,6 +406,20 @@ class MapToolSnapToLayers(QgsMapToolEmitPoint):
         return        
 
 
+    def snappingCandidates(self, index, point:QgsPointXY) -> list:
+        ''' 
+        Returns the candidates of the own snapping index around the point. The index is queried again only when the point leaves 
+        the tolerance of the position of the last query, or the index or the tolerance change. The candidates are within twice 
+        the tolerance of that position, so that they contain every match within the tolerance of the point and the nearest one is exact
+        '''
+        area = self.snappingArea
+        if area is None or area[0] is not index or area[1] != index.version or point.sqrDist(area[2]) > self.tolerance * self.tolerance:
+            area = (index, index.version, point, index.candidates(point, 2 * self.tolerance, self.snappingMethod))
+            # An index that is not ready has no candidates yet
+            self.snappingArea = area if index.isReady else None
+        return area[3]
+
+
     def conditionalOffsetToSnappedPoint(self, mousePoint:QgsPointXY) -> QgsPointXY:
         if self.snapToMatchedPoint == 0:
             # Explicit casting to QgsPointXY required to run on Linux
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+***************************************************************************
+    waypointOrder.py
+    ---------------------
+
+    Date                 : March 2024
+    Copyright            : (C) 2024 by Ilias Iliopoulos
+    Email                : info at fryktoria dot com
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 3 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+__author__ = 'Ilias Iliopoulos'
+__date__ = 'March 2024'
+__copyright__ = '(C) 2024, Ilias Iliopoulos'
+
+
+import math
+
+'''
+Finds the order of visit of the middle waypoints that gives the minimum total cost, 
+with the start and the end point kept in place. The input is a matrix of the network costs 
+between every pair of waypoints. Small sets are solved exactly with dynamic programming (Held-Karp),
+larger sets start from the nearest neighbour order and are improved with 2-opt.
+'''
+
+class WaypointOrder:
+
+    # Up to this number of middle waypoints, the order is solved exactly. The cost grows with 2^n * n^2
+    maxExactWaypoints = 10
+
+    def __init__(self, costMatrix:list):
+        ''' costMatrix[i][j] is the cost from waypoint i to waypoint j, or math.inf if there is no path. Waypoint 0 is the start and the last one is the end '''
+        self.cost = costMatrix
+        self.n = len(costMatrix)
+        return
+
+
+    def optimalOrder(self) -> list:
+        ''' Returns the order of visit as a list of indexes of the cost matrix, starting with 0 and ending with n-1 '''
+        if self.n <= 3:
+            return list(range(self.n))
+        if self.n - 2 <= self.maxExactWaypoints:
+            return self.exactOrder()
+        return self.twoOptOrder(self.nearestNeighbourOrder())
+
+
+    def routeCost(self, order:list) -> float:
+        return sum(self.cost[order[i]][order[i + 1]] for i in range(len(order) - 1))
+
+
+    def exactOrder(self) -> list:
+        ''' Held-Karp dynamic programming on the subsets of the middle waypoints '''
+        m = self.n - 2
+        end = self.n - 1
+        full = (1 << m) - 1
+        # best[mask][k] is the minimum cost from the start, visiting the middle waypoints of mask and ending at middle waypoint k
+        best = [[math.inf] * m for _ in range(1 << m)]
+        parent = [[-1] * m for _ in range(1 << m)]
+        for k in range(m):
+            best[1 << k][k] = self.cost[0][k + 1]
+
+        for mask in range(1, full + 1):
+            for k in range(m):
+                if not (mask >> k) & 1 or best[mask][k] == math.inf:
+                    continue
+                for nextK in range(m):
+                    if (mask >> nextK) & 1:
+                        continue
+                    nextMask = mask | (1 << nextK)
+                    candidate = best[mask][k] + self.cost[k + 1][nextK + 1]
+                    if candidate < best[nextMask][nextK]:
+                        best[nextMask][nextK] = candidate
+                        parent[nextMask][nextK] = k
+
+        lastK = min(range(m), key = lambda k: best[full][k] + self.cost[k + 1][end])
+        if best[full][lastK] + self.cost[lastK + 1][end] == math.inf:
+            # There is no order that connects all waypoints. Keep the order of the user
+            return list(range(self.n))
+
+        order = []
+        mask = full
+        k = lastK
+        while k != -1:
+            order.insert(0, k + 1)
+            previousK = parent[mask][k]
+            mask = mask & ~(1 << k)
+            k = previousK
+        return [0] + order + [end]
+
+
+    def nearestNeighbourOrder(self) -> list:
+        ''' Starting from the start point, visits every time the nearest waypoint not visited yet '''
+        unvisited = set(range(1, self.n - 1))
+        order = [0]
+        while len(unvisited) > 0:
+            current = order[-1]
+            nearest = min(unvisited, key = lambda k: (self.cost[current][k], k))
+            order.append(nearest)
+            unvisited.remove(nearest)
+        order.append(self.n - 1)
+        return order
+
+
+    def twoOptOrder(self, order:list) -> list:
+        ''' Reverses sections of the route for as long as this reduces the total cost. The start and end are not moved '''
+        order = list(order)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, len(order) - 2):
+                for j in range(i + 1, len(order) - 1):
+                    # Compare only the part of the route that changes. Costs may not be symmetric, so the reversed section is summed again
+                    section = order[i - 1:j + 2]
+                    reversedSection = [section[0]] + section[-2:0:-1] + [section[-1]]
+                    if self.routeCost(reversedSection) < self.routeCost(section):
+                        order[i:j + 1] = reversed(order[i:j + 1])
+                        improved = True
+        return order